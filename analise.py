@@ -0,0 +1,301 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Intervalo mínimo entre verificações de dados novos (por worker)
+ANALISE_INTERVALO = float(os.environ.get('VIVANTS_ANALISE_INTERVALO', 5))
+# Idade máxima do snapshot antes de uma recarga completa de segurança
+ANALISE_RECARGA = float(os.environ.get('VIVANTS_ANALISE_RECARGA', 3600))
+
+STATUS_EXCLUIDOS = ('cancelado',)
+PERIODOS = ('dia', 'semana', 'mes')
+
+# Filtros sobre a tabela pedidos (alias p) usados na carga completa e na incremental
+_TODOS = ''
+_DEPOIS_DA_MARCA = 'WHERE (p.data_pedido, p.id) > (?, ?)'
+
+
+def _ler(db, query, params=()):
+    # Cursor sem row_factory: tuplas simples, sem conversão de datas linha a linha
+    cursor = db.cursor()
+    cursor.row_factory = None
+    return cursor.execute(query, params).fetchall()
+
+
+def _codificar_status(status_nomes, serie):
+    """Converte a série de status em códigos int16, estendendo a lista de nomes"""
+    status_nomes = list(status_nomes)
+    codigos = {nome: i for i, nome in enumerate(status_nomes)}
+    for nome in serie.unique():
+        if nome not in codigos:
+            codigos[nome] = len(status_nomes)
+            status_nomes.append(nome)
+    return status_nomes, serie.map(codigos).to_numpy(np.int16)
+
+
+class SnapshotVendas:
+    """Cópia colunar (arrays NumPy) de pedidos e itens_pedido, mantida em memória.
+
+    A carga completa acontece uma vez; depois, atualizar() busca só os pedidos
+    com (data_pedido, id) acima da marca d'água. Mudanças de status/total em
+    pedidos antigos são detectadas comparando os totais por status com a
+    tabela materializada vendas_status; exclusões disparam recarga completa.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dados = None
+        self._marca = None
+        self._verificado_em = 0.0
+        self._carregado_em = 0.0
+        self._stats = {'cargas': 0, 'incrementos': 0, 'resincronizacoes': 0}
+
+    # -----------------------
+    # Carga e atualização
+    # -----------------------
+    def _consultar(self, db, filtro, params):
+        pedidos = pd.DataFrame(
+            _ler(db, f'''
+                SELECT p.id, p.usuario_id, p.data_pedido, COALESCE(p.status, 'pendente'), p.total
+                FROM pedidos p {filtro}
+            ''', params),
+            columns=['id', 'usuario_id', 'data_pedido', 'status', 'total'],
+        )
+        itens = pd.DataFrame(
+            _ler(db, f'''
+                SELECT i.pedido_id, i.produto_id, i.quantidade, i.quantidade * i.preco_unitario
+                FROM itens_pedido i
+                JOIN pedidos p ON p.id = i.pedido_id {filtro}
+            ''', params),
+            columns=['pedido_id', 'produto_id', 'quantidade', 'receita'],
+        )
+        return pedidos, itens
+
+    def _montar(self, pedidos, itens, base=None):
+        """Converte os DataFrames em arrays, anexando ao snapshot `base` se houver"""
+        status_nomes, status = _codificar_status(base['status_nomes'] if base else [], pedidos['status'])
+        novos = {
+            'ids': pedidos['id'].to_numpy(np.int64),
+            'usuarios': pedidos['usuario_id'].to_numpy(np.int64),
+            'datas': pd.to_datetime(pedidos['data_pedido'], format='ISO8601', errors='coerce')
+                       .to_numpy('datetime64[s]'),
+            'status': status,
+            'totais': pedidos['total'].to_numpy(np.float64),
+        }
+        if base:
+            novos = {chave: np.concatenate([base[chave], valores]) for chave, valores in novos.items()}
+
+        posicoes = pd.Index(novos['ids']).get_indexer(itens['pedido_id'].to_numpy(np.int64))
+        novos_itens = {
+            'posicoes': posicoes.astype(np.int64),
+            'produtos': itens['produto_id'].to_numpy(np.int64),
+            'quantidades': itens['quantidade'].to_numpy(np.int64),
+            'receitas': itens['receita'].to_numpy(np.float64),
+        }
+        if base:
+            novos_itens = {chave: np.concatenate([base[chave], valores]) for chave, valores in novos_itens.items()}
+
+        return {**novos, **novos_itens, 'status_nomes': status_nomes}
+
+    def _marca_de(self, pedidos):
+        if pedidos.empty:
+            return self._marca
+        ultimo = pedidos.sort_values(['data_pedido', 'id']).iloc[-1]
+        return ultimo['data_pedido'], int(ultimo['id'])
+
+    def _categorias(self, db):
+        produtos = _ler(db, 'SELECT id, COALESCE(categoria_id, 0) FROM produtos')
+        maior = max((pid for pid, _ in produtos), default=0)
+        mapa = np.zeros(maior + 1, dtype=np.int64)
+        if produtos:
+            ids, categorias = np.array(produtos, dtype=np.int64).T
+            mapa[ids] = categorias
+        return mapa
+
+    def _carregar(self, db):
+        pedidos, itens = self._consultar(db, _TODOS, ())
+        dados = self._montar(pedidos, itens)
+        self._dados = dados
+        self._marca = self._marca_de(pedidos) or ('', 0)
+        self._carregado_em = time.monotonic()
+        self._stats['cargas'] += 1
+        logger.info('Snapshot de vendas carregado: %d pedido(s), %d item(ns)',
+                    len(dados['ids']), len(dados['posicoes']))
+
+    def _por_status(self, dados):
+        n = len(dados['status_nomes'])
+        contagens = np.bincount(dados['status'], minlength=n)
+        totais = np.bincount(dados['status'], weights=dados['totais'], minlength=n)
+        return {nome: (int(contagens[i]), float(totais[i]))
+                for i, nome in enumerate(dados['status_nomes']) if contagens[i]}
+
+    def _confere(self, db, dados):
+        """Compara os totais por status do snapshot com vendas_status"""
+        esperado = {status: (pedidos, total) for status, pedidos, total in _ler(
+            db, 'SELECT status, pedidos, total FROM vendas_status WHERE pedidos != 0'
+        )}
+        atual = self._por_status(dados)
+        return atual.keys() == esperado.keys() and all(
+            atual[s][0] == esperado[s][0] and abs(atual[s][1] - esperado[s][1]) < 0.01 for s in atual
+        )
+
+    def _resincronizar(self, db):
+        """Relê status e total de todos os pedidos; recarrega tudo se houve exclusões"""
+        self._stats['resincronizacoes'] += 1
+        linhas = pd.DataFrame(
+            _ler(db, "SELECT id, COALESCE(status, 'pendente'), total FROM pedidos"),
+            columns=['id', 'status', 'total'],
+        )
+        dados = self._dados
+        if len(linhas) != len(dados['ids']):
+            self._carregar(db)
+            return
+        posicoes = pd.Index(dados['ids']).get_indexer(linhas['id'].to_numpy(np.int64))
+        if (posicoes < 0).any():
+            self._carregar(db)
+            return
+
+        status_nomes, codigos = _codificar_status(dados['status_nomes'], linhas['status'])
+        status = dados['status'].copy()
+        totais = dados['totais'].copy()
+        status[posicoes] = codigos
+        totais[posicoes] = linhas['total'].to_numpy(np.float64)
+        self._dados = {**dados, 'status': status, 'totais': totais, 'status_nomes': status_nomes}
+
+    def atualizar(self, db, forcar=False):
+        """Incorpora os pedidos novos (no máximo a cada ANALISE_INTERVALO segundos)"""
+        agora = time.monotonic()
+        if not forcar and self._dados is not None and agora - self._verificado_em < ANALISE_INTERVALO:
+            return
+        with self._lock:
+            if not forcar and self._dados is not None and agora - self._verificado_em < ANALISE_INTERVALO:
+                return
+            if forcar or self._dados is None or agora - self._carregado_em >= ANALISE_RECARGA:
+                self._carregar(db)
+            else:
+                pedidos, itens = self._consultar(db, _DEPOIS_DA_MARCA, self._marca)
+                if not pedidos.empty:
+                    self._dados = self._montar(pedidos, itens, base=self._dados)
+                    self._marca = self._marca_de(pedidos)
+                    self._stats['incrementos'] += 1
+                if not self._confere(db, self._dados):
+                    self._resincronizar(db)
+            # Mapa produto -> categoria é pequeno: relido a cada verificação
+            self._dados = {**self._dados, 'categorias': self._categorias(db)}
+            self._verificado_em = time.monotonic()
+
+    # -----------------------
+    # Consultas vetorizadas
+    # -----------------------
+    def _filtro(self, dados, dias):
+        """Máscara dos pedidos válidos (não cancelados) dentro da janela de `dias`"""
+        excluidos = [i for i, nome in enumerate(dados['status_nomes']) if nome in STATUS_EXCLUIDOS]
+        mascara = ~np.isin(dados['status'], excluidos)
+        if dias:
+            inicio = np.datetime64('now', 's') - np.timedelta64(int(dias), 'D')
+            mascara &= dados['datas'] >= inicio
+        return mascara
+
+    def receita_por_periodo(self, periodo='dia', dias=90):
+        dados = self._dados
+        mascara = self._filtro(dados, dias) & ~np.isnat(dados['datas'])
+        datas = dados['datas'][mascara]
+        if periodo == 'mes':
+            chaves = datas.astype('datetime64[M]').astype('datetime64[D]')
+        elif periodo == 'semana':
+            # Semanas começando na segunda-feira (1970-01-05 foi uma segunda)
+            dias_epoch = datas.astype('datetime64[D]').astype(np.int64)
+            chaves = (dias_epoch - (dias_epoch - 4) % 7).astype('datetime64[D]')
+        else:
+            chaves = datas.astype('datetime64[D]')
+
+        periodos, inverso = np.unique(chaves, return_inverse=True)
+        receitas = np.bincount(inverso, weights=dados['totais'][mascara], minlength=len(periodos))
+        pedidos = np.bincount(inverso, minlength=len(periodos))
+        return [
+            {'periodo': str(p), 'receita': round(float(r), 2), 'pedidos': int(n)}
+            for p, r, n in zip(periodos, receitas, pedidos)
+        ]
+
+    def _itens_validos(self, dados, dias):
+        mascara = self._filtro(dados, dias)
+        posicoes = dados['posicoes']
+        return (posicoes >= 0) & mascara[np.clip(posicoes, 0, None)]
+
+    def top_produtos(self, limite=10, dias=90):
+        """Retorna [(produto_id, quantidade, receita)] dos produtos com maior receita"""
+        dados = self._dados
+        validos = self._itens_validos(dados, dias)
+        produtos = dados['produtos'][validos]
+        if not len(produtos):
+            return []
+        receitas = np.bincount(produtos, weights=dados['receitas'][validos])
+        quantidades = np.bincount(produtos, weights=dados['quantidades'][validos])
+        limite = min(limite, np.count_nonzero(quantidades))
+        topo = np.argpartition(-receitas, limite - 1)[:limite] if limite else np.array([], dtype=np.int64)
+        topo = topo[np.argsort(-receitas[topo])]
+        return [(int(p), int(quantidades[p]), round(float(receitas[p]), 2)) for p in topo]
+
+    def mix_categorias(self, dias=90):
+        """Retorna [(categoria_id, quantidade, receita, participacao)] por receita decrescente"""
+        dados = self._dados
+        validos = self._itens_validos(dados, dias)
+        produtos = dados['produtos'][validos]
+        mapa = dados['categorias']
+        # Produtos excluídos (fora do mapa) contam como "sem categoria" (0)
+        categorias = np.zeros_like(produtos)
+        conhecidos = produtos < len(mapa)
+        categorias[conhecidos] = mapa[produtos[conhecidos]]
+        receitas = np.bincount(categorias, weights=dados['receitas'][validos])
+        quantidades = np.bincount(categorias, weights=dados['quantidades'][validos])
+        total = receitas.sum()
+        ordem = np.argsort(-receitas)
+        return [
+            (int(c), int(quantidades[c]), round(float(receitas[c]), 2),
+             round(float(receitas[c] / total), 4) if total else 0.0)
+            for c in ordem if quantidades[c]
+        ]
+
+    def resumo(self, dias=90):
+        dados = self._dados
+        mascara = self._filtro(dados, dias)
+        pedidos = int(mascara.sum())
+        receita = float(dados['totais'][mascara].sum())
+        _, compras = np.unique(dados['usuarios'][mascara], return_counts=True)
+        clientes = len(compras)
+        recorrentes = int((compras > 1).sum())
+        return {
+            'dias': dias,
+            'pedidos': pedidos,
+            'receita': round(receita, 2),
+            'ticket_medio': round(receita / pedidos, 2) if pedidos else 0.0,
+            'clientes': clientes,
+            'clientes_recorrentes': recorrentes,
+            'taxa_recompra': round(recorrentes / clientes, 4) if clientes else 0.0,
+        }
+
+    def estatisticas(self):
+        dados = self._dados
+        stats = dict(self._stats)
+        stats['pedidos'] = len(dados['ids']) if dados else 0
+        stats['itens'] = len(dados['posicoes']) if dados else 0
+        stats['marca'] = list(self._marca) if self._marca else None
+        return stats
+
+
+def nomes_por_id(db, tabela, ids):
+    """{id: nome} de produtos ou categorias, para rotular os resultados"""
+    ids = [i for i in ids if i]
+    if not ids:
+        return {}
+    marcadores = ', '.join('?' * len(ids))
+    return dict(_ler(db, f'SELECT id, nome FROM {tabela} WHERE id IN ({marcadores})', ids))
+
+
+snapshot_vendas = SnapshotVendas()
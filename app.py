@@ -1,19 +1,64 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from flask import (
+    Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file,
+    Response, stream_with_context
+)
 from werkzeug.security import generate_password_hash, check_password_hash
-from database import get_db, init_db
-from decorators import login_required, admin_required
+from database import (
+    get_db, get_pool, init_db, init_app, migrar_db, pool_stats, converter_data, transacao_escrita
+)
+from decorators import login_required, admin_required, cache_pagina
+from analise import snapshot_vendas, nomes_por_id, PERIODOS
+from ativos import init_app as init_ativos, carregar_ativos, limpar_builds_antigos
+from avaliacoes import (
+    registrar_avaliacao, recalcular_resumos, regravar_resumos, resumo_produto, AvaliacaoDuplicada,
+    COLUNAS_RESUMO, AVALIACOES_POR_PAGINA
+)
+from busca import paginar_busca, autocompletar, destacar
+from cache import cache_catalogo, invalidar_catalogo, cache_stats
+from carrinho import (
+    adicionar_item, itens_visitante, gravar_visitante, mesclar_carrinho, ler_carrinho_visitante
+)
+from checkout import finalizar_compra, CarrinhoVazio, EstoqueInsuficiente
+from imagens import (
+    armazenar_imagem, processar_em_segundo_plano, liberar_imagem, limpar_orfas, e_imutavel,
+    variantes_imagem
+)
+from estatisticas import (
+    resumo_dashboard, vendas_por_dia, vendas_por_categoria, reconstruir_estatisticas, verificar_estatisticas
+)
+from manutencao import purgar_pedidos_cancelados, purgar_produtos_inativos, LOTE_PADRAO
+from paginacao import (
+    paginar, contar, invalidar_contagens, tamanho_pagina, url_pagina
+)
+from relacionados import produtos_relacionados as relacionados_do_produto, atualizar_relacionados
+from sessoes import init_app as init_sessoes
 from datetime import datetime
+import logging
 import sqlite3
+import click
 import os
 from werkzeug.utils import secure_filename
 from relatorios import (
     gerar_excel_produtos, gerar_excel_pedidos, gerar_excel_clientes,
     gerar_pdf_produtos, gerar_pdf_pedidos, gerar_pdf_clientes,
-    listar_relatorios, RELATORIOS_DIR
+    listar_relatorios, exportar_csv, exportar_ndjson, CONSULTAS_EXPORTACAO, CONSULTAS_RELATORIO,
+    RELATORIOS_DIR
 )
+from tarefas import (
+    init_app as init_tarefas, agendar_relacionados, enfileirar_relatorio, obter_tarefa, listar_tarefas
+)
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = 'sua_chave_secreta_aqui_mude_em_producao'
+init_app(app)
+# Tarefas que ficaram pendentes/executando de um processo que caiu viram erro
+init_tarefas(app)
+# Ativos estáticos com hash no nome (static/build/manifest.json)
+init_ativos(app)
+# Sessão no servidor: o cookie leva só um id opaco (VIVANTS_SESSOES=cookie volta ao padrão)
+armazenamento_sessoes = init_sessoes(app)
 
 # Configurações de upload
 UPLOAD_FOLDER = 'static/uploads/produtos'
@@ -41,66 +86,41 @@ def save_product_image(file):
         if file_length > MAX_FILE_SIZE:
             return None, "Arquivo muito grande. Tamanho máximo: 5MB"
 
-        # Criar nome seguro para o arquivo
-        filename = secure_filename(file.filename)
-        # Adicionar timestamp para evitar conflitos
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_")
-        filename = timestamp + filename
-
-        # Caminho completo do arquivo
-        filepath = os.path.join(app.root_path, UPLOAD_FOLDER, filename)
-
+        # Nome pelo hash do conteúdo: o mesmo arquivo enviado de novo reaproveita
+        # o blob (e as variantes) em vez de gerar uma cópia
+        extensao = file.filename.rsplit('.', 1)[1].lower().replace('jpeg', 'jpg')
         try:
-            file.save(filepath)
-            # Retornar URL relativa (sem 'app.root_path')
-            return f'/{UPLOAD_FOLDER}/{filename}', None
+            url, nova = armazenar_imagem(file.read(), extensao, UPLOAD_FOLDER)
         except Exception as e:
             return None, f"Erro ao salvar arquivo: {str(e)}"
 
+        # Variantes redimensionadas geradas fora da requisição; ao terminar,
+        # as páginas em cache passam a usar o srcset
+        if nova or variantes_imagem(url) is None:
+            try:
+                processar_em_segundo_plano(url).add_done_callback(lambda _: invalidar_catalogo())
+            except Exception as e:
+                logger.error(f"Erro ao agendar o processamento da imagem: {str(e)}")
+        # Retornar URL relativa (sem 'app.root_path')
+        return url, None
+
     return None, "Nenhum arquivo selecionado"
 
-# Funções auxiliares para converter Row para dicionário e processar datas
+# Funções auxiliares para linhas e datas. As linhas já chegam como Registro
+# (database.registro_factory), com as colunas de data convertidas uma única vez.
 def parse_datetime(date_string):
     """Tenta converter string para datetime object"""
     if date_string is None:
         return None
-    if isinstance(date_string, datetime):
-        return date_string
-    try:
-        # Tenta vários formatos comuns do SQLite
-        formats = [
-            '%Y-%m-%d %H:%M:%S',
-            '%Y-%m-%d %H:%M:%S.%f',
-            '%Y-%m-%d',
-            '%d/%m/%Y %H:%M:%S',
-            '%d/%m/%Y'
-        ]
-        for fmt in formats:
-            try:
-                return datetime.strptime(date_string, fmt)
-            except ValueError:
-                continue
-        return date_string  # Retorna como string se não conseguir converter
-    except:
-        return date_string
+    return converter_data(date_string)
 
 def row_to_dict(row):
-    """Converte uma linha SQLite Row para dicionário"""
-    if row is None:
-        return None
-    result = {}
-    for key in row.keys():
-        value = row[key]
-        # Converte campos de data se possível
-        if 'data' in key.lower() or 'cadastro' in key.lower() or 'pedido' in key.lower() or 'avaliacao' in key.lower():
-            result[key] = parse_datetime(value)
-        else:
-            result[key] = value
-    return result
+    """Mantido por compatibilidade: o Registro já tem interface de dicionário"""
+    return row
 
 def rows_to_dict_list(rows):
-    """Converte uma lista de linhas SQLite Row para lista de dicionários"""
-    return [row_to_dict(row) for row in rows]
+    """Converte o resultado de fetchall() em lista de Registros"""
+    return list(rows)
 
 def format_date(value, format='%d/%m/%Y %H:%M'):
     """Função para formatar datas nos templates"""
@@ -115,27 +135,51 @@ def format_date(value, format='%d/%m/%Y %H:%M'):
         return value.strftime(format)
     return str(value)
 
+def catalogo_alterado():
+    """Invalida contagens e caches do catálogo após escritas do admin"""
+    invalidar_contagens('produtos:')
+    invalidar_catalogo()
+
+def listar_categorias_ativas(db):
+    """Categorias ativas (cache de leitura, invalidado pelo admin)"""
+    return cache_catalogo.obter(
+        'categorias:ativas',
+        lambda: db.execute('SELECT * FROM categorias WHERE ativo = 1').fetchall()
+    )
+
 # Adicionar a função de formatação ao Jinja2
 app.jinja_env.filters['format_date'] = format_date
+app.jinja_env.filters['destacar'] = destacar
+app.jinja_env.globals['url_pagina'] = url_pagina
+app.jinja_env.globals['variantes_imagem'] = variantes_imagem
+
+# Imagens endereçadas por conteúdo nunca mudam na mesma URL: cache de um ano
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+
+@app.after_request
+def cache_imagens_imutaveis(response):
+    if request.path.startswith(f'/{UPLOAD_FOLDER}/') and response.status_code in (200, 304) \
+            and e_imutavel(request.path):
+        response.headers['Cache-Control'] = CACHE_IMUTAVEL
+    return response
 
 # ==================== ROTAS PÚBLICAS ====================
 
 @app.route('/')
+@cache_pagina
 def index():
     db = get_db()
     try:
-        produtos_data = db.execute('''
+        produtos_data = cache_catalogo.obter('produtos:destaque', lambda: db.execute('''
             SELECT * FROM produtos
             WHERE ativo = 1 AND destaque = 1
             LIMIT 6
-        ''').fetchall()
+        ''').fetchall())
         produtos = rows_to_dict_list(produtos_data)
         return render_template('home.html', produtos=produtos)
     except sqlite3.Error as e:
         flash('Erro ao carregar produtos', 'danger')
         return render_template('home.html', produtos=[])
-    finally:
-        db.close()
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -157,6 +201,10 @@ def login():
                 session['user_type'] = usuario['tipo']
                 flash('Login realizado com sucesso!', 'success')
 
+                # Carrinho montado como visitante vai para a conta num único lote
+                if mesclar_carrinho(db, session, usuario['id']):
+                    return redirect(url_for('carrinho'))
+
                 if usuario['tipo'] == 'admin':
                     return redirect(url_for('admin_dashboard'))
                 return redirect(url_for('index'))
@@ -164,8 +212,6 @@ def login():
                 flash('Email ou senha inválidos', 'danger')
         except sqlite3.Error:
             flash('Erro no servidor. Tente novamente.', 'danger')
-        finally:
-            db.close()
 
     return render_template('auth/login.html')
 
@@ -194,17 +240,16 @@ def cadastro():
                 flash('Email já cadastrado', 'danger')
                 return render_template('auth/register.html')
 
-            db.execute('''
-                INSERT INTO usuarios (nome, email, senha, telefone, tipo, data_cadastro)
-                VALUES (?, ?, ?, ?, ?, datetime('now'))
-            ''', (nome, email, generate_password_hash(senha), telefone, 'cliente'))
-            db.commit()
+            with transacao_escrita(db):
+                db.execute('''
+                    INSERT INTO usuarios (nome, email, senha, telefone, tipo, data_cadastro)
+                    VALUES (?, ?, ?, ?, ?, datetime('now'))
+                ''', (nome, email, generate_password_hash(senha), telefone, 'cliente'))
+            invalidar_contagens('clientes:')
             flash('Cadastro realizado com sucesso! Faça login para continuar.', 'success')
             return redirect(url_for('login'))
         except sqlite3.Error as e:
             flash('Erro ao realizar cadastro. Tente novamente.', 'danger')
-        finally:
-            db.close()
 
     return render_template('auth/register.html')
 
@@ -215,54 +260,80 @@ def logout():
     return redirect(url_for('index'))
 
 @app.route('/produtos')
+@cache_pagina
 def produtos_lista():
     categoria_id = request.args.get('categoria')
     busca = request.args.get('busca', '').strip()
 
     db = get_db()
     try:
-        query = '''
-            SELECT p.*, c.nome as categoria_nome
-            FROM produtos p
-            LEFT JOIN categorias c ON p.categoria_id = c.id
-            WHERE p.ativo = 1
-        '''
-        params = []
-
-        if categoria_id and categoria_id.isdigit():
-            query += ' AND p.categoria_id = ?'
-            params.append(int(categoria_id))
-        elif busca:
-            query += ' AND (p.nome LIKE ? OR p.descricao LIKE ?)'
-            params.extend([f'%{busca}%', f'%{busca}%'])
-
-        query += ' ORDER BY p.data_cadastro DESC'
-
-        produtos_data = db.execute(query, params).fetchall()
-        produtos = rows_to_dict_list(produtos_data)
-
-        categorias_data = db.execute('SELECT * FROM categorias WHERE ativo = 1').fetchall()
-        categorias = rows_to_dict_list(categorias_data)
+        if busca and not (categoria_id and categoria_id.isdigit()):
+            # Busca textual via FTS5, ordenada por relevância e paginada por (relevância, id)
+            pagina = paginar_busca(db, busca,
+                                   cursor=request.args.get('cursor'), direcao=request.args.get('dir'),
+                                   por_pagina=tamanho_pagina(request.args.get('por_pagina')))
+        else:
+            where = ['p.ativo = 1']
+            params = []
+            chave_contagem = 'produtos:ativos'
+
+            if categoria_id and categoria_id.isdigit():
+                where.append('p.categoria_id = ?')
+                params.append(int(categoria_id))
+                chave_contagem += f':categoria:{categoria_id}'
+
+            pagina = paginar(db, f'''
+                SELECT p.*, c.nome as categoria_nome, {COLUNAS_RESUMO}
+                FROM produtos p
+                LEFT JOIN categorias c ON p.categoria_id = c.id
+                LEFT JOIN avaliacoes_resumo r ON r.produto_id = p.id
+            ''', ordem=('p.data_cadastro', 'p.id'), chaves=('data_cadastro', 'id'),
+                where=where, params=params,
+                cursor=request.args.get('cursor'), direcao=request.args.get('dir'),
+                por_pagina=tamanho_pagina(request.args.get('por_pagina')))
+            pagina.total = contar(db, chave_contagem,
+                                  'SELECT COUNT(*) FROM produtos p WHERE ' + ' AND '.join(where), params)
+        produtos = rows_to_dict_list(pagina.itens)
+
+        categorias = rows_to_dict_list(listar_categorias_ativas(db))
 
         return render_template('products/produtos_lista.html',
                              produtos=produtos,
+                             pagina=pagina,
                              categorias=categorias,
                              categoria_selecionada=categoria_id,
                              busca=busca)
     except sqlite3.Error:
         flash('Erro ao carregar produtos', 'danger')
-        return render_template('products/list.html', produtos=[], categorias=[])
-    finally:
-        db.close()
+        return render_template('products/produtos_lista.html', produtos=[], pagina=None, categorias=[],
+                               categoria_selecionada=categoria_id, busca=busca)
+
+@app.route('/api/produtos/autocomplete')
+def produtos_autocomplete():
+    """Sugestões de produtos para o campo de busca (JSON)"""
+    termo = request.args.get('q', '').strip()
+    if len(termo) < 2:
+        return jsonify([])
+
+    db = get_db()
+    try:
+        sugestoes = autocompletar(db, termo)
+        for sugestao in sugestoes:
+            sugestao['url'] = url_for('produto_detalhe', id=sugestao['id'])
+        return jsonify(sugestoes)
+    except sqlite3.Error:
+        return jsonify([]), 500
 
 @app.route('/produto/<int:id>')
+@cache_pagina
 def produto_detalhe(id):
     db = get_db()
     try:
-        produto_data = db.execute('''
-            SELECT p.*, c.nome as categoria_nome
+        produto_data = db.execute(f'''
+            SELECT p.*, c.nome as categoria_nome, {COLUNAS_RESUMO}
             FROM produtos p
             LEFT JOIN categorias c ON p.categoria_id = c.id
+            LEFT JOIN avaliacoes_resumo r ON r.produto_id = p.id
             WHERE p.id = ? AND p.ativo = 1
         ''', (id,)).fetchone()
 
@@ -272,33 +343,31 @@ def produto_detalhe(id):
 
         produto = row_to_dict(produto_data)
 
-        avaliacoes_data = db.execute('''
+        # Resumo materializado + avaliações paginadas (as mais recentes primeiro)
+        resumo_avaliacoes = resumo_produto(db, id)
+        pagina_avaliacoes = paginar(db, '''
             SELECT a.*, u.nome as usuario_nome
             FROM avaliacoes a
             JOIN usuarios u ON a.usuario_id = u.id
-            WHERE a.produto_id = ?
-            ORDER BY a.data_avaliacao DESC
-        ''', (id,)).fetchall()
-        avaliacoes = rows_to_dict_list(avaliacoes_data)
+        ''', ordem=('a.data_avaliacao', 'a.id'), chaves=('data_avaliacao', 'id'),
+            where=['a.produto_id = ?'], params=[id],
+            cursor=request.args.get('cursor'), direcao=request.args.get('dir'),
+            por_pagina=AVALIACOES_POR_PAGINA)
+        pagina_avaliacoes.total = resumo_avaliacoes['total']
+        avaliacoes = rows_to_dict_list(pagina_avaliacoes.itens)
 
-        # Produtos relacionados (mesma categoria)
-        produtos_relacionados_data = db.execute('''
-            SELECT id, nome, preco, preco_promocional, imagem
-            FROM produtos
-            WHERE categoria_id = ? AND id != ? AND ativo = 1
-            LIMIT 4
-        ''', (produto['categoria_id'], id)).fetchall()
-        produtos_relacionados = rows_to_dict_list(produtos_relacionados_data)
+        # Produtos comprados juntos (índice em memória), completados pela categoria
+        produtos_relacionados = rows_to_dict_list(relacionados_do_produto(db, produto))
 
         return render_template('products/detail.html',
                             produto=produto,
                             avaliacoes=avaliacoes,
+                            pagina_avaliacoes=pagina_avaliacoes,
+                            resumo_avaliacoes=resumo_avaliacoes,
                             produtos_relacionados=produtos_relacionados)
     except sqlite3.Error:
         flash('Erro ao carregar produto', 'danger')
         return redirect(url_for('produtos_lista'))
-    finally:
-        db.close()
 
 @app.route('/produto/<int:id>/avaliar', methods=['POST'])
 @login_required
@@ -323,26 +392,18 @@ def avaliar_produto(id):
         produto = db.execute('SELECT id FROM produtos WHERE id = ? AND ativo = 1', (id,)).fetchone()
         if not produto:
             flash('Produto não encontrado', 'warning')
-            db.close()
             return redirect(url_for('produtos_lista'))
 
-        # Verificar se usuário já avaliou este produto
-        avaliacao_existente = db.execute('''
-            SELECT id FROM avaliacoes
-            WHERE produto_id = ? AND usuario_id = ?
-        ''', (id, session['user_id'])).fetchone()
-
-        if avaliacao_existente:
+        # Grava a avaliação e atualiza o resumo (média/histograma) do produto
+        try:
+            registrar_avaliacao(db, id, session['user_id'], nota, comentario)
+        except AvaliacaoDuplicada:
             flash('Você já avaliou este produto', 'warning')
         else:
-            db.execute('''
-                INSERT INTO avaliacoes (produto_id, usuario_id, nota, comentario, data_avaliacao)
-                VALUES (?, ?, ?, ?, datetime('now'))
-            ''', (id, session['user_id'], nota, comentario))
-            db.commit()
+            # A página do produto e as listagens em cache exibem as avaliações
+            invalidar_catalogo()
             flash('Avaliação enviada com sucesso!', 'success')
 
-        db.close()
         return redirect(url_for('produto_detalhe', id=id))
 
     except ValueError:
@@ -355,10 +416,15 @@ def avaliar_produto(id):
 # ==================== ROTAS AUTENTICADAS ====================
 
 @app.route('/carrinho')
-@login_required
 def carrinho():
     db = get_db()
     try:
+        if 'user_id' not in session:
+            # Visitante: carrinho na sessão, sem escrita no banco
+            itens = ler_carrinho_visitante(db, session)
+            total = sum(item['subtotal'] for item in itens)
+            return render_template('cart/cart.html', itens=itens, total=total)
+
         itens_data = db.execute('''
             SELECT c.*, p.nome, p.preco, p.preco_promocional, p.imagem, p.estoque,
                    (COALESCE(p.preco_promocional, p.preco) * c.quantidade) as subtotal
@@ -373,11 +439,8 @@ def carrinho():
     except sqlite3.Error:
         flash('Erro ao carregar carrinho', 'danger')
         return render_template('cart/cart.html', itens=[], total=0)
-    finally:
-        db.close()
 
 @app.route('/adicionar-carrinho/<int:produto_id>', methods=['POST'])
-@login_required
 def adicionar_carrinho(produto_id):
     try:
         quantidade = int(request.form.get('quantidade', 1))
@@ -396,51 +459,36 @@ def adicionar_carrinho(produto_id):
 
         if not produto:
             flash('Produto não encontrado', 'warning')
-            db.close()
             return redirect(url_for('produtos_lista'))
 
         if produto['estoque'] < quantidade:
             flash(f'Estoque insuficiente. Disponível: {produto["estoque"]}', 'warning')
-            db.close()
             return redirect(url_for('produto_detalhe', id=produto_id))
 
-        # Verificar item existente no carrinho
-        item_existente = db.execute('''
-            SELECT id, quantidade FROM carrinho
-            WHERE usuario_id = ? AND produto_id = ?
-        ''', (session['user_id'], produto_id)).fetchone()
-
-        if item_existente:
-            nova_quantidade = item_existente['quantidade'] + quantidade
-            if nova_quantidade > produto['estoque']:
-                flash(f'Quantidade excede estoque disponível. Disponível: {produto["estoque"]}', 'warning')
-                db.close()
-                return redirect(url_for('produto_detalhe', id=produto_id))
-
-            db.execute('''
-                UPDATE carrinho SET quantidade = ?
-                WHERE id = ?
-            ''', (nova_quantidade, item_existente['id']))
+        if 'user_id' in session:
+            # INSERT ... ON CONFLICT DO UPDATE com a checagem de estoque no próprio comando
+            adicionado = adicionar_item(db, session['user_id'], produto_id, quantidade)
         else:
-            db.execute('''
-                INSERT INTO carrinho (usuario_id, produto_id, quantidade)
-                VALUES (?, ?, ?)
-            ''', (session['user_id'], produto_id, quantidade))
+            itens = itens_visitante(session)
+            adicionado = itens.get(produto_id, 0) + quantidade <= produto['estoque']
+            if adicionado:
+                itens[produto_id] = itens.get(produto_id, 0) + quantidade
+                gravar_visitante(session, itens)
+
+        if not adicionado:
+            flash(f'Quantidade excede estoque disponível. Disponível: {produto["estoque"]}', 'warning')
+            return redirect(url_for('produto_detalhe', id=produto_id))
 
-        db.commit()
         flash('Produto adicionado ao carrinho!', 'success')
 
     except ValueError:
         flash('Quantidade inválida', 'danger')
     except sqlite3.Error:
         flash('Erro ao adicionar produto ao carrinho', 'danger')
-    finally:
-        db.close()
 
     return redirect(url_for('carrinho'))
 
 @app.route('/atualizar-carrinho/<int:item_id>', methods=['POST'])
-@login_required
 def atualizar_carrinho(item_id):
     try:
         quantidade = int(request.form.get('quantidade', 1))
@@ -450,6 +498,21 @@ def atualizar_carrinho(item_id):
 
         db = get_db()
 
+        if 'user_id' not in session:
+            # Visitante: item_id é o id do produto no carrinho da sessão
+            itens = itens_visitante(session)
+            produto = db.execute('SELECT nome, estoque FROM produtos WHERE id = ? AND ativo = 1',
+                                 (item_id,)).fetchone()
+            if item_id not in itens or not produto:
+                flash('Item não encontrado', 'warning')
+            elif quantidade > produto['estoque']:
+                flash(f'Estoque insuficiente para {produto["nome"]}. Disponível: {produto["estoque"]}', 'warning')
+            else:
+                itens[item_id] = quantidade
+                gravar_visitante(session, itens)
+                flash('Carrinho atualizado!', 'success')
+            return redirect(url_for('carrinho'))
+
         # Verificar estoque
         item = db.execute('''
             SELECT c.produto_id, p.estoque, p.nome
@@ -460,40 +523,44 @@ def atualizar_carrinho(item_id):
 
         if not item:
             flash('Item não encontrado', 'warning')
-            db.close()
             return redirect(url_for('carrinho'))
 
         if quantidade > item['estoque']:
             flash(f'Estoque insuficiente para {item["nome"]}. Disponível: {item["estoque"]}', 'warning')
-            db.close()
             return redirect(url_for('carrinho'))
 
-        db.execute('''
-            UPDATE carrinho SET quantidade = ?
-            WHERE id = ? AND usuario_id = ?
-        ''', (quantidade, item_id, session['user_id']))
-        db.commit()
+        with transacao_escrita(db):
+            db.execute('''
+                UPDATE carrinho SET quantidade = ?
+                WHERE id = ? AND usuario_id = ?
+            ''', (quantidade, item_id, session['user_id']))
         flash('Carrinho atualizado!', 'success')
 
     except ValueError:
         flash('Quantidade inválida', 'danger')
     except sqlite3.Error:
         flash('Erro ao atualizar carrinho', 'danger')
-    finally:
-        db.close()
 
     return redirect(url_for('carrinho'))
 
 @app.route('/remover-carrinho/<int:item_id>', methods=['POST'])
-@login_required
 def remover_carrinho(item_id):
+    if 'user_id' not in session:
+        itens = itens_visitante(session)
+        if itens.pop(item_id, None) is not None:
+            gravar_visitante(session, itens)
+            flash('Item removido do carrinho', 'info')
+        else:
+            flash('Item não encontrado', 'warning')
+        return redirect(url_for('carrinho'))
+
     db = get_db()
     try:
-        result = db.execute('''
-            DELETE FROM carrinho
-            WHERE id = ? AND usuario_id = ?
-        ''', (item_id, session['user_id']))
-        db.commit()
+        with transacao_escrita(db):
+            result = db.execute('''
+                DELETE FROM carrinho
+                WHERE id = ? AND usuario_id = ?
+            ''', (item_id, session['user_id']))
 
         if result.rowcount > 0:
             flash('Item removido do carrinho', 'info')
@@ -501,11 +568,16 @@ def remover_carrinho(item_id):
             flash('Item não encontrado', 'warning')
     except sqlite3.Error:
         flash('Erro ao remover item', 'danger')
-    finally:
-        db.close()
 
     return redirect(url_for('carrinho'))
 
+def agendar_atualizacao_relacionados(db):
+    """Agenda o índice de comprados juntos; uma falha aqui não afeta o pedido"""
+    try:
+        agendar_relacionados(db)
+    except Exception as e:
+        logger.error(f"Erro ao agendar a atualização dos relacionados: {str(e)}")
+
 @app.route('/finalizar-pedido', methods=['GET', 'POST'])
 @login_required
 def finalizar_pedido():
@@ -518,68 +590,22 @@ def finalizar_pedido():
 
         db = get_db()
         try:
-            # Buscar itens do carrinho com verificação de estoque
-            itens_data = db.execute('''
-                SELECT c.*, p.preco, p.preco_promocional, p.estoque, p.nome
-                FROM carrinho c
-                JOIN produtos p ON c.produto_id = p.id
-                WHERE c.usuario_id = ?
-            ''', (session['user_id'],)).fetchall()
-            itens = rows_to_dict_list(itens_data)
-
-            if not itens:
-                flash('Carrinho vazio', 'warning')
-                return redirect(url_for('carrinho'))
-
-            # Verificar estoque antes de processar
-            for item in itens:
-                if item['quantidade'] > item['estoque']:
-                    flash(f'Estoque insuficiente para {item["nome"]}. Disponível: {item["estoque"]}', 'warning')
-                    return redirect(url_for('carrinho'))
-
-            # Calcular total
-            total = sum(
-                (item['preco_promocional'] if item['preco_promocional'] else item['preco']) * item['quantidade']
-                for item in itens
-            )
-
-            # Criar pedido
-            cursor = db.execute('''
-                INSERT INTO pedidos (usuario_id, total, endereco_entrega, status, data_pedido)
-                VALUES (?, ?, ?, ?, datetime('now'))
-            ''', (session['user_id'], total, endereco, 'pendente'))
-
-            pedido_id = cursor.lastrowid
-
-            # Adicionar itens do pedido e atualizar estoque
-            for item in itens:
-                preco = item['preco_promocional'] if item['preco_promocional'] else item['preco']
-
-                db.execute('''
-                    INSERT INTO itens_pedido (pedido_id, produto_id, quantidade, preco_unitario)
-                    VALUES (?, ?, ?, ?)
-                ''', (pedido_id, item['produto_id'], item['quantidade'], preco))
-
-                # Atualizar estoque
-                db.execute('''
-                    UPDATE produtos
-                    SET estoque = estoque - ?
-                    WHERE id = ?
-                ''', (item['quantidade'], item['produto_id']))
-
-            # Limpar carrinho
-            db.execute('DELETE FROM carrinho WHERE usuario_id = ?', (session['user_id'],))
-            db.commit()
-
+            finalizar_compra(db, session['user_id'], endereco)
+            invalidar_contagens('pedidos:')
+            agendar_atualizacao_relacionados(db)
             flash('Pedido realizado com sucesso!', 'success')
             return redirect(url_for('meus_pedidos'))
 
+        except CarrinhoVazio:
+            flash('Carrinho vazio', 'warning')
+            return redirect(url_for('carrinho'))
+        except EstoqueInsuficiente as e:
+            for conflito in e.conflitos:
+                flash(f'Estoque insuficiente para {conflito["nome"]}. Disponível: {conflito["disponivel"]}', 'warning')
+            return redirect(url_for('carrinho'))
         except sqlite3.Error:
-            db.rollback()
             flash('Erro ao processar pedido. Tente novamente.', 'danger')
             return redirect(url_for('carrinho'))
-        finally:
-            db.close()
 
     return render_template('cart/checkout.html')
 
@@ -588,18 +614,18 @@ def finalizar_pedido():
 def meus_pedidos():
     db = get_db()
     try:
-        pedidos_data = db.execute('''
-            SELECT * FROM pedidos
-            WHERE usuario_id = ?
-            ORDER BY data_pedido DESC
-        ''', (session['user_id'],)).fetchall()
-        pedidos = rows_to_dict_list(pedidos_data)
-        return render_template('orders/list.html', pedidos=pedidos)
+        pagina = paginar(db, 'SELECT * FROM pedidos',
+                         ordem=('data_pedido', 'id'), chaves=('data_pedido', 'id'),
+                         where=['usuario_id = ?'], params=[session['user_id']],
+                         cursor=request.args.get('cursor'), direcao=request.args.get('dir'),
+                         por_pagina=tamanho_pagina(request.args.get('por_pagina')))
+        pagina.total = contar(db, f"pedidos:usuario:{session['user_id']}",
+                              'SELECT COUNT(*) FROM pedidos WHERE usuario_id = ?', (session['user_id'],))
+        pedidos = rows_to_dict_list(pagina.itens)
+        return render_template('orders/list.html', pedidos=pedidos, pagina=pagina)
     except sqlite3.Error:
         flash('Erro ao carregar pedidos', 'danger')
-        return render_template('orders/list.html', pedidos=[])
-    finally:
-        db.close()
+        return render_template('orders/list.html', pedidos=[], pagina=None)
 
 @app.route('/pedido/<int:id>')
 @login_required
@@ -629,8 +655,6 @@ def pedido_detalhes(id):
     except sqlite3.Error:
         flash('Erro ao carregar pedido', 'danger')
         return redirect(url_for('meus_pedidos'))
-    finally:
-        db.close()
 
 # ==================== ROTAS ADMIN ====================
 
@@ -639,16 +663,8 @@ def pedido_detalhes(id):
 def admin_dashboard():
     db = get_db()
     try:
-        # Estatísticas
-        stats_data = db.execute('''
-            SELECT
-                (SELECT COUNT(*) FROM produtos WHERE ativo=1) as total_produtos,
-                (SELECT COUNT(*) FROM pedidos) as total_pedidos,
-                (SELECT COUNT(*) FROM usuarios WHERE tipo='cliente') as total_clientes,
-                (SELECT COALESCE(SUM(total), 0) FROM pedidos WHERE status = "entregue") as faturamento_total
-        ''').fetchone()
-
-        stats = row_to_dict(stats_data) if stats_data else {}
+        # Estatísticas (tabelas materializadas mantidas por triggers)
+        stats = resumo_dashboard(db)
 
         # Pedidos recentes
         pedidos_recentes_data = db.execute('''
@@ -682,8 +698,63 @@ def admin_dashboard():
                             pedidos_recentes=[],
                             produtos_baixo_estoque=[],
                             now=datetime.now())
-    finally:
-        db.close()
+
+@app.route('/admin/api/pool-stats')
+@admin_required
+def admin_pool_stats():
+    """Estatísticas do pool de conexões deste worker"""
+    return jsonify(pool_stats())
+
+@app.route('/admin/api/cache-stats')
+@admin_required
+def admin_cache_stats():
+    """Contadores de hit/miss/eviction dos caches deste worker"""
+    return jsonify(cache_stats())
+
+@app.route('/admin/api/vendas')
+@admin_required
+def admin_vendas():
+    """Vendas por dia e receita por categoria (tabelas materializadas)"""
+    db = get_db()
+    dias = request.args.get('dias', 30, type=int)
+    return jsonify({
+        'por_dia': [dict(row.items()) for row in vendas_por_dia(db, max(1, min(dias, 366)))],
+        'por_categoria': [dict(row.items()) for row in vendas_por_categoria(db, request.args.get('status', 'entregue'))],
+    })
+
+@app.route('/admin/api/analytics/<any(resumo, receita, produtos, categorias, snapshot):metrica>')
+@admin_required
+def admin_analytics(metrica):
+    """Análises de vendas calculadas com NumPy sobre o snapshot colunar em memória"""
+    dias = max(0, min(request.args.get('dias', 90, type=int), 3660))   # 0 = todo o histórico
+    db = get_db()
+    try:
+        snapshot_vendas.atualizar(db)
+        if metrica == 'resumo':
+            dados = snapshot_vendas.resumo(dias)
+        elif metrica == 'receita':
+            periodo = request.args.get('periodo', 'dia')
+            if periodo not in PERIODOS:
+                return jsonify({'erro': f"periodo deve ser um de: {', '.join(PERIODOS)}"}), 400
+            dados = snapshot_vendas.receita_por_periodo(periodo, dias)
+        elif metrica == 'produtos':
+            limite = max(1, min(request.args.get('limite', 10, type=int), 100))
+            top = snapshot_vendas.top_produtos(limite, dias)
+            nomes = nomes_por_id(db, 'produtos', [produto_id for produto_id, _, _ in top])
+            dados = [{'produto_id': produto_id, 'nome': nomes.get(produto_id), 'quantidade': quantidade,
+                      'receita': receita} for produto_id, quantidade, receita in top]
+        elif metrica == 'categorias':
+            mix = snapshot_vendas.mix_categorias(dias)
+            nomes = nomes_por_id(db, 'categorias', [categoria_id for categoria_id, _, _, _ in mix])
+            dados = [{'categoria_id': categoria_id, 'nome': nomes.get(categoria_id, 'Sem categoria'),
+                      'quantidade': quantidade, 'receita': receita, 'participacao': participacao}
+                     for categoria_id, quantidade, receita, participacao in mix]
+        else:
+            dados = snapshot_vendas.estatisticas()
+        return jsonify(dados)
+    except sqlite3.Error:
+        logger.exception('Erro ao calcular análise %s', metrica)
+        return jsonify({'erro': 'Erro ao consultar o banco'}), 500
 
 @app.route('/admin/produtos', methods=['GET', 'POST'])
 @admin_required
@@ -728,13 +799,13 @@ def admin_produtos():
                             flash(error, 'danger')
                             return redirect(url_for('admin_produtos'))
 
-                db.execute('''
-                    INSERT INTO produtos (nome, descricao, preco, preco_promocional, categoria_id,
-                                        estoque, destaque, ativo, imagem, data_cadastro)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-                ''', (nome, descricao, preco, preco_promocional if preco_promocional else None,
-                      categoria_id, estoque, destaque, ativo, imagem_url))
-                db.commit()
+                with transacao_escrita(db):
+                    db.execute('''
+                        INSERT INTO produtos (nome, descricao, preco, preco_promocional, categoria_id,
+                                            estoque, destaque, ativo, imagem, data_cadastro)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                    ''', (nome, descricao, preco, preco_promocional if preco_promocional else None,
+                          categoria_id, estoque, destaque, ativo, imagem_url))
                 flash('Produto adicionado com sucesso!', 'success')
 
             elif action == 'editar':
@@ -763,14 +834,14 @@ def admin_produtos():
                         flash('Preço promocional deve ser menor que o preço normal', 'danger')
                         return redirect(url_for('admin_produtos'))
 
-                db.execute('''
-                    UPDATE produtos
-                    SET nome=?, descricao=?, preco=?, preco_promocional=?, categoria_id=?,
-                        estoque=?, destaque=?, ativo=?
-                    WHERE id=?
-                ''', (nome, descricao, preco, preco_promocional if preco_promocional else None,
-                      categoria_id, estoque, destaque, ativo, produto_id))
-                db.commit()
+                with transacao_escrita(db):
+                    db.execute('''
+                        UPDATE produtos
+                        SET nome=?, descricao=?, preco=?, preco_promocional=?, categoria_id=?,
+                            estoque=?, destaque=?, ativo=?
+                        WHERE id=?
+                    ''', (nome, descricao, preco, preco_promocional if preco_promocional else None,
+                          categoria_id, estoque, destaque, ativo, produto_id))
                 flash('Produto atualizado com sucesso!', 'success')
 
             elif action == 'alterar_imagem':
@@ -778,18 +849,13 @@ def admin_produtos():
 
                 # Verificar se é para remover imagem
                 if 'remover_imagem' in request.form:
-                    # Buscar imagem atual para remover arquivo físico
+                    # Buscar imagem atual; o arquivo só sai se nenhum outro produto o usa
                     produto = db.execute('SELECT imagem FROM produtos WHERE id = ?', (produto_id,)).fetchone()
-                    if produto and produto['imagem']:
-                        try:
-                            file_path = os.path.join(app.root_path, produto['imagem'][1:])  # Remove a barra inicial
-                            if os.path.exists(file_path):
-                                os.remove(file_path)
-                        except Exception as e:
-                            print(f"Erro ao remover arquivo: {e}")
-
-                    db.execute('UPDATE produtos SET imagem = NULL WHERE id = ?', (produto_id,))
-                    db.commit()
+
+                    with transacao_escrita(db):
+                        db.execute('UPDATE produtos SET imagem = NULL WHERE id = ?', (produto_id,))
+                    if produto:
+                        liberar_imagem(db, produto['imagem'])
                     flash('Imagem removida com sucesso!', 'success')
 
                 else:
@@ -797,22 +863,17 @@ def admin_produtos():
                     if 'imagem' in request.files:
                         file = request.files['imagem']
                         if file and file.filename != '':
-                            # Remover imagem antiga se existir
                             produto = db.execute('SELECT imagem FROM produtos WHERE id = ?', (produto_id,)).fetchone()
-                            if produto and produto['imagem']:
-                                try:
-                                    old_path = os.path.join(app.root_path, produto['imagem'][1:])
-                                    if os.path.exists(old_path):
-                                        os.remove(old_path)
-                                except Exception as e:
-                                    print(f"Erro ao remover arquivo antigo: {e}")
 
                             imagem_url, error = save_product_image(file)
                             if error:
                                 flash(error, 'danger')
                             else:
-                                db.execute('UPDATE produtos SET imagem = ? WHERE id = ?', (imagem_url, produto_id))
-                                db.commit()
+                                with transacao_escrita(db):
+                                    db.execute('UPDATE produtos SET imagem = ? WHERE id = ?', (imagem_url, produto_id))
+                                # Imagem antiga sai depois que a nova está gravada (se ficou sem uso)
+                                if produto and produto['imagem'] != imagem_url:
+                                    liberar_imagem(db, produto['imagem'])
                                 flash('Imagem do produto atualizada com sucesso!', 'success')
                         else:
                             flash('Nenhuma imagem selecionada', 'warning')
@@ -821,46 +882,44 @@ def admin_produtos():
 
             elif action == 'desativar':
                 produto_id = int(request.form['produto_id'])
-                db.execute('UPDATE produtos SET ativo = 0 WHERE id = ?', (produto_id,))
-                db.commit()
+                with transacao_escrita(db):
+                    db.execute('UPDATE produtos SET ativo = 0 WHERE id = ?', (produto_id,))
                 flash('Produto desativado com sucesso!', 'info')
 
             elif action == 'ativar':
                 produto_id = int(request.form['produto_id'])
-                db.execute('UPDATE produtos SET ativo = 1 WHERE id = ?', (produto_id,))
-                db.commit()
+                with transacao_escrita(db):
+                    db.execute('UPDATE produtos SET ativo = 1 WHERE id = ?', (produto_id,))
                 flash('Produto ativado com sucesso!', 'success')
 
             elif action == 'excluir_permanentemente':
                 produto_id = int(request.form['produto_id'])
 
-                # Buscar imagem para remover arquivo físico
+                # Buscar imagem para remover o arquivo físico depois do commit
                 produto = db.execute('SELECT imagem FROM produtos WHERE id = ?', (produto_id,)).fetchone()
-                if produto and produto['imagem']:
-                    try:
-                        file_path = os.path.join(app.root_path, produto['imagem'][1:])
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                    except Exception as e:
-                        print(f"Erro ao remover arquivo: {e}")
-
-                db.execute('DELETE FROM produtos WHERE id = ?', (produto_id,))
-                db.commit()
+
+                with transacao_escrita(db):
+                    db.execute('DELETE FROM produtos WHERE id = ?', (produto_id,))
+                if produto:
+                    liberar_imagem(db, produto['imagem'])
                 flash('Produto excluído permanentemente!', 'success')
 
+            catalogo_alterado()
+
         # Buscar produtos e categorias
-        produtos_data = db.execute('''
+        pagina = paginar(db, '''
             SELECT p.*, c.nome as categoria_nome
             FROM produtos p
             LEFT JOIN categorias c ON p.categoria_id = c.id
-            ORDER BY p.data_cadastro DESC
-        ''').fetchall()
-        produtos = rows_to_dict_list(produtos_data)
+        ''', ordem=('p.data_cadastro', 'p.id'), chaves=('data_cadastro', 'id'),
+            cursor=request.args.get('cursor'), direcao=request.args.get('dir'),
+            por_pagina=tamanho_pagina(request.args.get('por_pagina')))
+        pagina.total = contar(db, 'produtos:todos', 'SELECT COUNT(*) FROM produtos')
+        produtos = rows_to_dict_list(pagina.itens)
 
-        categorias_data = db.execute('SELECT * FROM categorias WHERE ativo = 1').fetchall()
-        categorias = rows_to_dict_list(categorias_data)
+        categorias = rows_to_dict_list(listar_categorias_ativas(db))
 
-        return render_template('admin/produtos.html', produtos=produtos, categorias=categorias)
+        return render_template('admin/produtos.html', produtos=produtos, pagina=pagina, categorias=categorias)
 
     except (ValueError, KeyError) as e:
         flash('Dados inválidos no formulário', 'danger')
@@ -868,27 +927,25 @@ def admin_produtos():
     except sqlite3.Error as e:
         flash('Erro no banco de dados', 'danger')
         return redirect(url_for('admin_dashboard'))
-    finally:
-        db.close()
 
 @app.route('/admin/pedidos')
 @admin_required
 def admin_pedidos():
     db = get_db()
     try:
-        pedidos_data = db.execute('''
+        pagina = paginar(db, '''
             SELECT p.*, u.nome as cliente_nome, u.email as cliente_email
             FROM pedidos p
             JOIN usuarios u ON p.usuario_id = u.id
-            ORDER BY p.data_pedido DESC
-        ''').fetchall()
-        pedidos = rows_to_dict_list(pedidos_data)
-        return render_template('admin/pedidos.html', pedidos=pedidos)
+        ''', ordem=('p.data_pedido', 'p.id'), chaves=('data_pedido', 'id'),
+            cursor=request.args.get('cursor'), direcao=request.args.get('dir'),
+            por_pagina=tamanho_pagina(request.args.get('por_pagina')))
+        pagina.total = contar(db, 'pedidos:todos', 'SELECT COUNT(*) FROM pedidos')
+        pedidos = rows_to_dict_list(pagina.itens)
+        return render_template('admin/pedidos.html', pedidos=pedidos, pagina=pagina)
     except sqlite3.Error:
         flash('Erro ao carregar pedidos', 'danger')
-        return render_template('admin/pedidos.html', pedidos=[])
-    finally:
-        db.close()
+        return render_template('admin/pedidos.html', pedidos=[], pagina=None)
 
 @app.route('/admin/pedido/<int:id>')
 @admin_required
@@ -920,8 +977,6 @@ def admin_pedido_detalhes(id):
     except sqlite3.Error:
         flash('Erro ao carregar pedido', 'danger')
         return redirect(url_for('admin_pedidos'))
-    finally:
-        db.close()
 
 @app.route('/admin/atualizar-status-pedido', methods=['POST'])
 @admin_required
@@ -931,9 +986,9 @@ def admin_atualizar_status_pedido():
         status = request.form['status']
 
         db = get_db()
-        db.execute('UPDATE pedidos SET status = ? WHERE id = ?', (status, pedido_id))
-        db.commit()
-        db.close()
+        with transacao_escrita(db):
+            db.execute('UPDATE pedidos SET status = ? WHERE id = ?', (status, pedido_id))
+        agendar_atualizacao_relacionados(db)
 
         flash('Status do pedido atualizado com sucesso!', 'success')
     except (ValueError, KeyError):
@@ -959,9 +1014,9 @@ def admin_categorias():
                     flash('Nome da categoria é obrigatório', 'danger')
                     return redirect(url_for('admin_categorias'))
 
-                db.execute('INSERT INTO categorias (nome, descricao) VALUES (?, ?)',
-                          (nome, descricao))
-                db.commit()
+                with transacao_escrita(db):
+                    db.execute('INSERT INTO categorias (nome, descricao) VALUES (?, ?)',
+                              (nome, descricao))
                 flash('Categoria adicionada com sucesso!', 'success')
 
             elif action == 'editar':
@@ -973,17 +1028,19 @@ def admin_categorias():
                     flash('Nome da categoria é obrigatório', 'danger')
                     return redirect(url_for('admin_categorias'))
 
-                db.execute('UPDATE categorias SET nome=?, descricao=? WHERE id=?',
-                          (nome, descricao, categoria_id))
-                db.commit()
+                with transacao_escrita(db):
+                    db.execute('UPDATE categorias SET nome=?, descricao=? WHERE id=?',
+                              (nome, descricao, categoria_id))
                 flash('Categoria atualizada com sucesso!', 'success')
 
             elif action == 'excluir':
                 categoria_id = int(request.form['categoria_id'])
-                db.execute('UPDATE categorias SET ativo = 0 WHERE id = ?', (categoria_id,))
-                db.commit()
+                with transacao_escrita(db):
+                    db.execute('UPDATE categorias SET ativo = 0 WHERE id = ?', (categoria_id,))
                 flash('Categoria desativada com sucesso!', 'info')
 
+            catalogo_alterado()
+
         categorias_data = db.execute('SELECT * FROM categorias WHERE ativo = 1').fetchall()
         categorias = rows_to_dict_list(categorias_data)
         return render_template('admin/categorias.html', categorias=categorias)
@@ -994,30 +1051,26 @@ def admin_categorias():
     except sqlite3.Error:
         flash('Erro no banco de dados', 'danger')
         return redirect(url_for('admin_dashboard'))
-    finally:
-        db.close()
 
 @app.route('/admin/clientes')
 @admin_required
 def admin_clientes():
     db = get_db()
     try:
-        clientes_data = db.execute('''
+        pagina = paginar(db, '''
             SELECT u.*,
-                   COUNT(p.id) as pedidos_count
+                   (SELECT COUNT(*) FROM pedidos p WHERE p.usuario_id = u.id) as pedidos_count
             FROM usuarios u
-            LEFT JOIN pedidos p ON u.id = p.usuario_id
-            WHERE u.tipo = 'cliente'
-            GROUP BY u.id
-            ORDER BY u.data_cadastro DESC
-        ''').fetchall()
-        clientes = rows_to_dict_list(clientes_data)
-        return render_template('admin/clientes.html', clientes=clientes)
+        ''', ordem=('u.data_cadastro', 'u.id'), chaves=('data_cadastro', 'id'),
+            where=["u.tipo = 'cliente'"],
+            cursor=request.args.get('cursor'), direcao=request.args.get('dir'),
+            por_pagina=tamanho_pagina(request.args.get('por_pagina')))
+        pagina.total = contar(db, 'clientes:todos', "SELECT COUNT(*) FROM usuarios WHERE tipo = 'cliente'")
+        clientes = rows_to_dict_list(pagina.itens)
+        return render_template('admin/clientes.html', clientes=clientes, pagina=pagina)
     except sqlite3.Error:
         flash('Erro ao carregar clientes', 'danger')
-        return render_template('admin/clientes.html', clientes=[])
-    finally:
-        db.close()
+        return render_template('admin/clientes.html', clientes=[], pagina=None)
 
 @app.route('/admin/cliente/<int:id>/excluir', methods=['POST'])
 @admin_required
@@ -1046,30 +1099,31 @@ def admin_excluir_cliente(id):
             flash('Não é possível excluir cliente com pedidos realizados. Desative a conta instead.', 'warning')
             return redirect(url_for('admin_clientes'))
 
-        # Iniciar transação para exclusão em cascata
-        db.execute('BEGIN TRANSACTION')
-
+        # Exclusão em cascata numa única transação de escrita
         try:
-            # Excluir avaliações do cliente
-            db.execute('DELETE FROM avaliacoes WHERE usuario_id = ?', (id,))
-
-            # Excluir itens do carrinho do cliente
-            db.execute('DELETE FROM carrinho WHERE usuario_id = ?', (id,))
-
-            # Finalmente, excluir o cliente
-            db.execute('DELETE FROM usuarios WHERE id = ?', (id,))
-
-            db.execute('COMMIT')
+            with transacao_escrita(db):
+                # Excluir avaliações do cliente e recalcular o resumo dos produtos avaliados
+                avaliados = [row['produto_id'] for row in db.execute(
+                    'SELECT produto_id FROM avaliacoes WHERE usuario_id = ?', (id,)
+                )]
+                db.execute('DELETE FROM avaliacoes WHERE usuario_id = ?', (id,))
+                regravar_resumos(db, avaliados)
+
+                # Excluir itens do carrinho do cliente
+                db.execute('DELETE FROM carrinho WHERE usuario_id = ?', (id,))
+
+                # Finalmente, excluir o cliente
+                db.execute('DELETE FROM usuarios WHERE id = ?', (id,))
+            invalidar_contagens('clientes:')
+            if avaliados:
+                invalidar_catalogo()
             flash(f'Cliente {cliente["nome"]} excluído com sucesso!', 'success')
 
         except sqlite3.Error as e:
-            db.execute('ROLLBACK')
             flash('Erro ao excluir cliente. Tente novamente.', 'danger')
 
     except sqlite3.Error as e:
         flash('Erro no banco de dados', 'danger')
-    finally:
-        db.close()
 
     return redirect(url_for('admin_clientes'))
 
@@ -1098,20 +1152,18 @@ def admin_desativar_cliente(id):
         if tem_campo_ativo:
             # Alternar status se o campo existir
             novo_status = 0 if cliente.get('ativo', 1) == 1 else 1
-            db.execute('UPDATE usuarios SET ativo = ? WHERE id = ?', (novo_status, id))
+            with transacao_escrita(db):
+                db.execute('UPDATE usuarios SET ativo = ? WHERE id = ?', (novo_status, id))
             acao = "desativado" if novo_status == 0 else "reativado"
         else:
             # Se não tiver campo ativo, apenas mostrar mensagem
             flash('Funcionalidade de ativar/desativar não disponível. Adicione o campo "ativo" na tabela usuarios.', 'warning')
             return redirect(url_for('admin_clientes'))
 
-        db.commit()
         flash(f'Cliente {cliente["nome"]} {acao} com sucesso!', 'success')
 
     except sqlite3.Error as e:
         flash('Erro ao alterar status do cliente', 'danger')
-    finally:
-        db.close()
 
     return redirect(url_for('admin_clientes'))
 
@@ -1167,8 +1219,6 @@ def admin_cliente_detalhes(id):
     except sqlite3.Error as e:
         flash('Erro ao carregar detalhes do cliente', 'danger')
         return redirect(url_for('admin_clientes'))
-    finally:
-        db.close()
 # ==================== ROTAS PARA EXCLUIR PEDIDOS ====================
 
 @app.route('/admin/pedido/<int:id>/excluir', methods=['POST'])
@@ -1186,45 +1236,41 @@ def admin_excluir_pedido(id):
 
         pedido = row_to_dict(pedido_data)
 
-        # Iniciar transação para exclusão em cascata
-        db.execute('BEGIN TRANSACTION')
-
+        # Exclusão em cascata numa única transação de escrita
         try:
-            # Buscar itens do pedido para restaurar estoque
-            itens_data = db.execute('''
-                SELECT produto_id, quantidade
-                FROM itens_pedido
-                WHERE pedido_id = ?
-            ''', (id,)).fetchall()
-            itens = rows_to_dict_list(itens_data)
-
-            # Restaurar estoque dos produtos
-            for item in itens:
-                db.execute('''
-                    UPDATE produtos
-                    SET estoque = estoque + ?
-                    WHERE id = ?
-                ''', (item['quantidade'], item['produto_id']))
+            with transacao_escrita(db):
+                # Buscar itens do pedido para restaurar estoque
+                itens_data = db.execute('''
+                    SELECT produto_id, quantidade
+                    FROM itens_pedido
+                    WHERE pedido_id = ?
+                ''', (id,)).fetchall()
+                itens = rows_to_dict_list(itens_data)
 
-            # Excluir itens do pedido
-            db.execute('DELETE FROM itens_pedido WHERE pedido_id = ?', (id,))
+                # Restaurar estoque dos produtos
+                for item in itens:
+                    db.execute('''
+                        UPDATE produtos
+                        SET estoque = estoque + ?
+                        WHERE id = ?
+                    ''', (item['quantidade'], item['produto_id']))
 
-            # Excluir o pedido
-            db.execute('DELETE FROM pedidos WHERE id = ?', (id,))
+                # Excluir itens do pedido
+                db.execute('DELETE FROM itens_pedido WHERE pedido_id = ?', (id,))
 
-            db.execute('COMMIT')
+                # Excluir o pedido
+                db.execute('DELETE FROM pedidos WHERE id = ?', (id,))
+            invalidar_contagens('pedidos:')
+            agendar_atualizacao_relacionados(db)
             flash(f'Pedido #{pedido["id"]} excluído com sucesso! Estoque dos produtos restaurado.', 'success')
 
         except sqlite3.Error as e:
-            db.execute('ROLLBACK')
             flash('Erro ao excluir pedido. Tente novamente.', 'danger')
             print(f"Erro ao excluir pedido: {e}")
 
     except sqlite3.Error as e:
         flash('Erro no banco de dados', 'danger')
         print(f"Erro no banco de dados: {e}")
-    finally:
-        db.close()
 
     return redirect(url_for('admin_pedidos'))
 
@@ -1234,57 +1280,19 @@ def admin_limpar_pedidos_cancelados():
     """Exclui todos os pedidos cancelados"""
     db = get_db()
     try:
-        # Buscar pedidos cancelados
-        pedidos_cancelados_data = db.execute('SELECT id FROM pedidos WHERE status = "cancelado"').fetchall()
-        pedidos_cancelados = rows_to_dict_list(pedidos_cancelados_data)
+        contador = purgar_pedidos_cancelados(db)
 
-        if not pedidos_cancelados:
+        if not contador:
             flash('Nenhum pedido cancelado encontrado', 'info')
             return redirect(url_for('admin_pedidos'))
 
-        # Iniciar transação
-        db.execute('BEGIN TRANSACTION')
-
-        try:
-            contador = 0
-            for pedido in pedidos_cancelados:
-                # Buscar itens do pedido para restaurar estoque
-                itens_data = db.execute('''
-                    SELECT produto_id, quantidade
-                    FROM itens_pedido
-                    WHERE pedido_id = ?
-                ''', (pedido['id'],)).fetchall()
-                itens = rows_to_dict_list(itens_data)
-
-                # Restaurar estoque dos produtos
-                for item in itens:
-                    db.execute('''
-                        UPDATE produtos
-                        SET estoque = estoque + ?
-                        WHERE id = ?
-                    ''', (item['quantidade'], item['produto_id']))
-
-                # Excluir itens do pedido
-                db.execute('DELETE FROM itens_pedido WHERE pedido_id = ?', (pedido['id'],))
-
-                # Excluir o pedido
-                db.execute('DELETE FROM pedidos WHERE id = ?', (pedido['id'],))
-
-                contador += 1
-
-            db.execute('COMMIT')
-            flash(f'{contador} pedido(s) cancelado(s) excluído(s) com sucesso! Estoque dos produtos restaurado.', 'success')
-
-        except sqlite3.Error as e:
-            db.execute('ROLLBACK')
-            flash('Erro ao excluir pedidos cancelados. Tente novamente.', 'danger')
-            print(f"Erro ao excluir pedidos cancelados: {e}")
+        invalidar_contagens('pedidos:')
+        catalogo_alterado()
+        flash(f'{contador} pedido(s) cancelado(s) excluído(s) com sucesso! Estoque dos produtos restaurado.', 'success')
 
     except sqlite3.Error as e:
-        flash('Erro no banco de dados', 'danger')
-        print(f"Erro no banco de dados: {e}")
-    finally:
-        db.close()
+        flash('Erro ao excluir pedidos cancelados. Tente novamente.', 'danger')
+        logger.error(f"Erro ao excluir pedidos cancelados: {e}")
 
     return redirect(url_for('admin_pedidos'))
     # ==================== ROTAS PARA EXCLUIR PRODUTOS ====================
@@ -1315,41 +1323,30 @@ def admin_excluir_produto(id):
             flash('Não é possível excluir produto com pedidos associados. Desative o produto instead.', 'warning')
             return redirect(url_for('admin_produtos'))
 
-        # Iniciar transação
-        db.execute('BEGIN TRANSACTION')
-
+        # Exclusão numa única transação de escrita
         try:
-            # Remover imagem física se existir
-            if produto['imagem']:
-                try:
-                    file_path = os.path.join(app.root_path, produto['imagem'][1:])  # Remove a barra inicial
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                except Exception as e:
-                    logger.warning(f"Erro ao remover arquivo de imagem: {str(e)}")
-
-            # Remover avaliações do produto
-            db.execute('DELETE FROM avaliacoes WHERE produto_id = ?', (id,))
-
-            # Remover do carrinho dos usuários
-            db.execute('DELETE FROM carrinho WHERE produto_id = ?', (id,))
-
-            # Excluir o produto
-            db.execute('DELETE FROM produtos WHERE id = ?', (id,))
-
-            db.execute('COMMIT')
+            with transacao_escrita(db):
+                # Remover avaliações do produto (e o resumo)
+                db.execute('DELETE FROM avaliacoes WHERE produto_id = ?', (id,))
+                db.execute('DELETE FROM avaliacoes_resumo WHERE produto_id = ?', (id,))
+
+                # Remover do carrinho dos usuários
+                db.execute('DELETE FROM carrinho WHERE produto_id = ?', (id,))
+
+                # Excluir o produto
+                db.execute('DELETE FROM produtos WHERE id = ?', (id,))
+            # Remover imagem física se nenhum outro produto a usa
+            liberar_imagem(db, produto['imagem'])
+            catalogo_alterado()
             flash(f'Produto "{produto["nome"]}" excluído permanentemente!', 'success')
 
         except sqlite3.Error as e:
-            db.execute('ROLLBACK')
             logger.error(f"Erro ao excluir produto {id}: {str(e)}")
             flash('Erro ao excluir produto. Tente novamente.', 'danger')
 
     except sqlite3.Error as e:
         logger.error(f"Erro no banco de dados ao excluir produto: {str(e)}")
         flash('Erro no banco de dados', 'danger')
-    finally:
-        db.close()
 
     return redirect(url_for('admin_produtos'))
 
@@ -1369,16 +1366,15 @@ def admin_desativar_produto(id):
         novo_status = 0 if produto['ativo'] == 1 else 1
         acao = "desativado" if novo_status == 0 else "reativado"
 
-        db.execute('UPDATE produtos SET ativo = ? WHERE id = ?', (novo_status, id))
-        db.commit()
+        with transacao_escrita(db):
+            db.execute('UPDATE produtos SET ativo = ? WHERE id = ?', (novo_status, id))
+        catalogo_alterado()
 
         flash(f'Produto "{produto["nome"]}" {acao} com sucesso!', 'success')
 
     except sqlite3.Error as e:
         logger.error(f"Erro ao alterar status do produto {id}: {str(e)}")
         flash('Erro ao alterar status do produto', 'danger')
-    finally:
-        db.close()
 
     return redirect(url_for('admin_produtos'))
 
@@ -1388,59 +1384,18 @@ def admin_limpar_produtos_inativos():
     """Exclui permanentemente todos os produtos inativos sem pedidos associados"""
     db = get_db()
     try:
-        # Buscar produtos inativos sem pedidos
-        produtos_inativos_data = db.execute('''
-            SELECT p.id, p.nome, p.imagem
-            FROM produtos p
-            LEFT JOIN itens_pedido ip ON p.id = ip.produto_id
-            WHERE p.ativo = 0 AND ip.produto_id IS NULL
-        ''').fetchall()
-
-        produtos_inativos = rows_to_dict_list(produtos_inativos_data)
+        contador = purgar_produtos_inativos(db)
 
-        if not produtos_inativos:
+        if not contador:
             flash('Nenhum produto inativo sem pedidos encontrado', 'info')
             return redirect(url_for('admin_produtos'))
 
-        # Iniciar transação
-        db.execute('BEGIN TRANSACTION')
-
-        try:
-            contador = 0
-            for produto in produtos_inativos:
-                # Remover imagem física se existir
-                if produto['imagem']:
-                    try:
-                        file_path = os.path.join(app.root_path, produto['imagem'][1:])
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                    except Exception as e:
-                        logger.warning(f"Erro ao remover arquivo de imagem: {str(e)}")
-
-                # Remover avaliações
-                db.execute('DELETE FROM avaliacoes WHERE produto_id = ?', (produto['id'],))
-
-                # Remover do carrinho
-                db.execute('DELETE FROM carrinho WHERE produto_id = ?', (produto['id'],))
-
-                # Excluir produto
-                db.execute('DELETE FROM produtos WHERE id = ?', (produto['id'],))
-
-                contador += 1
-
-            db.execute('COMMIT')
-            flash(f'{contador} produto(s) inativo(s) excluído(s) permanentemente!', 'success')
-
-        except sqlite3.Error as e:
-            db.execute('ROLLBACK')
-            logger.error(f"Erro ao limpar produtos inativos: {str(e)}")
-            flash('Erro ao excluir produtos inativos. Tente novamente.', 'danger')
+        catalogo_alterado()
+        flash(f'{contador} produto(s) inativo(s) excluído(s) permanentemente!', 'success')
 
     except sqlite3.Error as e:
-        logger.error(f"Erro no banco de dados ao limpar produtos: {str(e)}")
-        flash('Erro no banco de dados', 'danger')
-    finally:
-        db.close()
+        logger.error(f"Erro ao limpar produtos inativos: {str(e)}")
+        flash('Erro ao excluir produtos inativos. Tente novamente.', 'danger')
 
     return redirect(url_for('admin_produtos'))
 # ==================== ROTAS DE RELATÓRIOS ====================
@@ -1452,16 +1407,10 @@ def relatorio_produtos_excel():
     """Gera relatório de produtos em Excel (download direto)"""
     db = get_db()
     try:
-        produtos_data = db.execute('''
-            SELECT p.*, c.nome as categoria_nome
-            FROM produtos p
-            LEFT JOIN categorias c ON p.categoria_id = c.id
-            WHERE p.ativo = 1
-            ORDER BY p.nome
-        ''').fetchall()
+        produtos_data = db.execute(CONSULTAS_RELATORIO['produtos'])
 
-        produtos_dict = rows_to_dict_list(produtos_data)
-        excel_file = gerar_excel_produtos(produtos_dict)
+        # O cursor é consumido linha a linha pelo gerador do Excel
+        excel_file = gerar_excel_produtos(produtos_data)
 
         filename = f"relatorio_produtos_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
 
@@ -1474,8 +1423,6 @@ def relatorio_produtos_excel():
     except Exception as e:
         flash(f'Erro ao gerar relatório: {str(e)}', 'danger')
         return redirect(url_for('admin_produtos'))
-    finally:
-        db.close()
 
 @app.route('/admin/relatorio/produtos/pdf')
 @admin_required
@@ -1483,16 +1430,9 @@ def relatorio_produtos_pdf():
     """Gera relatório de produtos em PDF (download direto)"""
     db = get_db()
     try:
-        produtos_data = db.execute('''
-            SELECT p.*, c.nome as categoria_nome
-            FROM produtos p
-            LEFT JOIN categorias c ON p.categoria_id = c.id
-            WHERE p.ativo = 1
-            ORDER BY p.nome
-        ''').fetchall()
+        produtos_data = db.execute(CONSULTAS_RELATORIO['produtos'])
 
-        produtos_dict = rows_to_dict_list(produtos_data)
-        pdf_file = gerar_pdf_produtos(produtos_dict)
+        pdf_file = gerar_pdf_produtos(produtos_data)
 
         filename = f"relatorio_produtos_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
 
@@ -1505,8 +1445,6 @@ def relatorio_produtos_pdf():
     except Exception as e:
         flash(f'Erro ao gerar relatório: {str(e)}', 'danger')
         return redirect(url_for('admin_produtos'))
-    finally:
-        db.close()
 
 @app.route('/admin/relatorio/pedidos/excel')
 @admin_required
@@ -1514,15 +1452,10 @@ def relatorio_pedidos_excel():
     """Gera relatório de pedidos em Excel (download direto)"""
     db = get_db()
     try:
-        pedidos_data = db.execute('''
-            SELECT p.*, u.nome as cliente_nome, u.email as cliente_email
-            FROM pedidos p
-            JOIN usuarios u ON p.usuario_id = u.id
-            ORDER BY p.data_pedido DESC
-        ''').fetchall()
+        pedidos_data = db.execute(CONSULTAS_RELATORIO['pedidos'])
 
-        pedidos_dict = rows_to_dict_list(pedidos_data)
-        excel_file = gerar_excel_pedidos(pedidos_dict)
+        # O cursor é consumido linha a linha pelo gerador do Excel
+        excel_file = gerar_excel_pedidos(pedidos_data)
 
         filename = f"relatorio_pedidos_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
 
@@ -1535,8 +1468,6 @@ def relatorio_pedidos_excel():
     except Exception as e:
         flash(f'Erro ao gerar relatório: {str(e)}', 'danger')
         return redirect(url_for('admin_pedidos'))
-    finally:
-        db.close()
 
 @app.route('/admin/relatorio/pedidos/pdf')
 @admin_required
@@ -1544,15 +1475,9 @@ def relatorio_pedidos_pdf():
     """Gera relatório de pedidos em PDF (download direto)"""
     db = get_db()
     try:
-        pedidos_data = db.execute('''
-            SELECT p.*, u.nome as cliente_nome, u.email as cliente_email
-            FROM pedidos p
-            JOIN usuarios u ON p.usuario_id = u.id
-            ORDER BY p.data_pedido DESC
-        ''').fetchall()
+        pedidos_data = db.execute(CONSULTAS_RELATORIO['pedidos'])
 
-        pedidos_dict = rows_to_dict_list(pedidos_data)
-        pdf_file = gerar_pdf_pedidos(pedidos_dict)
+        pdf_file = gerar_pdf_pedidos(pedidos_data)
 
         filename = f"relatorio_pedidos_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
 
@@ -1565,8 +1490,6 @@ def relatorio_pedidos_pdf():
     except Exception as e:
         flash(f'Erro ao gerar relatório: {str(e)}', 'danger')
         return redirect(url_for('admin_pedidos'))
-    finally:
-        db.close()
 
 @app.route('/admin/relatorio/clientes/excel')
 @admin_required
@@ -1574,10 +1497,10 @@ def relatorio_clientes_excel():
     """Gera relatório de clientes em Excel (download direto)"""
     db = get_db()
     try:
-        clientes_data = db.execute("SELECT * FROM usuarios WHERE tipo = 'cliente'").fetchall()
+        clientes_data = db.execute(CONSULTAS_RELATORIO['clientes'])
 
-        clientes_dict = rows_to_dict_list(clientes_data)
-        excel_file = gerar_excel_clientes(clientes_dict)
+        # O cursor é consumido linha a linha pelo gerador do Excel
+        excel_file = gerar_excel_clientes(clientes_data)
 
         filename = f"relatorio_clientes_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
 
@@ -1590,8 +1513,6 @@ def relatorio_clientes_excel():
     except Exception as e:
         flash(f'Erro ao gerar relatório: {str(e)}', 'danger')
         return redirect(url_for('admin_clientes'))
-    finally:
-        db.close()
 
 @app.route('/admin/relatorio/clientes/pdf')
 @admin_required
@@ -1599,10 +1520,9 @@ def relatorio_clientes_pdf():
     """Gera relatório de clientes em PDF (download direto)"""
     db = get_db()
     try:
-        clientes_data = db.execute("SELECT * FROM usuarios WHERE tipo = 'cliente'").fetchall()
+        clientes_data = db.execute(CONSULTAS_RELATORIO['clientes'])
 
-        clientes_dict = rows_to_dict_list(clientes_data)
-        pdf_file = gerar_pdf_clientes(clientes_dict)
+        pdf_file = gerar_pdf_clientes(clientes_data)
 
         filename = f"relatorio_clientes_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
 
@@ -1615,61 +1535,82 @@ def relatorio_clientes_pdf():
     except Exception as e:
         flash(f'Erro ao gerar relatório: {str(e)}', 'danger')
         return redirect(url_for('admin_clientes'))
-    finally:
-        db.close()
 
-# Relatórios salvos no servidor
-@app.route('/admin/relatorio/produtos/salvar-excel')
+# Exportação em streaming (CSV gzip / NDJSON) para BI
+@app.route('/admin/relatorio/<any(produtos, pedidos, clientes):entidade>/<any(csv, ndjson):formato>')
 @admin_required
-def salvar_relatorio_produtos_excel():
-    """Salva relatório de produtos em Excel no servidor"""
-    db = get_db()
-    try:
-        produtos_data = db.execute('''
-            SELECT p.*, c.nome as categoria_nome
-            FROM produtos p
-            LEFT JOIN categorias c ON p.categoria_id = c.id
-            WHERE p.ativo = 1
-            ORDER BY p.nome
-        ''').fetchall()
+def relatorio_exportar(entidade, formato):
+    """Exporta a entidade em CSV compactado ou NDJSON, sem materializar o resultado"""
+    compactar = formato == 'csv' or request.args.get('gzip') == '1'
 
-        produtos_dict = rows_to_dict_list(produtos_data)
-        filename, filepath = gerar_excel_produtos(produtos_dict, salvar_arquivo=True)
+    def gerar():
+        # Conexão própria: o streaming continua depois que a view retorna
+        db = get_pool().emprestar()
+        try:
+            cursor = db.execute(CONSULTAS_EXPORTACAO[entidade])
+            exportar = exportar_csv if formato == 'csv' else exportar_ndjson
+            yield from exportar(cursor, compactar=compactar)
+        finally:
+            db.close()
 
-        flash(f'Relatório salvo: {filename}', 'success')
-        return redirect(url_for('admin_produtos'))
+    extensao = 'csv' if formato == 'csv' else 'ndjson'
+    if compactar:
+        extensao += '.gz'
+    filename = f"relatorio_{entidade}_{datetime.now().strftime('%Y%m%d_%H%M')}.{extensao}"
+    mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
 
-    except Exception as e:
-        flash(f'Erro ao salvar relatório: {str(e)}', 'danger')
-        return redirect(url_for('admin_produtos'))
-    finally:
-        db.close()
+    response = Response(stream_with_context(gerar()), mimetype='application/gzip' if compactar else mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
 
-@app.route('/admin/relatorio/produtos/salvar-pdf')
+# Relatórios gerados em segundo plano (fila de tarefas + pool de processos)
+@app.route('/admin/relatorios/gerar/<any(produtos, pedidos, clientes):entidade>/<any(excel, pdf):formato>',
+           methods=['POST'])
 @admin_required
-def salvar_relatorio_produtos_pdf():
-    """Salva relatório de produtos em PDF no servidor"""
+def gerar_relatorio(entidade, formato):
+    """Enfileira a geração do relatório; pedidos repetidos reaproveitam a tarefa ativa"""
     db = get_db()
     try:
-        produtos_data = db.execute('''
-            SELECT p.*, c.nome as categoria_nome
-            FROM produtos p
-            LEFT JOIN categorias c ON p.categoria_id = c.id
-            WHERE p.ativo = 1
-            ORDER BY p.nome
-        ''').fetchall()
-
-        produtos_dict = rows_to_dict_list(produtos_data)
-        filename, filepath = gerar_pdf_produtos(produtos_dict, salvar_arquivo=True)
+        tarefa_id, nova = enfileirar_relatorio(db, entidade, formato)
+        if request.accept_mimetypes.best == 'application/json':
+            resposta = jsonify({'id': tarefa_id, 'nova': nova,
+                                'status_url': url_for('admin_status_tarefa', tarefa_id=tarefa_id)})
+            resposta.status_code = 202
+            resposta.headers['Location'] = url_for('admin_status_tarefa', tarefa_id=tarefa_id)
+            return resposta
+        if nova:
+            flash(f'Relatório de {entidade} ({formato.upper()}) enviado para geração (tarefa #{tarefa_id})', 'info')
+        else:
+            flash(f'Este relatório já está sendo gerado (tarefa #{tarefa_id})', 'info')
+    except Exception as e:
+        flash(f'Erro ao enfileirar relatório: {str(e)}', 'danger')
+    return redirect(url_for('lista_relatorios'))
 
-        flash(f'Relatório salvo: {filename}', 'success')
-        return redirect(url_for('admin_produtos'))
+@app.route('/admin/api/tarefas/<int:tarefa_id>')
+@admin_required
+def admin_status_tarefa(tarefa_id):
+    """Status e progresso de uma tarefa, com o link de download quando concluída"""
+    db = get_db()
+    tarefa = obter_tarefa(db, tarefa_id)
+    if tarefa is None:
+        return jsonify({'erro': 'Tarefa não encontrada'}), 404
+    if tarefa['status'] == 'concluido' and tarefa['arquivo']:
+        tarefa['download_url'] = url_for('download_relatorio', filename=tarefa['arquivo'])
+    return jsonify(tarefa)
+
+# Atalhos antigos de "salvar no servidor": agora só enfileiram a tarefa
+@app.route('/admin/relatorio/produtos/salvar-excel')
+@admin_required
+def salvar_relatorio_produtos_excel():
+    """Salva relatório de produtos em Excel no servidor (em segundo plano)"""
+    return gerar_relatorio('produtos', 'excel')
 
-    except Exception as e:
-        flash(f'Erro ao salvar relatório: {str(e)}', 'danger')
-        return redirect(url_for('admin_produtos'))
-    finally:
-        db.close()
+@app.route('/admin/relatorio/produtos/salvar-pdf')
+@admin_required
+def salvar_relatorio_produtos_pdf():
+    """Salva relatório de produtos em PDF no servidor (em segundo plano)"""
+    return gerar_relatorio('produtos', 'pdf')
 
 # Lista de relatórios salvos
 @app.route('/admin/relatorios')
@@ -1677,7 +1618,12 @@ def salvar_relatorio_produtos_pdf():
 def lista_relatorios():
     """Lista todos os relatórios salvos"""
     relatorios = listar_relatorios()
-    return render_template('admin/lista_relatorios.html', relatorios=relatorios)
+    db = get_db()
+    try:
+        tarefas = listar_tarefas(db)
+    except sqlite3.Error:
+        tarefas = []
+    return render_template('admin/lista_relatorios.html', relatorios=relatorios, tarefas=tarefas)
 
 @app.route('/admin/relatorios/download/<filename>')
 @admin_required
@@ -1725,6 +1671,108 @@ def forbidden_error(error):
 
 # ==================== INICIALIZAÇÃO ====================
 
+@app.cli.command('purgar-cancelados')
+@click.option('--lote', default=LOTE_PADRAO, show_default=True, help='Pedidos por transação')
+def purgar_cancelados_command(lote):
+    """Exclui os pedidos cancelados em lotes, mostrando o progresso"""
+    db = get_db()
+    total = purgar_pedidos_cancelados(db, lote=lote,
+                                      progresso=lambda n: print(f'{n} pedido(s) excluído(s)...'))
+    invalidar_catalogo()
+    print(f'Concluído: {total} pedido(s) cancelado(s) excluído(s)')
+
+@app.cli.command('migrar')
+def migrar_command():
+    """Aplica as migrações pendentes do banco"""
+    db = get_db()
+    aplicadas = migrar_db(db)
+    print(f'Migrações aplicadas: {aplicadas}' if aplicadas else 'Banco já está atualizado')
+
+@app.cli.command('avaliacoes-recalcular')
+def avaliacoes_recalcular_command():
+    """Recalcula do zero o resumo de avaliações de todos os produtos"""
+    db = get_db()
+    total = recalcular_resumos(db)
+    invalidar_catalogo()
+    print(f'Resumo recalculado para {total} produto(s)')
+
+@app.cli.command('relacionados-atualizar')
+@click.option('--completo', is_flag=True, help='Reconstrói o índice do zero')
+def relacionados_atualizar_command(completo):
+    """Atualiza o índice de produtos comprados juntos (incremental por padrão)"""
+    db = get_db()
+    marca, produtos = atualizar_relacionados(db, completo=completo)
+    if produtos:
+        invalidar_catalogo()
+    print(f'Índice atualizado até o pedido #{marca}: {produtos} produto(s) recalculado(s)')
+
+@app.cli.command('estatisticas-reconstruir')
+def estatisticas_reconstruir_command():
+    """Recalcula do zero as estatísticas materializadas do dashboard"""
+    db = get_db()
+    reconstruir_estatisticas(db)
+    print('Estatísticas reconstruídas')
+
+@app.cli.command('estatisticas-verificar')
+def estatisticas_verificar_command():
+    """Compara as estatísticas materializadas com o recálculo completo"""
+    db = get_db()
+    divergencias = verificar_estatisticas(db)
+    for tabela, chave, atual, esperado in divergencias:
+        print(f'{tabela} {chave}: materializado={atual} recalculado={esperado}')
+    if divergencias:
+        raise click.ClickException(
+            f'{len(divergencias)} divergência(s); rode "flask estatisticas-reconstruir"'
+        )
+    print('Estatísticas consistentes')
+
+@app.cli.command('imagens-processar')
+@click.option('--todas', is_flag=True, help='Refaz também as imagens que já têm variantes')
+def imagens_processar_command(todas):
+    """Gera as variantes redimensionadas das imagens de produtos já cadastradas"""
+    db = get_db()
+    urls = [row['imagem'] for row in db.execute(
+        'SELECT DISTINCT imagem FROM produtos WHERE imagem IS NOT NULL')]
+    pendentes = [
+        url for url in urls
+        if os.path.exists(os.path.join(app.root_path, url.lstrip('/')))
+        and (todas or variantes_imagem(url) is None)
+    ]
+    falhas = 0
+    for url, future in [(url, processar_em_segundo_plano(url)) for url in pendentes]:
+        try:
+            future.result()
+        except Exception as e:
+            falhas += 1
+            print(f'{url}: {e}')
+    if pendentes:
+        invalidar_catalogo()
+    print(f'{len(pendentes) - falhas} imagem(ns) processada(s), {falhas} falha(s)')
+
+@app.cli.command('imagens-limpar')
+def imagens_limpar_command():
+    """Remove do armazenamento as imagens que nenhum produto referencia"""
+    db = get_db()
+    removidas = limpar_orfas(db, UPLOAD_FOLDER)
+    print(f'{removidas} imagem(ns) sem referência removida(s)')
+
+@app.cli.command('ativos-construir')
+@click.option('--limpar', is_flag=True, help='Remove os arquivos de builds anteriores')
+def ativos_construir_command(limpar):
+    """Gera as cópias com hash dos ativos estáticos e as versões pré-comprimidas"""
+    manifesto = carregar_ativos(app.static_folder, app.static_url_path, forcar=True)
+    invalidar_catalogo()
+    print(f'{len(manifesto["arquivos"])} ativo(s), {len(manifesto["comprimidos"])} pré-comprimido(s)')
+    if limpar:
+        print(f'{limpar_builds_antigos(app.static_folder)} arquivo(s) antigo(s) removido(s)')
+
+@app.cli.command('sessoes-limpar')
+def sessoes_limpar_command():
+    """Remove as sessões expiradas do armazenamento"""
+    if armazenamento_sessoes is None:
+        raise click.ClickException('Sessões em cookie (VIVANTS_SESSOES=cookie): nada a limpar')
+    print(f'{armazenamento_sessoes.varrer()} sessão(ões) expirada(s) removida(s)')
+
 if __name__ == '__main__':
     init_db()
     app.run(debug=True, host='0.0.0.0', port=5000)
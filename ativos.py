@@ -0,0 +1,206 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # opcional: sem o pacote só as versões .gz são geradas
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Cópias com hash no nome ficam em static/build/ (fora do controle de versão)
+PASTA_BUILD = 'build'
+# Subpastas de static/ que não são ativos do site (conteúdo enviado/gerado em runtime)
+IGNORADAS = {PASTA_BUILD, 'uploads', 'relatorios'}
+# Tipos de texto que valem a pena pré-comprimir (imagens raster já são comprimidas)
+COMPRIMIR = {'.css', '.js', '.svg', '.json', '.txt', '.map'}
+CODIFICACOES = (('br', '.br'), ('gzip', '.gz'))
+TAMANHO_HASH = 12
+
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+
+_URL_CSS = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+_manifesto = {'arquivos': {}, 'comprimidos': {}}
+
+
+def _fontes(pasta):
+    """Caminhos relativos (com '/') dos arquivos de static/ que entram no build"""
+    fontes = []
+    for diretorio, subpastas, arquivos in os.walk(pasta):
+        if diretorio == pasta:
+            subpastas[:] = [s for s in subpastas if s not in IGNORADAS]
+        for arquivo in arquivos:
+            caminho = os.path.join(diretorio, arquivo)
+            fontes.append(os.path.relpath(caminho, pasta).replace(os.sep, '/'))
+    return sorted(fontes)
+
+
+def _assinatura(pasta, fontes):
+    # Nome, tamanho e mtime das fontes: muda a cada deploy que altera algum ativo
+    h = hashlib.sha256()
+    for rel in fontes:
+        stat = os.stat(os.path.join(pasta, rel))
+        h.update(f'{rel}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+    return h.hexdigest()
+
+
+def _gravar(destino, dados):
+    if os.path.exists(destino):
+        return
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporario = f'{destino}.{os.getpid()}.tmp'
+    with open(temporario, 'wb') as f:
+        f.write(dados)
+    os.replace(temporario, destino)
+
+
+def _reescrever_css(texto, rel, arquivos, url_static):
+    """Aponta os url(...) do CSS para as cópias com hash (absolutas ou relativas ao CSS)"""
+    def trocar(match):
+        aspas, url = match.groups()
+        alvo = url.split('#', 1)[0].split('?', 1)[0]
+        if alvo.startswith(url_static + '/'):
+            alvo = alvo[len(url_static) + 1:]
+        elif ':' in alvo or alvo.startswith(('/', '#')):
+            return match.group(0)
+        else:
+            alvo = os.path.normpath(os.path.join(os.path.dirname(rel), alvo)).replace(os.sep, '/')
+        if alvo not in arquivos:
+            return match.group(0)
+        return f'url({aspas}{url_static}/{PASTA_BUILD}/{arquivos[alvo]}{aspas})'
+    return _URL_CSS.sub(trocar, texto)
+
+
+def construir_ativos(pasta, url_static='/static'):
+    """Gera static/build/ com cópias nomeadas pelo hash do conteúdo e o manifesto.
+
+    Os CSS são processados por último, depois de reescrever os url(...) para os
+    nomes com hash, então o hash do CSS também muda quando uma imagem muda.
+    Arquivos de texto ganham irmãos .gz (e .br, com o pacote brotli) quando a
+    compressão reduz o tamanho. Builds anteriores não são apagados: páginas em
+    cache ainda podem apontar para eles.
+    """
+    fontes = _fontes(pasta)
+    saida = os.path.join(pasta, PASTA_BUILD)
+    arquivos, comprimidos = {}, {}
+
+    for rel in sorted(fontes, key=lambda r: r.endswith('.css')):
+        with open(os.path.join(pasta, rel), 'rb') as f:
+            dados = f.read()
+        if rel.endswith('.css'):
+            dados = _reescrever_css(dados.decode('utf-8'), rel, arquivos, url_static).encode('utf-8')
+
+        base, extensao = os.path.splitext(rel)
+        digest = hashlib.sha256(dados).hexdigest()[:TAMANHO_HASH]
+        destino_rel = f'{base}.{digest}{extensao}'
+        destino = os.path.join(saida, destino_rel)
+        _gravar(destino, dados)
+        arquivos[rel] = destino_rel
+
+        if extensao.lower() in COMPRIMIR:
+            versoes = {'gzip': gzip.compress(dados, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                versoes['br'] = brotli.compress(dados, quality=11)
+            for codificacao, sufixo in CODIFICACOES:
+                comprimido = versoes.get(codificacao)
+                if comprimido is not None and len(comprimido) < len(dados):
+                    _gravar(destino + sufixo, comprimido)
+                    comprimidos.setdefault(destino_rel, []).append(codificacao)
+
+    manifesto = {
+        'assinatura': _assinatura(pasta, fontes),
+        'arquivos': arquivos,
+        'comprimidos': comprimidos,
+    }
+    caminho = os.path.join(saida, 'manifest.json')
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    os.makedirs(saida, exist_ok=True)
+    with open(temporario, 'w') as f:
+        json.dump(manifesto, f, indent=1, ensure_ascii=False)
+    os.replace(temporario, caminho)
+    return manifesto
+
+
+def carregar_ativos(pasta, url_static='/static', forcar=False):
+    """Lê o manifesto; refaz o build se não existir ou se as fontes mudaram"""
+    global _manifesto
+    manifesto = None
+    if not forcar:
+        try:
+            with open(os.path.join(pasta, PASTA_BUILD, 'manifest.json')) as f:
+                manifesto = json.load(f)
+        except (OSError, ValueError):
+            manifesto = None
+        if manifesto and manifesto.get('assinatura') != _assinatura(pasta, _fontes(pasta)):
+            manifesto = None
+    if manifesto is None:
+        manifesto = construir_ativos(pasta, url_static)
+        logger.info('Ativos estáticos: %d arquivo(s) com hash gerado(s)', len(manifesto['arquivos']))
+    _manifesto = manifesto
+    return manifesto
+
+
+def limpar_builds_antigos(pasta):
+    """Remove de static/build/ os arquivos que o manifesto atual não usa; retorna quantos"""
+    saida = os.path.join(pasta, PASTA_BUILD)
+    em_uso = {'manifest.json'}
+    for destino in _manifesto['arquivos'].values():
+        em_uso.add(destino)
+        em_uso.update(destino + sufixo for _, sufixo in CODIFICACOES)
+    removidos = 0
+    for rel in _fontes(saida):
+        if rel not in em_uso:
+            os.remove(os.path.join(saida, rel))
+            removidos += 1
+    return removidos
+
+
+def _url_com_hash(endpoint, values):
+    # url_for('static', filename='css/style.css') -> /static/build/css/style.<hash>.css
+    if endpoint != 'static' or current_app.debug:
+        return
+    destino = _manifesto['arquivos'].get(values.get('filename'))
+    if destino:
+        values['filename'] = f'{PASTA_BUILD}/{destino}'
+
+
+def servir_estatico(filename):
+    """Substitui a view 'static': arquivos com hash saem com cache imutável e,
+    quando o cliente aceita, na versão pré-comprimida"""
+    if not filename.startswith(PASTA_BUILD + '/'):
+        return current_app.send_static_file(filename)
+
+    destino = filename[len(PASTA_BUILD) + 1:]
+    disponiveis = _manifesto['comprimidos'].get(destino, ())
+    for codificacao, sufixo in CODIFICACOES:
+        if codificacao in disponiveis and request.accept_encodings[codificacao]:
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(current_app.static_folder, filename + sufixo, mimetype=mimetype)
+            response.headers['Content-Encoding'] = codificacao
+            break
+    else:
+        response = send_from_directory(current_app.static_folder, filename)
+    response.headers['Cache-Control'] = CACHE_IMUTAVEL
+    if disponiveis:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Carrega (ou gera) o manifesto e liga o url_for e a view de estáticos a ele.
+
+    VIVANTS_ATIVOS=0 desliga; com debug ligado o url_for volta aos nomes originais.
+    """
+    if os.environ.get('VIVANTS_ATIVOS', '1') == '0':
+        return
+    carregar_ativos(app.static_folder, app.static_url_path)
+    app.url_defaults(_url_com_hash)
+    app.view_functions['static'] = servir_estatico
@@ -0,0 +1,88 @@
+from database import transacao_escrita
+
+AVALIACOES_POR_PAGINA = 10
+
+# Colunas do resumo para SELECTs de produtos (alias r = avaliacoes_resumo)
+COLUNAS_RESUMO = '''
+    COALESCE(r.total, 0) as avaliacoes_total,
+    ROUND(r.soma * 1.0 / r.total, 1) as nota_media
+'''
+
+_RECALCULO = '''
+    INSERT OR REPLACE INTO avaliacoes_resumo
+        (produto_id, total, soma, nota_1, nota_2, nota_3, nota_4, nota_5)
+    SELECT produto_id, COUNT(*), SUM(nota),
+           SUM(nota = 1), SUM(nota = 2), SUM(nota = 3), SUM(nota = 4), SUM(nota = 5)
+    FROM avaliacoes
+'''
+
+
+class AvaliacaoDuplicada(Exception):
+    """O usuário já avaliou este produto"""
+
+
+def registrar_avaliacao(db, produto_id, usuario_id, nota, comentario):
+    """Grava a avaliação e atualiza o resumo do produto na mesma transação"""
+    with transacao_escrita(db):
+        existente = db.execute(
+            'SELECT id FROM avaliacoes WHERE produto_id = ? AND usuario_id = ?', (produto_id, usuario_id)
+        ).fetchone()
+        if existente:
+            raise AvaliacaoDuplicada()
+
+        db.execute('''
+            INSERT INTO avaliacoes (produto_id, usuario_id, nota, comentario, data_avaliacao)
+            VALUES (?, ?, ?, ?, datetime('now'))
+        ''', (produto_id, usuario_id, nota, comentario))
+
+        coluna = f'nota_{nota}'
+        db.execute(f'''
+            INSERT INTO avaliacoes_resumo (produto_id, total, soma, {coluna})
+            VALUES (?, 1, ?, 1)
+            ON CONFLICT(produto_id) DO UPDATE SET
+                total = total + 1,
+                soma = soma + excluded.soma,
+                {coluna} = {coluna} + 1
+        ''', (produto_id, nota))
+
+
+def recalcular_resumos(db, produto_ids=None):
+    """Recalcula o resumo a partir de avaliacoes (todos os produtos ou só `produto_ids`).
+
+    Usado no backfill e depois de exclusões em massa de avaliações.
+    Retorna o número de produtos com avaliações.
+    """
+    with transacao_escrita(db):
+        return regravar_resumos(db, produto_ids)
+
+
+def regravar_resumos(db, produto_ids=None):
+    """Como recalcular_resumos, dentro da transação de escrita já aberta pelo chamador"""
+    if produto_ids is None:
+        db.execute('DELETE FROM avaliacoes_resumo')
+        return db.execute(_RECALCULO + ' GROUP BY produto_id').rowcount
+
+    produto_ids = list(produto_ids)
+    if not produto_ids:
+        return 0
+    marcadores = ', '.join('?' * len(produto_ids))
+    db.execute(f'DELETE FROM avaliacoes_resumo WHERE produto_id IN ({marcadores})', produto_ids)
+    return db.execute(
+        _RECALCULO + f' WHERE produto_id IN ({marcadores}) GROUP BY produto_id', produto_ids
+    ).rowcount
+
+
+def resumo_produto(db, produto_id):
+    """Média, total e histograma (lista de (nota, quantidade, percentual), da 5 à 1)"""
+    row = db.execute('SELECT * FROM avaliacoes_resumo WHERE produto_id = ?', (produto_id,)).fetchone()
+    total = row['total'] if row else 0
+    histograma = [
+        (nota, row[f'nota_{nota}'] if row else 0,
+         round(100 * row[f'nota_{nota}'] / total) if total else 0)
+        for nota in range(5, 0, -1)
+    ]
+    return {
+        'total': total,
+        'media': round(row['soma'] / total, 1) if total else None,
+        'histograma': histograma,
+    }
@@ -0,0 +1,89 @@
+import re
+from markupsafe import Markup, escape
+
+from avaliacoes import COLUNAS_RESUMO
+from paginacao import Pagina, paginar, POR_PAGINA
+
+# Marcadores usados por snippet()/highlight(); trocados por <mark> após o escape
+_INICIO = '\x02'
+_FIM = '\x03'
+
+_TERMO = re.compile(r'\w+', re.UNICODE)
+
+
+def preparar_consulta(texto):
+    """Converte o texto digitado numa consulta FTS5 de prefixo (todos os termos)
+
+    Cada palavra vira um termo entre aspas com '*', o que neutraliza a
+    sintaxe do FTS5 (AND, NEAR, aspas soltas) digitada pelo usuário.
+    """
+    termos = _TERMO.findall(texto or '')
+    if not termos:
+        return None
+    return ' '.join(f'"{termo}"*' for termo in termos[:10])
+
+
+# Relevância = -bm25 (maior é melhor), com peso 10 para o nome; o id desempata
+_SELECT_BUSCA = f'''
+    SELECT * FROM (
+        SELECT p.*, c.nome as categoria_nome, {COLUNAS_RESUMO},
+               highlight(produtos_fts, 0, '{_INICIO}', '{_FIM}') as nome_destacado,
+               snippet(produtos_fts, 1, '{_INICIO}', '{_FIM}', '…', 16) as trecho,
+               -bm25(produtos_fts, 10.0, 1.0) as relevancia
+        FROM produtos_fts
+        JOIN produtos p ON p.id = produtos_fts.rowid
+        LEFT JOIN categorias c ON p.categoria_id = c.id
+        LEFT JOIN avaliacoes_resumo r ON r.produto_id = p.id
+        WHERE produtos_fts MATCH ? AND p.ativo = 1
+    ) AS busca
+'''
+
+
+def buscar_produtos(db, texto, limite=None):
+    """Busca produtos ativos no índice FTS5, ordenados por relevância (bm25)"""
+    consulta = preparar_consulta(texto)
+    if consulta is None:
+        return []
+
+    query = _SELECT_BUSCA + ' ORDER BY relevancia DESC, id DESC'
+    params = [consulta]
+    if limite:
+        query += ' LIMIT ?'
+        params.append(limite)
+    return db.execute(query, params).fetchall()
+
+
+def paginar_busca(db, texto, cursor=None, direcao='prox', por_pagina=POR_PAGINA):
+    """Resultados da busca em páginas por chave (relevancia, id), sem teto de resultados"""
+    consulta = preparar_consulta(texto)
+    if consulta is None:
+        return Pagina([], por_pagina=por_pagina)
+    return paginar(db, _SELECT_BUSCA, ordem=('relevancia', 'id'), chaves=('relevancia', 'id'),
+                   params=[consulta], cursor=cursor, direcao=direcao, por_pagina=por_pagina)
+
+
+def autocompletar(db, texto, limite=8):
+    """Sugestões de nomes de produtos para o campo de busca"""
+    consulta = preparar_consulta(texto)
+    if consulta is None:
+        return []
+
+    rows = db.execute(f'''
+        SELECT p.id, p.nome,
+               highlight(produtos_fts, 0, '{_INICIO}', '{_FIM}') as nome_destacado
+        FROM produtos_fts
+        JOIN produtos p ON p.id = produtos_fts.rowid
+        WHERE produtos_fts MATCH ? AND p.ativo = 1
+        ORDER BY bm25(produtos_fts, 10.0, 1.0)
+        LIMIT ?
+    ''', (f'{{nome}} : ({consulta})', limite)).fetchall()
+    return [{'id': row['id'], 'nome': row['nome'], 'destaque': str(destacar(row['nome_destacado']))}
+            for row in rows]
+
+
+def destacar(texto):
+    """Filtro Jinja: escapa o texto e converte os marcadores em <mark>"""
+    if not texto:
+        return ''
+    html = str(escape(texto))
+    return Markup(html.replace(_INICIO, '<mark>').replace(_FIM, '</mark>'))
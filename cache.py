@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: incremento sem lock entre processos
+    fcntl = None
+
+from database import DATABASE
+
+# Diretório dos arquivos de versão compartilhados entre os workers
+CACHE_DIR = os.environ.get('VIVANTS_CACHE_DIR', os.path.dirname(DATABASE))
+CACHE_TTL = float(os.environ.get('VIVANTS_CACHE_TTL', 300))
+CACHE_MAX_ITENS = int(os.environ.get('VIVANTS_CACHE_MAX_ITENS', 512))
+
+
+class VersaoCompartilhada:
+    """Contador de versão gravado em arquivo, visível a todos os workers.
+
+    Os leitores verificam o arquivo no máximo a cada `intervalo` segundos;
+    incrementar() invalida os caches de todos os processos.
+    """
+
+    def __init__(self, caminho, intervalo=1.0):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self._valor = None
+        self._mtime = None
+        self._verificado_em = 0.0
+        self._lock = threading.Lock()
+
+    def _ler(self):
+        try:
+            stat = os.stat(self.caminho)
+        except FileNotFoundError:
+            return 0, None
+        if stat.st_mtime_ns == self._mtime and self._valor is not None:
+            return self._valor, self._mtime
+        try:
+            with open(self.caminho) as f:
+                return int(f.read().strip() or 0), stat.st_mtime_ns
+        except (OSError, ValueError):
+            return 0, stat.st_mtime_ns
+
+    def atual(self):
+        agora = time.monotonic()
+        with self._lock:
+            if self._valor is None or agora - self._verificado_em >= self.intervalo:
+                self._valor, self._mtime = self._ler()
+                self._verificado_em = agora
+            return self._valor
+
+    def modificado_em(self):
+        """Timestamp (epoch) da última alteração, ou None se nunca alterada"""
+        self.atual()
+        return self._mtime / 1e9 if self._mtime else None
+
+    def incrementar(self):
+        with self._lock:
+            with open(self.caminho, 'a+') as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                try:
+                    valor = int(f.read().strip() or 0) + 1
+                except ValueError:
+                    valor = 1
+                f.seek(0)
+                f.truncate()
+                f.write(str(valor))
+                f.flush()
+            self._valor, self._mtime = self._ler()
+            self._verificado_em = time.monotonic()
+            return self._valor
+
+
+class CacheTTL:
+    """Cache LRU em memória com expiração por tempo e versão compartilhada opcional"""
+
+    def __init__(self, nome, max_itens=CACHE_MAX_ITENS, ttl=CACHE_TTL, versao=None):
+        self.nome = nome
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.versao = versao
+        self._itens = OrderedDict()   # chave -> (valor, expira_em, versao)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirados': 0, 'invalidacoes': 0}
+
+    def get(self, chave):
+        """Retorna (encontrado, valor)"""
+        versao = self.versao.atual() if self.versao else None
+        agora = time.monotonic()
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                valor, expira_em, versao_item = item
+                if expira_em > agora and versao_item == versao:
+                    self._itens.move_to_end(chave)
+                    self._stats['hits'] += 1
+                    return True, valor
+                del self._itens[chave]
+                self._stats['expirados'] += 1
+            self._stats['misses'] += 1
+            return False, None
+
+    def set(self, chave, valor, ttl=None):
+        versao = self.versao.atual() if self.versao else None
+        expira_em = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._itens[chave] = (valor, expira_em, versao)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def obter(self, chave, carregar, ttl=None):
+        """Leitura com carga: retorna o valor em cache ou chama carregar() e guarda"""
+        encontrado, valor = self.get(chave)
+        if encontrado:
+            return valor
+        valor = carregar()
+        self.set(chave, valor, ttl)
+        return valor
+
+    def descartar(self, chave):
+        """Remove uma chave (só neste processo)"""
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def invalidar_local(self):
+        with self._lock:
+            self._itens.clear()
+            self._stats['invalidacoes'] += 1
+
+    def invalidar_prefixos(self, prefixos):
+        """Descarta (só neste processo) as chaves que começam com algum dos prefixos"""
+        with self._lock:
+            for chave in [c for c in self._itens if c.startswith(tuple(prefixos))]:
+                del self._itens[chave]
+            self._stats['invalidacoes'] += 1
+
+    def invalidar(self):
+        """Limpa este cache e, se houver versão compartilhada, os dos outros workers"""
+        self.invalidar_local()
+        if self.versao:
+            self.versao.incrementar()
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['itens'] = len(self._itens)
+            stats['max_itens'] = self.max_itens
+        if self.versao:
+            stats['versao'] = self.versao.atual()
+        return stats
+
+
+# Versão do catálogo (produtos e categorias), alterada pelas telas de admin
+versao_catalogo = VersaoCompartilhada(os.path.join(CACHE_DIR, '.versao_catalogo'))
+cache_catalogo = CacheTTL('catalogo', versao=versao_catalogo)
+
+
+# Páginas públicas renderizadas para visitantes anônimos (mesma versão do catálogo)
+PAGINA_TTL = float(os.environ.get('VIVANTS_PAGINA_TTL', 120))
+cache_paginas = CacheTTL('paginas', max_itens=CACHE_MAX_ITENS, ttl=PAGINA_TTL, versao=versao_catalogo)
+
+
+def invalidar_catalogo():
+    # Um único incremento de versão invalida os dois caches em todos os workers
+    cache_catalogo.invalidar()
+    cache_paginas.invalidar_local()
+
+
+def cache_stats():
+    return {cache.nome: cache.estatisticas() for cache in (cache_catalogo, cache_paginas)}
@@ -0,0 +1,78 @@
+from database import transacao_escrita
+
+# Carrinho de visitante na sessão: {"<produto_id>": quantidade} (chaves str por causa do JSON)
+CHAVE_SESSAO = 'carrinho'
+
+# Um único comando por item: insere ou soma, só se o total couber no estoque
+# (rowcount 0 = produto inativo/inexistente ou estoque insuficiente)
+_ADICIONAR = '''
+    INSERT INTO carrinho (usuario_id, produto_id, quantidade)
+    SELECT ?, id, ? FROM produtos WHERE id = ? AND ativo = 1 AND estoque >= ?
+    ON CONFLICT(usuario_id, produto_id) DO UPDATE SET quantidade = carrinho.quantidade + excluded.quantidade
+    WHERE carrinho.quantidade + excluded.quantidade <= (
+        SELECT estoque FROM produtos WHERE id = excluded.produto_id)
+'''
+
+# Mesclagem do carrinho de visitante: soma ao que já existe, limitado ao estoque
+_MESCLAR = '''
+    INSERT INTO carrinho (usuario_id, produto_id, quantidade)
+    SELECT ?, id, MIN(?, estoque) FROM produtos WHERE id = ? AND ativo = 1 AND estoque > 0
+    ON CONFLICT(usuario_id, produto_id) DO UPDATE SET quantidade = MIN(
+        carrinho.quantidade + excluded.quantidade,
+        (SELECT estoque FROM produtos WHERE id = excluded.produto_id))
+'''
+
+
+def adicionar_item(db, usuario_id, produto_id, quantidade):
+    """Adiciona ao carrinho do usuário; retorna False se exceder o estoque"""
+    with transacao_escrita(db):
+        return db.execute(_ADICIONAR, (usuario_id, quantidade, produto_id, quantidade)).rowcount > 0
+
+
+def itens_visitante(session):
+    """Carrinho do visitante como {produto_id: quantidade}"""
+    return {int(produto_id): quantidade for produto_id, quantidade in session.get(CHAVE_SESSAO, {}).items()}
+
+
+def gravar_visitante(session, itens):
+    # Reatribui o dicionário inteiro para a sessão perceber a alteração
+    if itens:
+        session[CHAVE_SESSAO] = {str(produto_id): quantidade for produto_id, quantidade in itens.items()}
+    else:
+        session.pop(CHAVE_SESSAO, None)
+
+
+def mesclar_carrinho(db, session, usuario_id):
+    """Move o carrinho do visitante para a tabela carrinho num único lote (login).
+
+    Retorna o número de produtos mesclados.
+    """
+    itens = itens_visitante(session)
+    if not itens:
+        return 0
+    with transacao_escrita(db):
+        db.executemany(_MESCLAR, [
+            (usuario_id, quantidade, produto_id) for produto_id, quantidade in itens.items()
+        ])
+    session.pop(CHAVE_SESSAO, None)
+    return len(itens)
+
+
+def ler_carrinho_visitante(db, session):
+    """Itens do carrinho do visitante no mesmo formato da consulta do carrinho logado"""
+    itens = itens_visitante(session)
+    if not itens:
+        return []
+    linhas = db.execute(f'''
+        SELECT id as produto_id, nome, preco, preco_promocional, imagem, estoque
+        FROM produtos
+        WHERE id IN ({', '.join('?' * len(itens))}) AND ativo = 1
+    ''', list(itens)).fetchall()
+    resultado = []
+    for row in linhas:
+        item = dict(row.items())
+        item['id'] = item['produto_id']
+        item['quantidade'] = itens[item['produto_id']]
+        item['subtotal'] = (item['preco_promocional'] or item['preco']) * item['quantidade']
+        resultado.append(item)
+    return resultado
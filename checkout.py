@@ -0,0 +1,80 @@
+from database import transacao_escrita
+
+
+class CarrinhoVazio(Exception):
+    """O usuário não tem itens no carrinho"""
+
+
+class EstoqueInsuficiente(Exception):
+    """Um ou mais produtos não têm estoque para a quantidade pedida"""
+
+    def __init__(self, conflitos):
+        self.conflitos = conflitos
+        super().__init__(', '.join(
+            f"{c['nome']} (pedido: {c['solicitado']}, disponível: {c['disponivel']})"
+            for c in conflitos
+        ))
+
+
+def _conflitos(itens):
+    return [
+        {
+            'produto_id': item['produto_id'],
+            'nome': item['nome'],
+            'solicitado': item['quantidade'],
+            'disponivel': item['estoque'],
+        }
+        for item in itens
+        if item['quantidade'] > item['estoque']
+    ]
+
+
+def _ler_carrinho(db, usuario_id):
+    # Agrupa por produto: o mesmo produto pode aparecer em mais de uma linha
+    return db.execute('''
+        SELECT c.produto_id, SUM(c.quantidade) as quantidade,
+               p.nome, p.estoque, COALESCE(p.preco_promocional, p.preco) as preco
+        FROM carrinho c
+        JOIN produtos p ON c.produto_id = p.id
+        WHERE c.usuario_id = ?
+        GROUP BY c.produto_id
+    ''', (usuario_id,)).fetchall()
+
+
+def finalizar_compra(db, usuario_id, endereco):
+    """Cria o pedido a partir do carrinho numa única transação de escrita.
+
+    O estoque é conferido e baixado com o lock de escrita do SQLite, então
+    dois compradores concorrentes nunca deixam o estoque negativo. Retorna o
+    id do pedido; levanta CarrinhoVazio ou EstoqueInsuficiente (com rollback).
+    """
+    with transacao_escrita(db):
+        itens = _ler_carrinho(db, usuario_id)
+        if not itens:
+            raise CarrinhoVazio()
+
+        conflitos = _conflitos(itens)
+        if conflitos:
+            raise EstoqueInsuficiente(conflitos)
+
+        # A leitura acima e a baixa abaixo estão na mesma transação BEGIN IMMEDIATE:
+        # nenhum outro escritor (deste ou de outro processo) altera o estoque no meio
+        db.executemany(
+            'UPDATE produtos SET estoque = estoque - ? WHERE id = ?',
+            [(item['quantidade'], item['produto_id']) for item in itens]
+        )
+
+        total = sum(item['preco'] * item['quantidade'] for item in itens)
+        pedido_id = db.execute('''
+            INSERT INTO pedidos (usuario_id, total, endereco_entrega, status, data_pedido)
+            VALUES (?, ?, ?, ?, datetime('now'))
+        ''', (usuario_id, total, endereco, 'pendente')).lastrowid
+
+        db.executemany('''
+            INSERT INTO itens_pedido (pedido_id, produto_id, quantidade, preco_unitario)
+            VALUES (?, ?, ?, ?)
+        ''', [(pedido_id, item['produto_id'], item['quantidade'], item['preco']) for item in itens])
+
+        db.execute('DELETE FROM carrinho WHERE usuario_id = ?', (usuario_id,))
+
+    return pedido_id
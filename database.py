@@ -1,10 +1,912 @@
+import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from flask import g, has_app_context
 from werkzeug.security import generate_password_hash
 
+try:
+    import fcntl
+except ImportError:  # Windows: um único processo de desenvolvimento, sem lock entre workers
+    fcntl = None
+
+# Caminho do banco (pode ser sobrescrito por variável de ambiente)
+DATABASE = os.environ.get(
+    'VIVANTS_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vivants.db')
+)
+
+# Configurações do pool (um pool por processo/worker do gunicorn)
+POOL_SIZE = int(os.environ.get('VIVANTS_DB_POOL_SIZE', 5))
+POOL_TIMEOUT = float(os.environ.get('VIVANTS_DB_POOL_TIMEOUT', 10))
+POOL_RECYCLE = float(os.environ.get('VIVANTS_DB_POOL_RECYCLE', 3600))
+POOL_PING_AFTER = float(os.environ.get('VIVANTS_DB_POOL_PING_AFTER', 30))
+
+# Cria/migra o banco na subida da aplicação (VIVANTS_MIGRAR=0 deixa só para 'flask migrar')
+MIGRAR_NA_SUBIDA = os.environ.get('VIVANTS_MIGRAR', '1') != '0'
+
+# PRAGMAs aplicados a cada conexão nova. WAL permite leituras concorrentes
+# com um escritor; synchronous=NORMAL é seguro em WAL e evita fsync por commit.
+BUSY_TIMEOUT_MS = int(os.environ.get('VIVANTS_DB_BUSY_TIMEOUT_MS', 5000))
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}',
+    'PRAGMA cache_size = -16000',       # ~16MB por conexão
+    'PRAGMA mmap_size = 134217728',     # 128MB
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+# -----------------------
+# Materialização de linhas
+# -----------------------
+_FORMATOS_DATA_BR = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y')
+
+
+def converter_data(valor):
+    """Converte texto de data do SQLite em datetime (mantém o valor se não for data)"""
+    if not isinstance(valor, str):
+        return valor
+    try:
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        pass
+    for fmt in _FORMATOS_DATA_BR:
+        try:
+            return datetime.strptime(valor, fmt)
+        except ValueError:
+            continue
+    return valor
+
+
+class Layout:
+    """Nomes das colunas de um cursor e quais delas contêm datas (calculado uma vez)"""
+
+    __slots__ = ('colunas', 'indice', 'datas')
+
+    def __init__(self, description, colunas_data=frozenset()):
+        self.colunas = tuple(d[0] for d in description)
+        self.indice = {nome: i for i, nome in enumerate(self.colunas)}
+        self.datas = tuple(i for i, nome in enumerate(self.colunas) if nome in colunas_data)
+
+
+class Registro:
+    """Linha compacta (lista de valores + layout compartilhado) com interface de dicionário"""
+
+    __slots__ = ('_layout', '_valores')
+
+    def __init__(self, layout, valores):
+        self._layout = layout
+        self._valores = valores
+
+    def __getitem__(self, chave):
+        if isinstance(chave, str):
+            return self._valores[self._layout.indice[chave]]
+        return self._valores[chave]
+
+    def __setitem__(self, chave, valor):
+        self._valores[self._layout.indice[chave] if isinstance(chave, str) else chave] = valor
+
+    def __contains__(self, chave):
+        return chave in self._layout.indice
+
+    def __len__(self):
+        return len(self._valores)
+
+    def __eq__(self, outro):
+        if isinstance(outro, Registro):
+            return self._layout.colunas == outro._layout.colunas and self._valores == outro._valores
+        return NotImplemented
+
+    def __repr__(self):
+        return f'Registro({dict(self.items())!r})'
+
+    def get(self, chave, padrao=None):
+        i = self._layout.indice.get(chave)
+        return padrao if i is None else self._valores[i]
+
+    def keys(self):
+        return self._layout.colunas
+
+    def values(self):
+        return list(self._valores)
+
+    def items(self):
+        return zip(self._layout.colunas, self._valores)
+
+
+# Tipos declarados no schema que o registro_factory converte em datetime
+TIPOS_DATA = ('TIMESTAMP', 'DATETIME', 'DATE')
+
+_layouts = {}
+_ultimo_layout = (None, None)
+_colunas_data = None
+
+
+def colunas_data(conn):
+    """Nomes das colunas declaradas com tipo de data em alguma tabela (lido do schema uma vez)
+
+    O sqlite3 do Python não expõe o tipo declarado de cada coluna do cursor;
+    o nome da coluna no resultado é procurado nesse conjunto.
+    """
+    global _colunas_data
+    if _colunas_data is None:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        _colunas_data = frozenset(nome for (nome,) in cursor.execute(f'''
+            SELECT DISTINCT c.name FROM sqlite_master m, pragma_table_info(m.name) c
+            WHERE m.type = 'table' AND upper(c.type) IN ({', '.join('?' * len(TIPOS_DATA))})
+        ''', TIPOS_DATA))
+    return _colunas_data
+
+
+def limpar_layouts():
+    """Descarta os layouts e as colunas de data em cache (o schema mudou)"""
+    global _colunas_data, _ultimo_layout
+    _colunas_data = None
+    _ultimo_layout = (None, None)
+    _layouts.clear()
+
+
+def registro_factory(cursor, row):
+    """row_factory: monta Registros convertendo só as colunas de data"""
+    global _ultimo_layout
+    description = cursor.description
+    ultimo_description, layout = _ultimo_layout
+    if description is not ultimo_description:
+        chave = tuple(d[0] for d in description)
+        layout = _layouts.get(chave)
+        if layout is None:
+            layout = _layouts[chave] = Layout(description, colunas_data(cursor.connection))
+        _ultimo_layout = (description, layout)
+
+    valores = list(row)
+    for i in layout.datas:
+        valor = valores[i]
+        if valor.__class__ is str:
+            valores[i] = converter_data(valor)
+    return Registro(layout, valores)
+
+
+def configurar_conexao(conn):
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+
+class FilaEscrita:
+    """Fila FIFO que serializa os escritores deste processo.
+
+    Os escritores esperam a vez aqui, sem segurar nenhum lock do SQLite;
+    em WAL os leitores continuam livres enquanto um único escritor trabalha.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._proxima_senha = 0
+        self._atendendo = 0
+
+    @contextmanager
+    def vez(self):
+        with self._cond:
+            senha = self._proxima_senha
+            self._proxima_senha += 1
+            while senha != self._atendendo:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._atendendo += 1
+                self._cond.notify_all()
+
+    def aguardando(self):
+        with self._cond:
+            return self._proxima_senha - self._atendendo
+
+
+fila_escrita = FilaEscrita()
+
+
+class TransacaoPendente(sqlite3.ProgrammingError):
+    """transacao_escrita chamada com uma transação já aberta na conexão"""
+
+
+@contextmanager
+def transacao_escrita(db):
+    """Executa o bloco numa transação BEGIN IMMEDIATE, um escritor por vez.
+
+    Faz commit ao sair normalmente e rollback se ocorrer exceção. Uma
+    transação já aberta na conexão é erro: confirmá-la aqui gravaria
+    trabalho do chamador fora da fila de escrita.
+    """
+    if db.in_transaction:
+        raise TransacaoPendente('Conexão com transação pendente; escritas devem passar por transacao_escrita')
+    with fila_escrita.vez():
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.rollback()
+            raise
+        else:
+            db.commit()
+
+
+class PoolEsgotado(sqlite3.OperationalError):
+    """Nenhuma conexão livre dentro do tempo limite do pool"""
+
+
+class ConexaoPool:
+    """Conexão emprestada do pool; close() devolve ao pool em vez de fechar.
+
+    A conexão do request (do_request=True) ignora close(): as views podem
+    chamá-lo à vontade e a devolução acontece só no teardown (devolver()).
+    """
+
+    def __init__(self, pool, conn, do_request=False):
+        self._pool = pool
+        self._conn = conn
+        self.do_request = do_request
+
+    def __getattr__(self, nome):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Conexão já devolvida ao pool')
+        return getattr(self._conn, nome)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    @property
+    def devolvida(self):
+        return self._conn is None
+
+    def close(self):
+        if not self.do_request:
+            self.devolver()
+
+    def devolver(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.devolver(conn)
+
+
+class PoolConexoes:
+    """Pool limitado e thread-safe de conexões SQLite"""
+
+    def __init__(self, database, tamanho=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 recycle=POOL_RECYCLE, ping_after=POOL_PING_AFTER):
+        self.database = database
+        self.tamanho = tamanho
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._livres = []          # [(conn, criada_em, devolvida_em)]
+        self._criada_em = {}       # id(conn) -> timestamp de criação
+        self._em_uso = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'emprestimos': 0,
+            'criadas': 0,
+            'recicladas': 0,
+            'descartadas': 0,
+            'esperas': 0,
+            'timeouts': 0,
+            'espera_total': 0.0,
+            'espera_max': 0.0,
+        }
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.database, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = registro_factory
+        configurar_conexao(conn)
+        return conn
+
+    def _saudavel(self, conn, criada_em, devolvida_em, agora):
+        """Verifica idade e, se ficou ociosa por muito tempo, faz um ping"""
+        if self.recycle and agora - criada_em > self.recycle:
+            self._stats['recicladas'] += 1
+            return False
+        if agora - devolvida_em > self.ping_after:
+            try:
+                conn.execute('SELECT 1').fetchone()
+            except sqlite3.Error:
+                self._stats['descartadas'] += 1
+                return False
+        return True
+
+    def emprestar(self):
+        inicio = time.monotonic()
+        limite = inicio + self.timeout
+        with self._cond:
+            esperou = False
+            while not self._livres and self._em_uso >= self.tamanho:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolEsgotado(
+                        f'Pool esgotado: {self._em_uso} conexões em uso (limite {self.tamanho})'
+                    )
+                esperou = True
+                self._cond.wait(restante)
+
+            espera = time.monotonic() - inicio
+            self._stats['emprestimos'] += 1
+            self._stats['espera_total'] += espera
+            self._stats['espera_max'] = max(self._stats['espera_max'], espera)
+            if esperou:
+                self._stats['esperas'] += 1
+
+            agora = time.monotonic()
+            while self._livres:
+                conn, criada_em, devolvida_em = self._livres.pop()
+                if self._saudavel(conn, criada_em, devolvida_em, agora):
+                    self._em_uso += 1
+                    return ConexaoPool(self, conn)
+                self._fechar(conn)
+
+            # Nenhuma conexão livre reaproveitável: cria uma nova
+            self._em_uso += 1
+        try:
+            conn = self._conectar()
+        except Exception:
+            with self._cond:
+                self._em_uso -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['criadas'] += 1
+            self._criada_em[id(conn)] = time.monotonic()
+        return ConexaoPool(self, conn)
+
+    def devolver(self, conn):
+        # Descarta transação esquecida aberta para não vazar para o próximo request
+        reutilizavel = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            reutilizavel = False
+
+        with self._cond:
+            self._em_uso -= 1
+            if reutilizavel:
+                criada_em = self._criada_em.get(id(conn), time.monotonic())
+                self._livres.append((conn, criada_em, time.monotonic()))
+            else:
+                self._stats['descartadas'] += 1
+                self._fechar(conn)
+            self._cond.notify()
+
+    def _fechar(self, conn):
+        self._criada_em.pop(id(conn), None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def fechar_todas(self):
+        with self._cond:
+            while self._livres:
+                self._fechar(self._livres.pop()[0])
+
+    def estatisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['em_uso'] = self._em_uso
+            stats['livres'] = len(self._livres)
+            stats['tamanho'] = self.tamanho
+            stats['escritores_aguardando'] = fila_escrita.aguardando()
+            stats['espera_media'] = (
+                stats['espera_total'] / stats['emprestimos'] if stats['emprestimos'] else 0.0
+            )
+        return stats
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Retorna o pool do processo atual (recriado após o fork do gunicorn)"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = PoolConexoes(DATABASE)
+                _pool_pid = pid
+    return _pool
+
+
+def pool_stats():
+    return get_pool().estatisticas()
+
+
 def get_db():
-    conn = sqlite3.connect('vivants.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Retorna a conexão do request atual, emprestada do pool uma única vez por request.
+
+    Fora de um contexto de aplicação Flask, empresta uma conexão avulsa que
+    close() devolve ao pool. A do request só volta ao pool no teardown.
+    """
+    if not has_app_context():
+        return get_pool().emprestar()
+
+    db = g.get('_db')
+    if db is None or db.devolvida:
+        db = g._db = get_pool().emprestar()
+        db.do_request = True
+    return db
+
+
+def close_db(e=None):
+    """Devolve ao pool a conexão do request (registrada no teardown)"""
+    db = g.pop('_db', None)
+    if db is not None:
+        db.devolver()
+
+
+def init_app(app):
+    if MIGRAR_NA_SUBIDA:
+        preparar_banco()
+    app.teardown_appcontext(close_db)
+
+def _tarefas_processo(conn):
+    # ALTER TABLE ... ADD COLUMN não tem IF NOT EXISTS
+    colunas = {row[1] for row in conn.execute('PRAGMA table_info(tarefas)')}
+    if 'processo' not in colunas:
+        conn.execute('ALTER TABLE tarefas ADD COLUMN processo TEXT')
+
+def _relacionados_invalidacoes(conn):
+    colunas = {row[1] for row in conn.execute('PRAGMA table_info(indices_estado)')}
+    if 'invalidacoes' not in colunas:
+        conn.execute('ALTER TABLE indices_estado ADD COLUMN invalidacoes INTEGER NOT NULL DEFAULT 0')
+    # Pedido já contado no índice que foi cancelado (ou reativado) ou excluído:
+    # a coocorrência não é subtraída, a próxima atualização refaz o índice inteiro
+    for comando in _comandos('''
+        CREATE TRIGGER IF NOT EXISTS relacionados_pedidos_au_status AFTER UPDATE OF status ON pedidos
+        WHEN (COALESCE(old.status, '') = 'cancelado') IS NOT (COALESCE(new.status, '') = 'cancelado') BEGIN
+            UPDATE indices_estado SET invalidacoes = invalidacoes + 1
+            WHERE nome = 'relacionados' AND old.id <= marca;
+        END;
+        CREATE TRIGGER IF NOT EXISTS relacionados_pedidos_ad AFTER DELETE ON pedidos
+        WHEN COALESCE(old.status, '') != 'cancelado' BEGIN
+            UPDATE indices_estado SET invalidacoes = invalidacoes + 1
+            WHERE nome = 'relacionados' AND old.id <= marca;
+        END;
+    '''):
+        conn.execute(comando)
+
+# Migrações versionadas, aplicadas em ordem por migrar_db(). Cada passo é um
+# script SQL (ou função que recebe a conexão) e deve ser idempotente.
+MIGRACOES = [
+    (1, 'Índices das consultas mais frequentes', '''
+        CREATE INDEX IF NOT EXISTS idx_produtos_ativo_destaque ON produtos(ativo, destaque);
+        CREATE INDEX IF NOT EXISTS idx_produtos_categoria_ativo ON produtos(categoria_id, ativo);
+        CREATE INDEX IF NOT EXISTS idx_produtos_ativo_cadastro ON produtos(ativo, data_cadastro);
+        CREATE INDEX IF NOT EXISTS idx_produtos_cadastro ON produtos(data_cadastro);
+        CREATE INDEX IF NOT EXISTS idx_carrinho_usuario_produto ON carrinho(usuario_id, produto_id);
+        CREATE INDEX IF NOT EXISTS idx_carrinho_produto ON carrinho(produto_id);
+        CREATE INDEX IF NOT EXISTS idx_pedidos_usuario_data ON pedidos(usuario_id, data_pedido);
+        CREATE INDEX IF NOT EXISTS idx_pedidos_status ON pedidos(status);
+        CREATE INDEX IF NOT EXISTS idx_pedidos_data ON pedidos(data_pedido);
+        CREATE INDEX IF NOT EXISTS idx_itens_pedido_pedido ON itens_pedido(pedido_id);
+        CREATE INDEX IF NOT EXISTS idx_itens_pedido_produto ON itens_pedido(produto_id);
+        CREATE INDEX IF NOT EXISTS idx_avaliacoes_produto_data ON avaliacoes(produto_id, data_avaliacao);
+        CREATE INDEX IF NOT EXISTS idx_avaliacoes_usuario ON avaliacoes(usuario_id, data_avaliacao);
+        CREATE INDEX IF NOT EXISTS idx_usuarios_tipo_cadastro ON usuarios(tipo, data_cadastro);
+        CREATE INDEX IF NOT EXISTS idx_categorias_ativo ON categorias(ativo);
+    '''),
+    (2, 'Busca textual de produtos (FTS5)', '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS produtos_fts USING fts5(
+            nome, descricao,
+            content='produtos', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS produtos_fts_ai AFTER INSERT ON produtos BEGIN
+            INSERT INTO produtos_fts (rowid, nome, descricao)
+            VALUES (new.id, new.nome, new.descricao);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS produtos_fts_ad AFTER DELETE ON produtos BEGIN
+            INSERT INTO produtos_fts (produtos_fts, rowid, nome, descricao)
+            VALUES ('delete', old.id, old.nome, old.descricao);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS produtos_fts_au AFTER UPDATE OF nome, descricao ON produtos BEGIN
+            INSERT INTO produtos_fts (produtos_fts, rowid, nome, descricao)
+            VALUES ('delete', old.id, old.nome, old.descricao);
+            INSERT INTO produtos_fts (rowid, nome, descricao)
+            VALUES (new.id, new.nome, new.descricao);
+        END;
+
+        INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild');
+    '''),
+    (3, 'Índice para paginação do catálogo por categoria', '''
+        CREATE INDEX IF NOT EXISTS idx_produtos_categoria_ativo_cadastro
+            ON produtos(categoria_id, ativo, data_cadastro);
+    '''),
+    (4, 'Fila de tarefas em segundo plano (relatórios)', '''
+        CREATE TABLE IF NOT EXISTS tarefas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            parametros TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pendente',
+            progresso INTEGER NOT NULL DEFAULT 0,
+            mensagem TEXT,
+            arquivo TEXT,
+            erro TEXT,
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_inicio TIMESTAMP,
+            data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            data_conclusao TIMESTAMP
+        );
+
+        -- Uma única tarefa ativa por chave: pedidos repetidos se juntam a ela
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_tarefas_chave_ativa
+            ON tarefas(chave) WHERE status IN ('pendente', 'executando');
+        CREATE INDEX IF NOT EXISTS idx_tarefas_data ON tarefas(data_criacao);
+    '''),
+    (5, 'Estatísticas de vendas materializadas, mantidas por triggers', '''
+        CREATE TABLE IF NOT EXISTS estatisticas (
+            chave TEXT PRIMARY KEY,
+            valor REAL NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS vendas_status (
+            status TEXT PRIMARY KEY,
+            pedidos INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS vendas_dia (
+            dia TEXT NOT NULL,
+            status TEXT NOT NULL,
+            pedidos INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, status)
+        );
+
+        CREATE TABLE IF NOT EXISTS vendas_categoria (
+            categoria_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            itens INTEGER NOT NULL DEFAULT 0,
+            receita REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (categoria_id, status)
+        );
+
+        -- Contadores simples
+        CREATE TRIGGER IF NOT EXISTS estat_produtos_ai AFTER INSERT ON produtos WHEN new.ativo = 1 BEGIN
+            UPDATE estatisticas SET valor = valor + 1 WHERE chave = 'produtos_ativos';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS estat_produtos_au_ativo AFTER UPDATE OF ativo ON produtos
+        WHEN (old.ativo = 1) IS NOT (new.ativo = 1) BEGIN
+            UPDATE estatisticas SET valor = valor + (new.ativo = 1) - (old.ativo = 1) WHERE chave = 'produtos_ativos';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS estat_usuarios_ai AFTER INSERT ON usuarios WHEN new.tipo = 'cliente' BEGIN
+            UPDATE estatisticas SET valor = valor + 1 WHERE chave = 'clientes';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS estat_usuarios_ad AFTER DELETE ON usuarios WHEN old.tipo = 'cliente' BEGIN
+            UPDATE estatisticas SET valor = valor - 1 WHERE chave = 'clientes';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS estat_usuarios_au_tipo AFTER UPDATE OF tipo ON usuarios
+        WHEN (old.tipo = 'cliente') IS NOT (new.tipo = 'cliente') BEGIN
+            UPDATE estatisticas SET valor = valor + (new.tipo = 'cliente') - (old.tipo = 'cliente') WHERE chave = 'clientes';
+        END;
+
+        -- Pedidos por status e por dia
+        CREATE TRIGGER IF NOT EXISTS estat_pedidos_ai AFTER INSERT ON pedidos BEGIN
+            INSERT INTO vendas_status (status, pedidos, total)
+            VALUES (COALESCE(new.status, 'pendente'), 1, new.total)
+            ON CONFLICT(status) DO UPDATE SET pedidos = pedidos + excluded.pedidos, total = total + excluded.total;
+            INSERT INTO vendas_dia (dia, status, pedidos, total)
+            VALUES (COALESCE(date(new.data_pedido), ''), COALESCE(new.status, 'pendente'), 1, new.total)
+            ON CONFLICT(dia, status) DO UPDATE SET pedidos = pedidos + excluded.pedidos, total = total + excluded.total;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS estat_pedidos_ad AFTER DELETE ON pedidos BEGIN
+            INSERT INTO vendas_status (status, pedidos, total)
+            VALUES (COALESCE(old.status, 'pendente'), -1, -old.total)
+            ON CONFLICT(status) DO UPDATE SET pedidos = pedidos + excluded.pedidos, total = total + excluded.total;
+            INSERT INTO vendas_dia (dia, status, pedidos, total)
+            VALUES (COALESCE(date(old.data_pedido), ''), COALESCE(old.status, 'pendente'), -1, -old.total)
+            ON CONFLICT(dia, status) DO UPDATE SET pedidos = pedidos + excluded.pedidos, total = total + excluded.total;
+            -- Itens que ainda existirem deixam de contar (o pedido já não existe)
+            INSERT INTO vendas_categoria (categoria_id, status, itens, receita)
+            SELECT COALESCE(p.categoria_id, 0), COALESCE(old.status, 'pendente'),
+                   -SUM(i.quantidade), -SUM(i.quantidade * i.preco_unitario)
+            FROM itens_pedido i LEFT JOIN produtos p ON p.id = i.produto_id
+            WHERE i.pedido_id = old.id
+            GROUP BY COALESCE(p.categoria_id, 0)
+            ON CONFLICT(categoria_id, status) DO UPDATE SET itens = itens + excluded.itens, receita = receita + excluded.receita;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS estat_pedidos_au AFTER UPDATE OF status, total, data_pedido ON pedidos BEGIN
+            INSERT INTO vendas_status (status, pedidos, total)
+            VALUES (COALESCE(old.status, 'pendente'), -1, -old.total)
+            ON CONFLICT(status) DO UPDATE SET pedidos = pedidos + excluded.pedidos, total = total + excluded.total;
+            INSERT INTO vendas_status (status, pedidos, total)
+            VALUES (COALESCE(new.status, 'pendente'), 1, new.total)
+            ON CONFLICT(status) DO UPDATE SET pedidos = pedidos + excluded.pedidos, total = total + excluded.total;
+            INSERT INTO vendas_dia (dia, status, pedidos, total)
+            VALUES (COALESCE(date(old.data_pedido), ''), COALESCE(old.status, 'pendente'), -1, -old.total)
+            ON CONFLICT(dia, status) DO UPDATE SET pedidos = pedidos + excluded.pedidos, total = total + excluded.total;
+            INSERT INTO vendas_dia (dia, status, pedidos, total)
+            VALUES (COALESCE(date(new.data_pedido), ''), COALESCE(new.status, 'pendente'), 1, new.total)
+            ON CONFLICT(dia, status) DO UPDATE SET pedidos = pedidos + excluded.pedidos, total = total + excluded.total;
+        END;
+
+        -- Receita por categoria: muda de status junto com o pedido
+        CREATE TRIGGER IF NOT EXISTS estat_pedidos_au_status AFTER UPDATE OF status ON pedidos
+        WHEN old.status IS NOT new.status BEGIN
+            INSERT INTO vendas_categoria (categoria_id, status, itens, receita)
+            SELECT COALESCE(p.categoria_id, 0), st.status, st.sinal * SUM(i.quantidade),
+                   st.sinal * SUM(i.quantidade * i.preco_unitario)
+            FROM itens_pedido i
+            LEFT JOIN produtos p ON p.id = i.produto_id
+            JOIN (SELECT COALESCE(old.status, 'pendente') AS status, -1 AS sinal
+                  UNION ALL SELECT COALESCE(new.status, 'pendente'), 1) AS st
+            WHERE i.pedido_id = new.id
+            GROUP BY COALESCE(p.categoria_id, 0), st.status
+            ON CONFLICT(categoria_id, status) DO UPDATE SET itens = itens + excluded.itens, receita = receita + excluded.receita;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS estat_itens_ai AFTER INSERT ON itens_pedido BEGIN
+            INSERT INTO vendas_categoria (categoria_id, status, itens, receita)
+            SELECT COALESCE((SELECT categoria_id FROM produtos WHERE id = new.produto_id), 0),
+                   COALESCE(pe.status, 'pendente'), new.quantidade, new.quantidade * new.preco_unitario
+            FROM pedidos pe
+            WHERE pe.id = new.pedido_id
+            ON CONFLICT(categoria_id, status) DO UPDATE SET itens = itens + excluded.itens, receita = receita + excluded.receita;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS estat_itens_ad AFTER DELETE ON itens_pedido BEGIN
+            INSERT INTO vendas_categoria (categoria_id, status, itens, receita)
+            SELECT COALESCE((SELECT categoria_id FROM produtos WHERE id = old.produto_id), 0),
+                   COALESCE(pe.status, 'pendente'), -old.quantidade, -old.quantidade * old.preco_unitario
+            FROM pedidos pe
+            WHERE pe.id = old.pedido_id
+            ON CONFLICT(categoria_id, status) DO UPDATE SET itens = itens + excluded.itens, receita = receita + excluded.receita;
+        END;
+
+        -- Produto que troca de categoria (ou é excluído) leva as vendas junto
+        CREATE TRIGGER IF NOT EXISTS estat_produtos_au_categoria AFTER UPDATE OF categoria_id ON produtos
+        WHEN old.categoria_id IS NOT new.categoria_id BEGIN
+            INSERT INTO vendas_categoria (categoria_id, status, itens, receita)
+            SELECT cat.categoria_id, COALESCE(pe.status, 'pendente'), cat.sinal * SUM(i.quantidade),
+                   cat.sinal * SUM(i.quantidade * i.preco_unitario)
+            FROM itens_pedido i
+            JOIN pedidos pe ON pe.id = i.pedido_id
+            JOIN (SELECT COALESCE(old.categoria_id, 0) AS categoria_id, -1 AS sinal
+                  UNION ALL SELECT COALESCE(new.categoria_id, 0), 1) AS cat
+            WHERE i.produto_id = new.id
+            GROUP BY cat.categoria_id, COALESCE(pe.status, 'pendente')
+            ON CONFLICT(categoria_id, status) DO UPDATE SET itens = itens + excluded.itens, receita = receita + excluded.receita;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS estat_produtos_ad AFTER DELETE ON produtos BEGIN
+            UPDATE estatisticas SET valor = valor - 1 WHERE chave = 'produtos_ativos' AND old.ativo = 1;
+            INSERT INTO vendas_categoria (categoria_id, status, itens, receita)
+            SELECT cat.categoria_id, COALESCE(pe.status, 'pendente'), cat.sinal * SUM(i.quantidade),
+                   cat.sinal * SUM(i.quantidade * i.preco_unitario)
+            FROM itens_pedido i
+            JOIN pedidos pe ON pe.id = i.pedido_id
+            JOIN (SELECT COALESCE(old.categoria_id, 0) AS categoria_id, -1 AS sinal
+                  UNION ALL SELECT 0, 1) AS cat
+            WHERE i.produto_id = old.id AND COALESCE(old.categoria_id, 0) != 0
+            GROUP BY cat.categoria_id, COALESCE(pe.status, 'pendente')
+            ON CONFLICT(categoria_id, status) DO UPDATE SET itens = itens + excluded.itens, receita = receita + excluded.receita;
+        END;
+
+        -- Carga inicial a partir dos dados existentes
+        INSERT OR REPLACE INTO estatisticas (chave, valor)
+        SELECT 'produtos_ativos', COUNT(*) FROM produtos WHERE ativo = 1
+        UNION ALL
+        SELECT 'clientes', COUNT(*) FROM usuarios WHERE tipo = 'cliente';
+
+        INSERT OR REPLACE INTO vendas_status (status, pedidos, total)
+        SELECT COALESCE(status, 'pendente'), COUNT(*), SUM(total) FROM pedidos GROUP BY 1;
+
+        INSERT OR REPLACE INTO vendas_dia (dia, status, pedidos, total)
+        SELECT COALESCE(date(data_pedido), ''), COALESCE(status, 'pendente'), COUNT(*), SUM(total)
+        FROM pedidos GROUP BY 1, 2;
+
+        INSERT OR REPLACE INTO vendas_categoria (categoria_id, status, itens, receita)
+        SELECT COALESCE(p.categoria_id, 0), COALESCE(pe.status, 'pendente'),
+               SUM(i.quantidade), SUM(i.quantidade * i.preco_unitario)
+        FROM itens_pedido i
+        JOIN pedidos pe ON pe.id = i.pedido_id
+        LEFT JOIN produtos p ON p.id = i.produto_id
+        GROUP BY 1, 2;
+    '''),
+    (6, 'Resumo de avaliações por produto (contagem, soma e histograma)', '''
+        CREATE TABLE IF NOT EXISTS avaliacoes_resumo (
+            produto_id INTEGER PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            soma INTEGER NOT NULL DEFAULT 0,
+            nota_1 INTEGER NOT NULL DEFAULT 0,
+            nota_2 INTEGER NOT NULL DEFAULT 0,
+            nota_3 INTEGER NOT NULL DEFAULT 0,
+            nota_4 INTEGER NOT NULL DEFAULT 0,
+            nota_5 INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (produto_id) REFERENCES produtos(id)
+        );
+
+        INSERT OR REPLACE INTO avaliacoes_resumo
+            (produto_id, total, soma, nota_1, nota_2, nota_3, nota_4, nota_5)
+        SELECT produto_id, COUNT(*), SUM(nota),
+               SUM(nota = 1), SUM(nota = 2), SUM(nota = 3), SUM(nota = 4), SUM(nota = 5)
+        FROM avaliacoes
+        GROUP BY produto_id;
+    '''),
+    (7, 'Índice de produtos comprados juntos (coocorrência)', '''
+        -- Matriz esparsa simétrica produto x produto; a diagonal guarda quantos
+        -- pedidos contêm o produto
+        CREATE TABLE IF NOT EXISTS coocorrencias (
+            produto_a INTEGER NOT NULL,
+            produto_b INTEGER NOT NULL,
+            pedidos INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (produto_a, produto_b)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS produtos_relacionados (
+            produto_id INTEGER NOT NULL,
+            relacionado_id INTEGER NOT NULL,
+            pontuacao REAL NOT NULL,
+            PRIMARY KEY (produto_id, relacionado_id)
+        ) WITHOUT ROWID;
+
+        -- Marca d'água (último pedido processado) dos índices atualizados em lote
+        CREATE TABLE IF NOT EXISTS indices_estado (
+            nome TEXT PRIMARY KEY,
+            marca INTEGER NOT NULL DEFAULT 0,
+            data_atualizacao TIMESTAMP
+        );
+    '''),
+    (8, 'Índice de referências a imagens (armazenamento por conteúdo)', '''
+        CREATE INDEX IF NOT EXISTS idx_produtos_imagem ON produtos(imagem) WHERE imagem IS NOT NULL;
+    '''),
+    (9, 'Sessões no servidor (cookie leva só o id)', '''
+        -- dados: JSON do serializador de sessão do Flask; expira: epoch em segundos
+        CREATE TABLE IF NOT EXISTS sessoes (
+            id TEXT PRIMARY KEY,
+            dados TEXT NOT NULL,
+            expira REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_sessoes_expira ON sessoes(expira);
+    '''),
+    (10, 'Um item de carrinho por usuário e produto (UNIQUE para o upsert)', '''
+        -- Junta as linhas repetidas na de menor id antes de criar a restrição
+        UPDATE carrinho SET quantidade = (
+            SELECT SUM(c2.quantidade) FROM carrinho c2
+            WHERE c2.usuario_id = carrinho.usuario_id AND c2.produto_id = carrinho.produto_id
+        )
+        WHERE id IN (SELECT MIN(id) FROM carrinho GROUP BY usuario_id, produto_id HAVING COUNT(*) > 1);
+        DELETE FROM carrinho WHERE id NOT IN (SELECT MIN(id) FROM carrinho GROUP BY usuario_id, produto_id);
+        DROP INDEX IF EXISTS idx_carrinho_usuario_produto;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_carrinho_usuario_produto_unico ON carrinho(usuario_id, produto_id);
+    '''),
+    # processo: "host:pid" de quem segura a tarefa, para reconhecer tarefas órfãs
+    (11, 'Processo dono de cada tarefa em segundo plano', _tarefas_processo),
+    (12, 'Índice de relacionados invalidado por pedidos cancelados ou excluídos', _relacionados_invalidacoes),
+    (13, 'Índice do alerta de estoque baixo do dashboard', '''
+        CREATE INDEX IF NOT EXISTS idx_produtos_ativo_estoque ON produtos(ativo, estoque);
+    '''),
+    (14, 'Triggers de estatísticas seguros para valores NULL', '''
+        -- Contadores: (NULL = 1) é NULL e zerava o valor; IS sempre dá 0 ou 1
+        DROP TRIGGER IF EXISTS estat_produtos_au_ativo;
+        CREATE TRIGGER estat_produtos_au_ativo AFTER UPDATE OF ativo ON produtos
+        WHEN (old.ativo IS 1) != (new.ativo IS 1) BEGIN
+            UPDATE estatisticas SET valor = valor + (new.ativo IS 1) - (old.ativo IS 1) WHERE chave = 'produtos_ativos';
+        END;
+
+        DROP TRIGGER IF EXISTS estat_usuarios_au_tipo;
+        CREATE TRIGGER estat_usuarios_au_tipo AFTER UPDATE OF tipo ON usuarios
+        WHEN (old.tipo IS 'cliente') != (new.tipo IS 'cliente') BEGIN
+            UPDATE estatisticas SET valor = valor + (new.tipo IS 'cliente') - (old.tipo IS 'cliente') WHERE chave = 'clientes';
+        END;
+
+        -- NULL conta como 'pendente' (status) e como 0 (categoria): 'pendente' -> NULL
+        -- passava no WHEN e as duas linhas do sinal caíam no mesmo grupo
+        DROP TRIGGER IF EXISTS estat_pedidos_au_status;
+        CREATE TRIGGER estat_pedidos_au_status AFTER UPDATE OF status ON pedidos
+        WHEN COALESCE(old.status, 'pendente') != COALESCE(new.status, 'pendente') BEGIN
+            INSERT INTO vendas_categoria (categoria_id, status, itens, receita)
+            SELECT COALESCE(p.categoria_id, 0), st.status, st.sinal * SUM(i.quantidade),
+                   st.sinal * SUM(i.quantidade * i.preco_unitario)
+            FROM itens_pedido i
+            LEFT JOIN produtos p ON p.id = i.produto_id
+            JOIN (SELECT COALESCE(old.status, 'pendente') AS status, -1 AS sinal
+                  UNION ALL SELECT COALESCE(new.status, 'pendente'), 1) AS st
+            WHERE i.pedido_id = new.id
+            GROUP BY COALESCE(p.categoria_id, 0), st.status
+            ON CONFLICT(categoria_id, status) DO UPDATE SET itens = itens + excluded.itens, receita = receita + excluded.receita;
+        END;
+
+        DROP TRIGGER IF EXISTS estat_produtos_au_categoria;
+        CREATE TRIGGER estat_produtos_au_categoria AFTER UPDATE OF categoria_id ON produtos
+        WHEN COALESCE(old.categoria_id, 0) != COALESCE(new.categoria_id, 0) BEGIN
+            INSERT INTO vendas_categoria (categoria_id, status, itens, receita)
+            SELECT cat.categoria_id, COALESCE(pe.status, 'pendente'), cat.sinal * SUM(i.quantidade),
+                   cat.sinal * SUM(i.quantidade * i.preco_unitario)
+            FROM itens_pedido i
+            JOIN pedidos pe ON pe.id = i.pedido_id
+            JOIN (SELECT COALESCE(old.categoria_id, 0) AS categoria_id, -1 AS sinal
+                  UNION ALL SELECT COALESCE(new.categoria_id, 0), 1) AS cat
+            WHERE i.produto_id = new.id
+            GROUP BY cat.categoria_id, COALESCE(pe.status, 'pendente')
+            ON CONFLICT(categoria_id, status) DO UPDATE SET itens = itens + excluded.itens, receita = receita + excluded.receita;
+        END;
+    '''),
+]
+
+
+def _comandos(script):
+    """Divide um script SQL em comandos completos (respeita BEGIN ... END de triggers)"""
+    comando = ''
+    for linha in script.splitlines(keepends=True):
+        comando += linha
+        if sqlite3.complete_statement(comando):
+            if comando.strip().strip(';').strip():
+                yield comando
+            comando = ''
+    if comando.strip():
+        yield comando
+
+
+def versao_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT,
+            aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(versao) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrar_db(conn):
+    """Aplica as migrações pendentes; retorna a lista de versões aplicadas"""
+    atual = versao_schema(conn)
+    conn.commit()
+    aplicadas = []
+    for versao, descricao, passo in MIGRACOES:
+        if versao <= atual:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if callable(passo):
+                passo(conn)
+            else:
+                # executescript faria commit implícito; executa comando a comando
+                for comando in _comandos(passo):
+                    conn.execute(comando)
+            conn.execute('INSERT INTO schema_version (versao, descricao) VALUES (?, ?)',
+                         (versao, descricao))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        aplicadas.append(versao)
+    # Layouts montados antes (ou durante) a migração não viram as colunas novas
+    limpar_layouts()
+    if aplicadas:
+        conn.execute('PRAGMA optimize')
+    return aplicadas
+
 
 def init_db():
     conn = get_db()
@@ -83,6 +985,8 @@ def init_db():
         );
     ''')
 
+    migrar_db(conn)
+
     try:
         conn.execute('''
             INSERT INTO usuarios (nome, email, senha, tipo)
@@ -118,6 +1022,30 @@ def init_db():
 
         conn.commit()
     except:
-        pass
+        # Banco já populado: descarta a transação aberta pelo INSERT que falhou
+        conn.rollback()
 
     conn.close()
+
+
+def preparar_banco():
+    """Cria o banco, se ainda não existe, e aplica as migrações pendentes.
+
+    Chamada na subida de cada worker do gunicorn: um lock exclusivo em
+    <banco>.lock deixa um só processo migrar por vez; os demais esperam e
+    encontram o schema já atualizado.
+    """
+    with open(DATABASE + '.lock', 'a') as trava:
+        if fcntl is not None:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+        conn = get_pool().emprestar()
+        try:
+            existe = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'usuarios'"
+            ).fetchone()
+            if existe:
+                migrar_db(conn)
+        finally:
+            conn.close()
+        if not existe:
+            init_db()
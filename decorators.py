@@ -1,5 +1,14 @@
+import hashlib
+import os
+import time
 from functools import wraps
-from flask import session, flash, redirect, url_for
+from flask import session, flash, redirect, url_for, request, make_response, Response
+from cache import cache_paginas, versao_catalogo
+
+# Cache-Control das páginas anônimas: o navegador sempre revalida (ETag) e o
+# proxy reverso pode servir a cópia por PAGINA_S_MAXAGE segundos
+PAGINA_S_MAXAGE = int(os.environ.get('VIVANTS_PAGINA_S_MAXAGE', 60))
+_INICIO_PROCESSO = time.time()
 
 def login_required(f):
     @wraps(f)
@@ -18,3 +27,43 @@ def admin_required(f):
             return redirect(url_for('index'))
         return f(*args, **kwargs)
     return decorated_function
+
+def cache_pagina(f):
+    """Cache de página inteira para GETs anônimos, com ETag e Last-Modified.
+
+    A chave é caminho + query string; a versão do catálogo (alterada pelo
+    admin) invalida todas as páginas. Requisições com login ou mensagens
+    flash pendentes passam direto para a view.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method != 'GET' or 'user_id' in session or '_flashes' in session:
+            return f(*args, **kwargs)
+
+        chave = request.full_path
+        encontrado, entrada = cache_paginas.get(chave)
+        if not encontrado:
+            response = make_response(f(*args, **kwargs))
+            # Só guarda respostas 200 que não deixaram flash para a próxima página
+            if response.status_code != 200 or '_flashes' in session:
+                return response
+            corpo = response.get_data()
+            entrada = (
+                corpo,
+                response.content_type,
+                hashlib.sha256(corpo).hexdigest()[:32],
+                versao_catalogo.modificado_em() or _INICIO_PROCESSO,
+            )
+            cache_paginas.set(chave, entrada)
+
+        corpo, content_type, etag, modificado_em = entrada
+        response = Response(corpo, content_type=content_type)
+        response.set_etag(etag)
+        response.last_modified = int(modificado_em)
+        response.cache_control.public = True
+        response.cache_control.max_age = 0
+        response.cache_control.s_maxage = PAGINA_S_MAXAGE
+        response.cache_control.must_revalidate = True
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+    return decorated_function
@@ -0,0 +1,105 @@
+from database import transacao_escrita
+
+# Tolerância na comparação de valores monetários (somas incrementais de REAL)
+TOLERANCIA = 0.005
+
+# Tabelas materializadas (mantidas pelos triggers da migração 5): colunas-chave,
+# colunas de valor e a consulta que recalcula tudo a partir das tabelas de origem
+MATERIALIZADAS = {
+    'estatisticas': (('chave',), ('valor',), '''
+        SELECT 'produtos_ativos', COUNT(*) FROM produtos WHERE ativo = 1
+        UNION ALL
+        SELECT 'clientes', COUNT(*) FROM usuarios WHERE tipo = 'cliente'
+    '''),
+    'vendas_status': (('status',), ('pedidos', 'total'), '''
+        SELECT COALESCE(status, 'pendente'), COUNT(*), SUM(total) FROM pedidos GROUP BY 1
+    '''),
+    'vendas_dia': (('dia', 'status'), ('pedidos', 'total'), '''
+        SELECT COALESCE(date(data_pedido), ''), COALESCE(status, 'pendente'), COUNT(*), SUM(total)
+        FROM pedidos GROUP BY 1, 2
+    '''),
+    'vendas_categoria': (('categoria_id', 'status'), ('itens', 'receita'), '''
+        SELECT COALESCE(p.categoria_id, 0), COALESCE(pe.status, 'pendente'),
+               SUM(i.quantidade), SUM(i.quantidade * i.preco_unitario)
+        FROM itens_pedido i
+        JOIN pedidos pe ON pe.id = i.pedido_id
+        LEFT JOIN produtos p ON p.id = i.produto_id
+        GROUP BY 1, 2
+    '''),
+}
+
+
+def resumo_dashboard(db):
+    """Totais do dashboard lidos das tabelas materializadas (poucas linhas)"""
+    contadores = {row['chave']: row['valor'] for row in db.execute('SELECT chave, valor FROM estatisticas')}
+    pedidos, faturamento = db.execute('''
+        SELECT COALESCE(SUM(pedidos), 0),
+               COALESCE(SUM(CASE WHEN status = 'entregue' THEN total END), 0)
+        FROM vendas_status
+    ''').fetchone()
+    return {
+        'total_produtos': int(contadores.get('produtos_ativos', 0)),
+        'total_pedidos': pedidos,
+        'total_clientes': int(contadores.get('clientes', 0)),
+        'faturamento_total': round(faturamento, 2),
+    }
+
+
+def vendas_por_dia(db, dias=30):
+    return db.execute('''
+        SELECT dia, SUM(pedidos) as pedidos,
+               SUM(CASE WHEN status != 'cancelado' THEN total ELSE 0 END) as total
+        FROM vendas_dia
+        WHERE dia >= date('now', ?)
+        GROUP BY dia
+        HAVING SUM(pedidos) > 0
+        ORDER BY dia
+    ''', (f'-{int(dias)} days',)).fetchall()
+
+
+def vendas_por_categoria(db, status='entregue'):
+    return db.execute('''
+        SELECT v.categoria_id, COALESCE(c.nome, 'Sem categoria') as categoria, v.itens, v.receita
+        FROM vendas_categoria v
+        LEFT JOIN categorias c ON c.id = v.categoria_id
+        WHERE v.status = ? AND v.itens != 0
+        ORDER BY v.receita DESC
+    ''', (status,)).fetchall()
+
+
+def reconstruir_estatisticas(db):
+    """Recalcula todas as tabelas materializadas do zero numa única transação"""
+    with transacao_escrita(db):
+        for tabela, (chaves, valores, consulta) in MATERIALIZADAS.items():
+            colunas = ', '.join(chaves + valores)
+            db.execute(f'DELETE FROM {tabela}')
+            db.execute(f'INSERT INTO {tabela} ({colunas}) {consulta}')
+
+
+def _linhas(rows, n_chaves):
+    # Linhas zeradas (ex.: status que deixou de ter pedidos) equivalem a ausentes
+    return {
+        tuple(row[:n_chaves]): tuple(row[n_chaves:])
+        for row in rows
+        if any(abs(valor or 0) > TOLERANCIA for valor in row[n_chaves:])
+    }
+
+
+def verificar_estatisticas(db):
+    """Compara as tabelas materializadas com o recálculo completo.
+
+    Retorna a lista de divergências como (tabela, chave, materializado, recalculado);
+    lista vazia indica que está tudo consistente.
+    """
+    divergencias = []
+    for tabela, (chaves, valores, consulta) in MATERIALIZADAS.items():
+        colunas = ', '.join(chaves + valores)
+        atuais = _linhas(db.execute(f'SELECT {colunas} FROM {tabela}').fetchall(), len(chaves))
+        esperadas = _linhas(db.execute(consulta).fetchall(), len(chaves))
+        for chave in sorted(atuais.keys() | esperadas.keys(), key=str):
+            atual, esperado = atuais.get(chave), esperadas.get(chave)
+            if atual is None or esperado is None or any(
+                abs((a or 0) - (e or 0)) > TOLERANCIA for a, e in zip(atual, esperado)
+            ):
+                divergencias.append((tabela, chave, atual, esperado))
+    return divergencias
@@ -0,0 +1,306 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from PIL import Image, ImageOps
+
+from cache import CacheTTL
+from database import transacao_escrita
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Larguras geradas para cada upload (nunca amplia: imagens menores ficam no tamanho original)
+VARIANTES = {'thumb': 160, 'card': 400, 'detail': 800}
+
+# Formatos gravados por variante: WebP para os navegadores atuais e JPEG como fallback
+FORMATOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+IMAGENS_PROCESSOS = int(os.environ.get('VIVANTS_IMAGENS_PROCESSOS', 2))
+
+# Arquivos endereçados pelo conteúdo: <pasta>/ab/cd/<sha256>.<ext> (e variantes ao lado).
+# O nome muda sempre que o conteúdo muda, então a URL pode ser cacheada para sempre.
+URL_IMUTAVEL = re.compile(r'/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.[a-z0-9.]+$')
+
+# Blobs tocados por um upload há menos que isso não são apagados: cobre o intervalo
+# entre o upload reaproveitar um arquivo existente e gravar a referência no banco
+CARENCIA_REMOCAO = int(os.environ.get('VIVANTS_IMAGENS_CARENCIA', 300))
+
+# Manifestos de variantes mantidos em memória por worker (LRU)
+MANIFESTOS_MAX = int(os.environ.get('VIVANTS_IMAGENS_MANIFESTOS', 2048))
+
+# URLs verificadas por transação na limpeza de órfãs
+LOTE_LIMPEZA = 500
+
+_executor = None
+_manifestos = CacheTTL('manifestos', max_itens=MANIFESTOS_MAX)
+
+
+def _caminho_local(url):
+    # URLs são relativas à raiz da aplicação ("/static/uploads/...")
+    return os.path.join(BASE_DIR, url.lstrip('/'))
+
+
+def _base(caminho):
+    return os.path.splitext(caminho)[0]
+
+
+def caminho_variante(caminho, nome, extensao):
+    return f'{_base(caminho)}.{nome}.{extensao}'
+
+
+def caminho_manifesto(caminho):
+    return f'{_base(caminho)}.variantes.json'
+
+
+def _temporario(destino):
+    # Único por processo: dois uploads do mesmo conteúdo não disputam o arquivo temporário
+    return f'{destino}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+def _salvar_atomico(imagem, destino, formato, opcoes):
+    temporario = _temporario(destino)
+    imagem.save(temporario, formato, **opcoes)
+    os.replace(temporario, destino)
+
+
+def processar_imagem(caminho):
+    """Gera as variantes de largura em WebP e JPEG ao lado do arquivo original.
+
+    A imagem é decodificada uma vez; a orientação EXIF é aplicada nos pixels e
+    os metadados não são copiados para as variantes. O manifesto JSON com as
+    larguras reais é gravado por último e indica que as variantes estão prontas.
+    Retorna o manifesto.
+    """
+    with Image.open(caminho) as original:
+        imagem = ImageOps.exif_transpose(original)
+        imagem.load()
+
+    # JPEG não tem transparência: compõe sobre fundo branco
+    if imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info):
+        imagem = imagem.convert('RGBA')
+        fundo = Image.new('RGB', imagem.size, (255, 255, 255))
+        fundo.paste(imagem, mask=imagem.getchannel('A'))
+        imagem = fundo
+    else:
+        imagem = imagem.convert('RGB')
+
+    larguras = {}
+    # Da maior para a menor, reduzindo a partir da variante anterior (mais barato)
+    atual = imagem
+    for nome, largura in sorted(VARIANTES.items(), key=lambda item: -item[1]):
+        if atual.width > largura:
+            altura = max(1, round(atual.height * largura / atual.width))
+            atual = atual.resize((largura, altura), Image.Resampling.LANCZOS)
+        for extensao, (formato, opcoes) in FORMATOS.items():
+            _salvar_atomico(atual, caminho_variante(caminho, nome, extensao), formato, opcoes)
+        larguras[nome] = [atual.width, atual.height]
+
+    manifesto = {'larguras': larguras}
+    temporario = _temporario(caminho_manifesto(caminho))
+    with open(temporario, 'w') as f:
+        json.dump(manifesto, f)
+    os.replace(temporario, caminho_manifesto(caminho))
+    return manifesto
+
+
+def executor_imagens():
+    """ProcessPoolExecutor das imagens (spawn, como o dos relatórios)"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGENS_PROCESSOS, mp_context=get_context('spawn'))
+    return _executor
+
+
+def _registrar_falha(future, caminho):
+    erro = future.exception()
+    if erro is not None:
+        logger.error('Falha ao processar a imagem %s: %s', caminho, erro)
+
+
+def processar_em_segundo_plano(url):
+    """Agenda a geração das variantes; o upload responde sem esperar o Pillow"""
+    caminho = _caminho_local(url)
+    future = executor_imagens().submit(processar_imagem, caminho)
+    future.add_done_callback(lambda f: _registrar_falha(f, caminho))
+    return future
+
+
+def armazenar_imagem(dados, extensao, pasta):
+    """Grava os bytes da imagem pelo hash SHA-256 do conteúdo e retorna (url, nova).
+
+    Um conteúdo já armazenado não é regravado nem reprocessado: o upload só
+    renova a data do arquivo (ver CARENCIA_REMOCAO) e reaproveita as variantes.
+    """
+    digest = hashlib.sha256(dados).hexdigest()
+    url = f'/{pasta}/{digest[:2]}/{digest[2:4]}/{digest}.{extensao}'
+    caminho = _caminho_local(url)
+    try:
+        os.utime(caminho)
+        return url, False
+    except FileNotFoundError:
+        # Conteúdo novo (ou blob removido pela limpeza agora há pouco): grava
+        pass
+
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = _temporario(caminho)
+    with open(temporario, 'wb') as f:
+        f.write(dados)
+    os.replace(temporario, caminho)
+    return url, True
+
+
+def e_imutavel(url):
+    return URL_IMUTAVEL.search(url) is not None
+
+
+def arquivos_imagem(url):
+    """Caminhos do original, das variantes e do manifesto de uma imagem"""
+    caminho = _caminho_local(url)
+    return [caminho, caminho_manifesto(caminho)] + [
+        caminho_variante(caminho, nome, extensao) for nome in VARIANTES for extensao in FORMATOS
+    ]
+
+
+def _recente(caminho):
+    try:
+        return time.time() - os.path.getmtime(caminho) < CARENCIA_REMOCAO
+    except OSError:
+        return False
+
+
+def imagens_removiveis(db, urls):
+    """URLs que nenhum produto referencia mais (contagem de referências em produtos.imagem),
+    fora as reaproveitadas por um upload dentro da carência"""
+    urls = list(dict.fromkeys(u for u in urls if u))
+    usadas = set()
+    for inicio in range(0, len(urls), LOTE_LIMPEZA):
+        parte = urls[inicio:inicio + LOTE_LIMPEZA]
+        usadas.update(row[0] for row in db.execute(
+            f"SELECT DISTINCT imagem FROM produtos WHERE imagem IN ({', '.join('?' * len(parte))})", parte
+        ))
+    return [
+        url for url in urls
+        if url not in usadas and not (e_imutavel(url) and _recente(_caminho_local(url)))
+    ]
+
+
+def _remover_livres(urls):
+    """Remove as imagens já decididas removíveis; retorna quantas removeu.
+
+    Roda depois do commit. Um upload pode ter reaproveitado o blob desde a
+    decisão: a carência é conferida de novo logo antes de apagar.
+    """
+    removidas = 0
+    for url in urls:
+        if e_imutavel(url) and _recente(_caminho_local(url)):
+            continue
+        remover_imagem(url)
+        removidas += 1
+    return removidas
+
+
+def liberar_imagem(db, url):
+    """Remove a imagem se nenhum produto a referencia; retorna True se removeu.
+
+    Deve ser chamada depois do commit que tirou a referência. A decisão é
+    tomada com o lock de escrita (nenhuma escrita em andamento passa a
+    apontar para o arquivo); os arquivos são apagados depois do commit, sem
+    segurar o lock durante o acesso ao disco. Blobs reaproveitados por um
+    upload recente ficam para a limpeza (limpar_orfas).
+    """
+    if not url:
+        return False
+    with transacao_escrita(db):
+        removiveis = imagens_removiveis(db, [url])
+    return _remover_livres(removiveis) > 0
+
+
+def limpar_orfas(db, pasta):
+    """Varre o armazenamento endereçado por conteúdo e remove os blobs sem referência.
+
+    As candidatas são verificadas em lotes de LOTE_LIMPEZA por transação.
+    Retorna o número de imagens removidas.
+    """
+    raiz = _caminho_local(pasta)
+    candidatas = []
+    for diretorio, _, arquivos in os.walk(raiz):
+        for arquivo in arquivos:
+            url = '/' + os.path.relpath(os.path.join(diretorio, arquivo), BASE_DIR).replace(os.sep, '/')
+            # Só os originais: variantes e manifesto têm um sufixo a mais antes da extensão
+            if e_imutavel(url) and arquivo.count('.') == 1:
+                candidatas.append(url)
+
+    removidas = 0
+    for inicio in range(0, len(candidatas), LOTE_LIMPEZA):
+        with transacao_escrita(db):
+            removiveis = imagens_removiveis(db, candidatas[inicio:inicio + LOTE_LIMPEZA])
+        removidas += _remover_livres(removiveis)
+    return removidas
+
+
+def remover_imagem(url):
+    """Remove o arquivo original, as variantes e o manifesto"""
+    for arquivo in arquivos_imagem(url):
+        try:
+            os.remove(arquivo)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning('Erro ao remover arquivo de imagem %s: %s', arquivo, e)
+    _manifestos.descartar(url)
+
+
+class Variantes:
+    """URLs e srcset das variantes de uma imagem já processada"""
+
+    def __init__(self, url, larguras):
+        self.url_original = url
+        self.larguras = larguras
+
+    def url(self, nome, extensao='jpg'):
+        return caminho_variante(self.url_original, nome, extensao)
+
+    def srcset(self, extensao='jpg'):
+        # Larguras repetidas (imagem menor que a variante) entram uma única vez
+        vistas, partes = set(), []
+        for nome, (largura, _) in sorted(self.larguras.items(), key=lambda item: item[1][0]):
+            if largura not in vistas:
+                vistas.add(largura)
+                partes.append(f'{self.url(nome, extensao)} {largura}w')
+        return ', '.join(partes)
+
+    def dimensoes(self, nome):
+        return self.larguras[nome]
+
+
+def variantes_imagem(url):
+    """Variantes prontas da imagem ou None (ainda processando, ou imagem sem variantes).
+
+    Só resultados positivos ficam em memória (até MANIFESTOS_MAX por worker):
+    os nomes dos uploads não se repetem, então o manifesto de uma URL não muda
+    depois de gravado.
+    """
+    if not url:
+        return None
+    encontrado, variantes = _manifestos.get(url)
+    if encontrado:
+        return variantes
+    try:
+        with open(caminho_manifesto(_caminho_local(url))) as f:
+            manifesto = json.load(f)
+    except (OSError, ValueError):
+        return None
+    variantes = Variantes(url, manifesto['larguras'])
+    _manifestos.set(url, variantes)
+    return variantes
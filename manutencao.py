@@ -0,0 +1,146 @@
+import logging
+import os
+import queue
+import threading
+
+from database import transacao_escrita
+from imagens import arquivos_imagem, imagens_removiveis
+
+logger = logging.getLogger(__name__)
+
+# Linhas por lote: o lock de escrita é liberado entre um lote e outro
+LOTE_PADRAO = 500
+
+
+def purgar_pedidos_cancelados(db, lote=LOTE_PADRAO, progresso=None):
+    """Exclui os pedidos cancelados em lotes, devolvendo os itens ao estoque.
+
+    Cada lote é uma transação curta com quatro comandos set-based (marca os
+    ids, soma e devolve o estoque, apaga itens e pedidos), de modo que a loja
+    continua atendendo entre os lotes. `progresso(excluidos)` é chamado após
+    cada lote. Retorna o total de pedidos excluídos.
+    """
+    db.execute('CREATE TEMP TABLE IF NOT EXISTS _lote_pedidos (id INTEGER PRIMARY KEY)')
+    total = 0
+    while True:
+        with transacao_escrita(db):
+            db.execute('DELETE FROM _lote_pedidos')
+            marcados = db.execute('''
+                INSERT INTO _lote_pedidos (id)
+                SELECT id FROM pedidos
+                WHERE status = 'cancelado'
+                ORDER BY id
+                LIMIT ?
+            ''', (lote,)).rowcount
+            if not marcados:
+                break
+
+            db.execute('''
+                UPDATE produtos
+                SET estoque = estoque + devolvido.quantidade
+                FROM (
+                    SELECT produto_id, SUM(quantidade) as quantidade
+                    FROM itens_pedido
+                    WHERE pedido_id IN (SELECT id FROM _lote_pedidos)
+                    GROUP BY produto_id
+                ) AS devolvido
+                WHERE produtos.id = devolvido.produto_id
+            ''')
+            db.execute('DELETE FROM itens_pedido WHERE pedido_id IN (SELECT id FROM _lote_pedidos)')
+            total += db.execute('DELETE FROM pedidos WHERE id IN (SELECT id FROM _lote_pedidos)').rowcount
+
+        logger.info('Purga de pedidos cancelados: %d excluído(s)', total)
+        if progresso:
+            progresso(total)
+        if marcados < lote:
+            break
+    return total
+
+
+class ZeladorArquivos:
+    """Remove arquivos numa thread de fundo, fora das transações do banco"""
+
+    def __init__(self):
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.removidos = 0
+        self.falhas = 0
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name='zelador-arquivos', daemon=True)
+                self._thread.start()
+
+    def _executar(self):
+        while True:
+            caminho = self._fila.get()
+            try:
+                os.remove(caminho)
+                self.removidos += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.falhas += 1
+                logger.warning(f"Erro ao remover arquivo {caminho}: {e}")
+            finally:
+                self._fila.task_done()
+
+    def agendar(self, caminhos):
+        caminhos = [c for c in caminhos if c]
+        if not caminhos:
+            return
+        self._iniciar()
+        for caminho in caminhos:
+            self._fila.put(caminho)
+
+    def aguardar(self):
+        """Bloqueia até a fila esvaziar (útil em comandos de linha de comando)"""
+        self._fila.join()
+
+
+zelador = ZeladorArquivos()
+
+
+def purgar_produtos_inativos(db, lote=LOTE_PADRAO, progresso=None):
+    """Exclui em lotes os produtos inativos sem pedidos, com avaliações e carrinhos.
+
+    As imagens só são enviadas ao zelador depois do commit de cada lote, então
+    nenhum arquivo é apagado enquanto o lock de escrita está aberto (nem se o
+    lote sofrer rollback); imagens ainda usadas por outros produtos ficam.
+    Retorna o total de produtos excluídos.
+    """
+    db.execute('CREATE TEMP TABLE IF NOT EXISTS _lote_produtos (id INTEGER PRIMARY KEY)')
+    total = 0
+    while True:
+        with transacao_escrita(db):
+            db.execute('DELETE FROM _lote_produtos')
+            marcados = db.execute('''
+                INSERT INTO _lote_produtos (id)
+                SELECT p.id FROM produtos p
+                WHERE p.ativo = 0
+                  AND NOT EXISTS (SELECT 1 FROM itens_pedido ip WHERE ip.produto_id = p.id)
+                ORDER BY p.id
+                LIMIT ?
+            ''', (lote,)).rowcount
+            if not marcados:
+                break
+
+            imagens = [row['imagem'] for row in db.execute('''
+                SELECT imagem FROM produtos
+                WHERE id IN (SELECT id FROM _lote_produtos) AND imagem IS NOT NULL
+            ''')]
+            db.execute('DELETE FROM avaliacoes WHERE produto_id IN (SELECT id FROM _lote_produtos)')
+            db.execute('DELETE FROM avaliacoes_resumo WHERE produto_id IN (SELECT id FROM _lote_produtos)')
+            db.execute('DELETE FROM carrinho WHERE produto_id IN (SELECT id FROM _lote_produtos)')
+            total += db.execute('DELETE FROM produtos WHERE id IN (SELECT id FROM _lote_produtos)').rowcount
+            imagens = imagens_removiveis(db, imagens)
+
+        zelador.agendar(caminho for imagem in imagens for caminho in arquivos_imagem(imagem))
+        logger.info('Limpeza de produtos inativos: %d excluído(s)', total)
+        if progresso:
+            progresso(total)
+        if marcados < lote:
+            break
+    return total
@@ -0,0 +1,150 @@
+import base64
+import json
+import os
+from datetime import datetime
+from flask import request, url_for
+
+from cache import CacheTTL
+
+# Itens por página (pode ser sobrescrito por variável de ambiente ou ?por_pagina=)
+POR_PAGINA = int(os.environ.get('VIVANTS_POR_PAGINA', 24))
+POR_PAGINA_MAX = 100
+
+# Validade das contagens em cache (segundos) e limite de chaves guardadas
+# (há uma chave por usuário em "Meus pedidos")
+CONTAGEM_TTL = float(os.environ.get('VIVANTS_CONTAGEM_TTL', 60))
+CONTAGEM_MAX_ITENS = int(os.environ.get('VIVANTS_CONTAGEM_MAX_ITENS', 1024))
+
+
+def tamanho_pagina(valor):
+    """Converte o parâmetro ?por_pagina= respeitando o limite máximo"""
+    try:
+        tamanho = int(valor)
+    except (TypeError, ValueError):
+        return POR_PAGINA
+    return max(1, min(tamanho, POR_PAGINA_MAX))
+
+
+def _valor_cursor(valor):
+    # Datas voltam ao formato texto do SQLite para comparar com a coluna
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep=' ')
+    return valor
+
+
+def codificar_cursor(valores):
+    bruto = json.dumps([_valor_cursor(v) for v in valores], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, tamanho=None):
+    """Retorna a lista de valores do cursor, ou None se ausente/inválido.
+
+    O cursor vem da URL: só são aceitos valores escalares (texto, número ou
+    nulo) e, com `tamanho`, exatamente um valor por coluna da ordenação.
+    Um cursor inválido volta para a primeira página.
+    """
+    if not cursor:
+        return None
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valores = json.loads(bruto)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(valores, list) or (tamanho is not None and len(valores) != tamanho):
+        return None
+    for valor in valores:
+        if valor is not None and (isinstance(valor, bool) or not isinstance(valor, (str, int, float))):
+            return None
+    return valores
+
+
+class Pagina:
+    """Resultado de uma consulta paginada por chave (keyset)"""
+
+    def __init__(self, itens, proximo=None, anterior=None, total=None, por_pagina=POR_PAGINA):
+        self.itens = itens
+        self.proximo = proximo
+        self.anterior = anterior
+        self.total = total
+        self.por_pagina = por_pagina
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+
+def paginar(db, select, ordem, chaves, where=None, params=(), group_by=None,
+            cursor=None, direcao='prox', por_pagina=POR_PAGINA):
+    """Executa `select` paginado por chave, em ordem decrescente de `ordem`.
+
+    `ordem` são as expressões SQL de ordenação (ex.: ('p.data_pedido', 'p.id'),
+    a última deve ser única) e `chaves` os nomes dessas colunas no resultado,
+    usados para montar os cursores. `direcao` 'ant' volta uma página.
+    """
+    condicoes = list(where or [])
+    params = list(params)
+    valores = decodificar_cursor(cursor, len(ordem))
+
+    voltando = direcao == 'ant' and valores is not None
+    tupla = f"({', '.join(ordem)})"
+    if valores is not None:
+        marcadores = ', '.join('?' * len(valores))
+        condicoes.append(f'{tupla} {">" if voltando else "<"} ({marcadores})')
+        params.extend(valores)
+
+    query = select
+    if condicoes:
+        query += ' WHERE ' + ' AND '.join(f'({c})' for c in condicoes)
+    if group_by:
+        query += f' GROUP BY {group_by}'
+    sentido = 'ASC' if voltando else 'DESC'
+    query += ' ORDER BY ' + ', '.join(f'{col} {sentido}' for col in ordem)
+    query += ' LIMIT ?'
+    params.append(por_pagina + 1)
+
+    rows = db.execute(query, params).fetchall()
+    ha_mais = len(rows) > por_pagina
+    rows = rows[:por_pagina]
+    if voltando:
+        rows.reverse()
+
+    def _cursor(row):
+        return codificar_cursor(row[chave] for chave in chaves)
+
+    proximo = anterior = None
+    if rows:
+        if ha_mais or voltando:
+            proximo = _cursor(rows[-1])
+        if (ha_mais and voltando) or (valores is not None and not voltando):
+            anterior = _cursor(rows[0])
+    return Pagina(rows, proximo=proximo, anterior=anterior, por_pagina=por_pagina)
+
+
+def url_pagina(cursor, direcao='prox'):
+    """URL da página atual com outro cursor, preservando os demais filtros"""
+    args = request.args.to_dict()
+    args['cursor'] = cursor
+    args['dir'] = direcao
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+# -----------------------
+# Contagens em cache
+# -----------------------
+_contagens = CacheTTL('contagens', max_itens=CONTAGEM_MAX_ITENS, ttl=CONTAGEM_TTL)
+
+
+def contar(db, chave, query, params=(), ttl=CONTAGEM_TTL):
+    """COUNT(*) memorizado por `ttl` segundos; invalidado por invalidar_contagens()"""
+    return _contagens.obter(chave, lambda: db.execute(query, params).fetchone()[0], ttl)
+
+
+def invalidar_contagens(*prefixos):
+    """Descarta contagens cujas chaves começam com algum dos prefixos (todas se vazio)"""
+    if not prefixos:
+        _contagens.invalidar_local()
+    else:
+        _contagens.invalidar_prefixos(prefixos)
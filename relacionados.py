@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cache import CACHE_DIR, VersaoCompartilhada
+from database import transacao_escrita
+
+logger = logging.getLogger(__name__)
+
+# Relacionados guardados por produto e tamanho máximo de cesta considerado
+# (pedidos enormes geram pares quadráticos e pouco sinal)
+RELACIONADOS_TOP_K = int(os.environ.get('VIVANTS_RELACIONADOS_TOP_K', 8))
+CESTA_MAX = int(os.environ.get('VIVANTS_RELACIONADOS_CESTA_MAX', 50))
+LOTE_ESCRITA = 50000
+
+# Incrementada a cada atualização do índice: os workers recarregam o mapa em memória
+versao_relacionados = VersaoCompartilhada(os.path.join(CACHE_DIR, '.versao_relacionados'))
+
+
+def _ler(db, query, params=()):
+    cursor = db.cursor()
+    cursor.row_factory = None
+    return cursor.execute(query, params).fetchall()
+
+
+def _contar_pares(db, marca, limite):
+    """Conta os pares (a, b) de produtos que aparecem juntos nos pedidos do intervalo"""
+    cestas = pd.DataFrame(_ler(db, '''
+        SELECT DISTINCT i.pedido_id, i.produto_id
+        FROM itens_pedido i
+        JOIN pedidos p ON p.id = i.pedido_id
+        WHERE i.pedido_id > ? AND i.pedido_id <= ? AND COALESCE(p.status, '') != 'cancelado'
+    ''', (marca, limite)), columns=['pedido', 'produto'])
+    if cestas.empty:
+        return pd.Series(dtype=np.int64)
+
+    tamanhos = cestas.groupby('pedido')['produto'].transform('size')
+    cestas = cestas[tamanhos <= CESTA_MAX]
+    # Auto-junção por pedido = produto esparso BᵀB da matriz pedido x produto
+    pares = cestas.merge(cestas, on='pedido', suffixes=('_a', '_b'))
+    return pares.groupby(['produto_a', 'produto_b']).size()
+
+
+def _top_k(coocorrencias):
+    """Pontuação cosseno (pedidos em comum / sqrt(freq_a * freq_b)) e top-k por produto"""
+    df = coocorrencias.rename('pedidos').reset_index()
+    diagonal = df[df['produto_a'] == df['produto_b']].set_index('produto_a')['pedidos']
+    df = df[df['produto_a'] != df['produto_b']]
+    freq_a = diagonal.reindex(df['produto_a']).to_numpy(np.float64)
+    freq_b = diagonal.reindex(df['produto_b']).to_numpy(np.float64)
+    df = df.assign(pontuacao=df['pedidos'].to_numpy(np.float64) / np.sqrt(freq_a * freq_b))
+    df = df.sort_values(['produto_a', 'pontuacao', 'pedidos'], ascending=[True, False, False])
+    return df.groupby('produto_a', sort=False).head(RELACIONADOS_TOP_K)
+
+
+def _gravar_em_lotes(db, query, linhas):
+    for inicio in range(0, len(linhas), LOTE_ESCRITA):
+        db.executemany(query, linhas[inicio:inicio + LOTE_ESCRITA])
+
+
+def atualizar_relacionados(db, completo=False):
+    """Atualiza a matriz de coocorrência e o top-k dos produtos afetados.
+
+    Incremental: processa só os pedidos acima da marca d'água e recalcula o
+    top-k dos produtos que apareceram neles e dos seus vizinhos (cuja
+    pontuação depende da frequência dos primeiros). `completo` refaz tudo;
+    é forçado quando um pedido já contado foi cancelado ou excluído
+    (contador invalidacoes, mantido por triggers).
+    Retorna (pedidos processados até o id, produtos atualizados).
+    """
+    estado = db.execute(
+        "SELECT marca, invalidacoes FROM indices_estado WHERE nome = 'relacionados'"
+    ).fetchone()
+    invalidacoes = estado['invalidacoes'] if estado is not None else 0
+    completo = completo or invalidacoes > 0
+    marca = 0 if completo or estado is None else estado['marca']
+    limite = db.execute('SELECT COALESCE(MAX(id), 0) FROM pedidos').fetchone()[0]
+    if limite <= marca and not completo:
+        return limite, 0
+
+    novos = _contar_pares(db, marca, limite)
+    afetados = sorted(set(novos.index.get_level_values('produto_a'))) if len(novos) else []
+
+    with transacao_escrita(db):
+        if completo:
+            db.execute('DELETE FROM coocorrencias')
+        _gravar_em_lotes(db, '''
+            INSERT INTO coocorrencias (produto_a, produto_b, pedidos) VALUES (?, ?, ?)
+            ON CONFLICT(produto_a, produto_b) DO UPDATE SET pedidos = pedidos + excluded.pedidos
+        ''', [(int(a), int(b), int(n)) for (a, b), n in novos.items()])
+
+        if completo:
+            coocorrencias = novos
+        else:
+            # Produtos afetados + vizinhos; carrega as linhas deles e a diagonal dos vizinhos
+            db.execute('CREATE TEMP TABLE IF NOT EXISTS _afetados (id INTEGER PRIMARY KEY)')
+            db.execute('DELETE FROM _afetados')
+            db.executemany('INSERT INTO _afetados (id) VALUES (?)', [(int(a),) for a in afetados])
+            db.execute('''
+                INSERT OR IGNORE INTO _afetados (id)
+                SELECT DISTINCT produto_b FROM coocorrencias WHERE produto_a IN (SELECT id FROM _afetados)
+            ''')
+            afetados = [row[0] for row in _ler(db, 'SELECT id FROM _afetados')]
+            coocorrencias = pd.DataFrame(_ler(db, '''
+                SELECT produto_a, produto_b, pedidos FROM coocorrencias
+                WHERE produto_a IN (SELECT id FROM _afetados)
+                   OR (produto_a = produto_b AND produto_a IN (
+                       SELECT c.produto_b FROM coocorrencias c WHERE c.produto_a IN (SELECT id FROM _afetados)))
+            '''), columns=['produto_a', 'produto_b', 'pedidos']).set_index(['produto_a', 'produto_b'])['pedidos']
+
+        top = _top_k(coocorrencias) if len(coocorrencias) else pd.DataFrame(
+            columns=['produto_a', 'produto_b', 'pontuacao'])
+        if not completo:
+            top = top[top['produto_a'].isin(afetados)]
+
+        if completo:
+            db.execute('DELETE FROM produtos_relacionados')
+        else:
+            db.execute('DELETE FROM produtos_relacionados WHERE produto_id IN (SELECT id FROM _afetados)')
+        _gravar_em_lotes(db, '''
+            INSERT INTO produtos_relacionados (produto_id, relacionado_id, pontuacao) VALUES (?, ?, ?)
+        ''', list(zip(top['produto_a'].astype(int).tolist(), top['produto_b'].astype(int).tolist(),
+                      top['pontuacao'].astype(float).round(6).tolist())))
+
+        # Só desconta as invalidações lidas: as que chegaram durante a contagem ficam para a próxima
+        db.execute('''
+            INSERT INTO indices_estado (nome, marca, data_atualizacao) VALUES ('relacionados', ?, datetime('now'))
+            ON CONFLICT(nome) DO UPDATE SET marca = excluded.marca, data_atualizacao = excluded.data_atualizacao,
+                                            invalidacoes = MAX(invalidacoes - ?, 0)
+        ''', (limite, invalidacoes))
+
+    versao_relacionados.incrementar()
+    logger.info('Índice de relacionados: pedidos até #%d, %d produto(s) atualizado(s)', limite, len(afetados))
+    return limite, len(afetados)
+
+
+class IndiceRelacionados:
+    """Mapa produto -> relacionados em memória, recarregado quando a versão muda"""
+
+    def __init__(self):
+        self._mapa = None
+        self._versao = None
+        self._lock = threading.Lock()
+
+    def obter(self, db, produto_id):
+        versao = versao_relacionados.atual()
+        if self._mapa is None or self._versao != versao:
+            with self._lock:
+                if self._mapa is None or self._versao != versao:
+                    mapa = {}
+                    for produto, relacionado in _ler(db, '''
+                        SELECT produto_id, relacionado_id FROM produtos_relacionados
+                        ORDER BY produto_id, pontuacao DESC
+                    '''):
+                        mapa.setdefault(produto, []).append(relacionado)
+                    self._mapa = {produto: tuple(ids) for produto, ids in mapa.items()}
+                    self._versao = versao
+        return self._mapa.get(produto_id, ())
+
+
+indice_relacionados = IndiceRelacionados()
+
+
+def produtos_relacionados(db, produto, limite=4):
+    """Comprados juntos (do índice em memória), completados com a mesma categoria"""
+    ids = list(indice_relacionados.obter(db, produto['id'])[:limite * 2])
+    escolhidos = []
+    if ids:
+        linhas = {row['id']: row for row in db.execute(f'''
+            SELECT id, nome, preco, preco_promocional, imagem
+            FROM produtos
+            WHERE id IN ({', '.join('?' * len(ids))}) AND ativo = 1
+        ''', ids)}
+        escolhidos = [linhas[i] for i in ids if i in linhas][:limite]
+
+    faltam = limite - len(escolhidos)
+    if faltam > 0 and produto['categoria_id'] is not None:
+        excluir = [produto['id']] + [row['id'] for row in escolhidos]
+        escolhidos += db.execute(f'''
+            SELECT id, nome, preco, preco_promocional, imagem
+            FROM produtos
+            WHERE categoria_id = ? AND ativo = 1 AND id NOT IN ({', '.join('?' * len(excluir))})
+            ORDER BY destaque DESC, data_cadastro DESC
+            LIMIT ?
+        ''', (produto['categoria_id'], *excluir, faltam)).fetchall()
+    return escolhidos
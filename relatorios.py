@@ -1,5 +1,11 @@
-import pandas as pd
-from io import BytesIO
+import csv
+import json
+import zlib
+from io import StringIO
+from itertools import chain, islice
+from tempfile import SpooledTemporaryFile
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import (
     SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Frame
@@ -7,10 +13,13 @@ from reportlab.platypus import (
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import inch, mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from datetime import datetime
 from zoneinfo import ZoneInfo
 import os
-import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 
 # -----------------------
 # Configuração / Helpers
@@ -58,42 +67,64 @@ FOOTER_STYLE = ParagraphStyle(
 # -----------------------
 # Util: calcular larguras
 # -----------------------
-def calcular_col_widths(data_rows, page_width=A4[0], left_margin=36, right_margin=36, min_col=30, max_col=300):
+AMOSTRA_LARGURAS = 200      # linhas medidas por relatório (além do cabeçalho)
+PERCENTIL_LARGURA = 0.9     # ignora os 10% de células mais longas
+PADDING_CELULA = 12         # padding horizontal padrão das células (6pt por lado)
+FONTE_CORPO, FONTE_CABECALHO, TAMANHO_FONTE = "Helvetica", "Helvetica-Bold", 9
+LARGURAS_TTL = 600
+
+_cache_larguras = {}
+
+def _amostra(linhas, limite=AMOSTRA_LARGURAS):
+    """Até `limite` linhas espalhadas uniformemente pelo relatório"""
+    if len(linhas) <= limite:
+        return linhas
+    passo = len(linhas) / limite
+    return [linhas[int(i * passo)] for i in range(limite)]
+
+def calcular_col_widths(data_rows, page_width=A4[0], left_margin=36, right_margin=36, min_col=30, max_col=300,
+                        chave=None):
     """
-    Estima larguras de colunas com base no conteúdo textual.
-    Retorna lista de larguras em pontos que somam no máximo page_width - margins.
+    Estima larguras de colunas medindo o texto real (stringWidth) do cabeçalho e
+    de uma amostra das linhas, usando um percentil alto por coluna.
+    Retorna lista de larguras em pontos que somam page_width - margins.
+    Com `chave` (tipo de relatório) o resultado fica em cache por LARGURAS_TTL segundos.
     """
     usable_width = page_width - left_margin - right_margin
-    # transpor
-    cols = list(zip(*data_rows))
-    # medimos comprimento aproximado (número de caracteres)
-    lengths = [max(len(str(cell)) for cell in col) for col in cols]
-    total = sum(lengths) or 1
-    # converte para width proporcional
-    widths = []
-    for l in lengths:
-        w = max(min_col, min(max_col, math.ceil((l / total) * usable_width)))
-        widths.append(w)
-    # ajustar soma para não ultrapassar usable_width
-    current = sum(widths)
-    if current != usable_width:
-        diff = usable_width - current
-        # distribuir diff proporcionalmente (simples)
-        for i in range(len(widths)):
-            add = math.floor(diff * (widths[i] / current)) if current else 0
-            widths[i] += add
-        # corrigir qualquer sobra
-        while sum(widths) < usable_width:
-            for i in range(len(widths)):
-                widths[i] += 1
-                if sum(widths) >= usable_width:
-                    break
-        while sum(widths) > usable_width:
-            for i in range(len(widths)):
-                if widths[i] > min_col:
-                    widths[i] -= 1
-                if sum(widths) <= usable_width:
-                    break
+    ncols = len(data_rows[0]) if data_rows else 0
+    if not ncols:
+        return []
+
+    if chave is not None:
+        cache_key = (chave, ncols, usable_width, min_col, max_col)
+        item = _cache_larguras.get(cache_key)
+        if item and item[1] > time.monotonic():
+            return list(item[0])
+
+    header, corpo = data_rows[0], _amostra(data_rows[1:])
+    naturais = []
+    for col in range(ncols):
+        medidas = sorted(stringWidth(str(linha[col]), FONTE_CORPO, TAMANHO_FONTE) for linha in corpo)
+        corpo_w = medidas[min(len(medidas) - 1, int(len(medidas) * PERCENTIL_LARGURA))] if medidas else 0
+        header_w = stringWidth(str(header[col]), FONTE_CABECALHO, TAMANHO_FONTE)
+        naturais.append(max(min_col, min(max_col, max(corpo_w, header_w) + PADDING_CELULA)))
+
+    # Escala proporcional para ocupar a largura útil; colunas que ficariam
+    # abaixo do mínimo são fixadas e o restante é redistribuído (no máximo ncols passadas)
+    fixas = {}
+    for _ in range(ncols):
+        livres = [i for i in range(ncols) if i not in fixas]
+        espaco = usable_width - min_col * len(fixas)
+        soma = sum(naturais[i] for i in livres)
+        escala = espaco / soma if soma else 0
+        abaixo = [i for i in livres if naturais[i] * escala < min_col]
+        if not abaixo or len(abaixo) == len(livres):
+            break
+        fixas.update((i, min_col) for i in abaixo)
+    widths = [fixas.get(i, naturais[i] * escala) for i in range(ncols)]
+
+    if chave is not None:
+        _cache_larguras[cache_key] = (tuple(widths), time.monotonic() + LARGURAS_TTL)
     return widths
 
 # -----------------------
@@ -154,244 +185,356 @@ def criar_tabela_estilizada(data_rows, col_widths=None, repeat_header=True):
     style.add("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#6c757d"))
     style.add("TEXTCOLOR", (0, 0), (-1, 0), colors.white)
 
-    # Zebra para linhas alternadas
-    for idx in range(1, len(data_rows)):
-        bg = colors.whitesmoke if idx % 2 == 0 else colors.beige
-        style.add("BACKGROUND", (0, idx), (-1, idx), bg)
+    # Zebra para linhas alternadas (um único comando, sem custo por linha)
+    style.add("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.beige, colors.whitesmoke])
 
     table.setStyle(style)
     return table
 
 # -----------------------
-# EXCEL: produtos, pedidos, clientes (mantive implementação simples)
+# EXCEL: produtos, pedidos, clientes
+# Escrita em modo write-only do openpyxl: as linhas são consumidas uma a uma
+# (pode ser um cursor SQLite) e o arquivo vai direto para o destino.
 # -----------------------
-def gerar_excel_produtos(produtos, salvar_arquivo=False):
-    data = []
-    for produto in produtos:
-        data.append({
-            "ID": produto["id"],
-            "Nome": produto["nome"],
-            "Categoria": produto["categoria_nome"],
-            "Preço": f"R$ {produto['preco']:.2f}",
-            "Preço Promocional": f"R$ {produto['preco_promocional']:.2f}" if produto.get("preco_promocional") else "",
-            "Estoque": produto.get("estoque", ""),
-            "Destaque": "Sim" if produto.get("destaque") else "Não",
-            "Data Cadastro": produto.get("data_cadastro", "")
-        })
-    df = pd.DataFrame(data)
-    filename = f"relatorio_produtos_{agora_brasil().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
+def _moeda(valor):
+    return f"R$ {valor:.2f}" if valor else ""
+
+COLUNAS_EXCEL_PRODUTOS = [
+    ("ID", 8, lambda p: p["id"]),
+    ("Nome", 30, lambda p: p["nome"]),
+    ("Categoria", 20, lambda p: p["categoria_nome"]),
+    ("Preço", 12, lambda p: f"R$ {p['preco']:.2f}"),
+    ("Preço Promocional", 15, lambda p: _moeda(p.get("preco_promocional"))),
+    ("Estoque", 10, lambda p: p.get("estoque", "")),
+    ("Destaque", 10, lambda p: "Sim" if p.get("destaque") else "Não"),
+    ("Data Cadastro", 15, lambda p: p.get("data_cadastro", "")),
+]
+
+COLUNAS_EXCEL_PEDIDOS = [
+    ("ID", 8, lambda p: p["id"]),
+    ("Cliente", 25, lambda p: p["cliente_nome"]),
+    ("Email", 25, lambda p: p.get("cliente_email", "")),
+    ("Total", 12, lambda p: f"R$ {p['total']:.2f}"),
+    ("Status", 15, lambda p: (p.get("status") or "").upper()),
+    ("Data Pedido", 15, lambda p: p.get("data_pedido", "")),
+    ("Endereço", 30, lambda p: p.get("endereco_entrega", "")),
+]
+
+COLUNAS_EXCEL_CLIENTES = [
+    ("ID", 8, lambda c: c["id"]),
+    ("Nome", 25, lambda c: c["nome"]),
+    ("Email", 25, lambda c: c.get("email", "")),
+    ("Telefone", 20, lambda c: c.get("telefone") or "Não informado"),
+    ("Data Cadastro", 15, lambda c: c.get("data_cadastro", "")),
+]
+
+def escrever_excel(linhas, colunas, titulo_aba, destino):
+    """Grava um .xlsx em `destino` (caminho ou arquivo) consumindo `linhas` em streaming"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(titulo_aba)
+    for idx, (_, largura, _) in enumerate(colunas, start=1):
+        ws.column_dimensions[get_column_letter(idx)].width = largura
+    ws.append([cabecalho for cabecalho, _, _ in colunas])
+    extratores = [extrair for _, _, extrair in colunas]
+    for linha in linhas:
+        ws.append([extrair(linha) for extrair in extratores])
+    wb.save(destino)
+
+def _gerar_excel(linhas, colunas, titulo_aba, prefixo, salvar_arquivo):
     if salvar_arquivo:
+        filename = f"{prefixo}_{agora_brasil().strftime('%Y%m%d_%H%M%S')}.xlsx"
         filepath = os.path.join(RELATORIOS_DIR, filename)
-        with pd.ExcelWriter(filepath, engine="openpyxl") as writer:
-            df.to_excel(writer, sheet_name="Produtos", index=False)
-            ws = writer.sheets["Produtos"]
-            for col, width in zip("ABCDEFGH", [8, 30, 20, 12, 15, 10, 10, 15]):
-                ws.column_dimensions[col].width = width
+        escrever_excel(linhas, colunas, titulo_aba, filepath)
         return filename, filepath
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name="Produtos", index=False)
+    # Fica em memória até 8MB; acima disso o arquivo vai para disco
+    output = SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    escrever_excel(linhas, colunas, titulo_aba, output)
     output.seek(0)
     return output
 
-def gerar_excel_pedidos(pedidos, salvar_arquivo=False):
-    data = []
-    for pedido in pedidos:
-        data.append({
-            "ID": pedido["id"],
-            "Cliente": pedido["cliente_nome"],
-            "Email": pedido.get("cliente_email", ""),
-            "Total": f"R$ {pedido['total']:.2f}",
-            "Status": pedido.get("status", "").upper(),
-            "Data Pedido": pedido.get("data_pedido", ""),
-            "Endereço": pedido.get("endereco_entrega", "")
-        })
-    df = pd.DataFrame(data)
-    filename = f"relatorio_pedidos_{agora_brasil().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-    if salvar_arquivo:
-        filepath = os.path.join(RELATORIOS_DIR, filename)
-        with pd.ExcelWriter(filepath, engine="openpyxl") as writer:
-            df.to_excel(writer, sheet_name="Pedidos", index=False)
-            ws = writer.sheets["Pedidos"]
-            for col, width in zip("ABCDEFG", [8, 25, 25, 12, 15, 15, 30]):
-                ws.column_dimensions[col].width = width
-        return filename, filepath
+def gerar_excel_produtos(produtos, salvar_arquivo=False):
+    return _gerar_excel(produtos, COLUNAS_EXCEL_PRODUTOS, "Produtos", "relatorio_produtos", salvar_arquivo)
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name="Pedidos", index=False)
-    output.seek(0)
-    return output
+def gerar_excel_pedidos(pedidos, salvar_arquivo=False):
+    return _gerar_excel(pedidos, COLUNAS_EXCEL_PEDIDOS, "Pedidos", "relatorio_pedidos", salvar_arquivo)
 
 def gerar_excel_clientes(clientes, salvar_arquivo=False):
-    data = []
-    for cliente in clientes:
-        data.append({
-            "ID": cliente["id"],
-            "Nome": cliente["nome"],
-            "Email": cliente.get("email", ""),
-            "Telefone": cliente.get("telefone") or "Não informado",
-            "Data Cadastro": cliente.get("data_cadastro", "")
-        })
-    df = pd.DataFrame(data)
-    filename = f"relatorio_clientes_{agora_brasil().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-    if salvar_arquivo:
-        filepath = os.path.join(RELATORIOS_DIR, filename)
-        with pd.ExcelWriter(filepath, engine="openpyxl") as writer:
-            df.to_excel(writer, sheet_name="Clientes", index=False)
-            ws = writer.sheets["Clientes"]
-            for col, width in zip("ABCDE", [8, 25, 25, 20, 15]):
-                ws.column_dimensions[col].width = width
-        return filename, filepath
+    return _gerar_excel(clientes, COLUNAS_EXCEL_CLIENTES, "Clientes", "relatorio_clientes", salvar_arquivo)
+
+# Consultas dos relatórios Excel/PDF (mesmos dados das telas de admin)
+CONSULTAS_RELATORIO = {
+    "produtos": """
+        SELECT p.*, c.nome as categoria_nome
+        FROM produtos p
+        LEFT JOIN categorias c ON p.categoria_id = c.id
+        WHERE p.ativo = 1
+        ORDER BY p.nome
+    """,
+    "pedidos": """
+        SELECT p.*, u.nome as cliente_nome, u.email as cliente_email
+        FROM pedidos p
+        JOIN usuarios u ON p.usuario_id = u.id
+        ORDER BY p.data_pedido DESC
+    """,
+    "clientes": "SELECT * FROM usuarios WHERE tipo = 'cliente'",
+}
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name="Clientes", index=False)
-    output.seek(0)
-    return output
+# -----------------------
+# CSV (gzip) e NDJSON em streaming, para integração com BI
+# Geradores de bytes: nada é materializado além de um bloco de ~64KB.
+# -----------------------
+CONSULTAS_EXPORTACAO = {
+    "produtos": """
+        SELECT p.id, p.nome, p.descricao, c.nome as categoria, p.preco, p.preco_promocional,
+               p.estoque, p.ativo, p.destaque, p.data_cadastro
+        FROM produtos p
+        LEFT JOIN categorias c ON p.categoria_id = c.id
+        ORDER BY p.id
+    """,
+    "pedidos": """
+        SELECT p.id, p.usuario_id, u.nome as cliente_nome, u.email as cliente_email,
+               p.total, p.status, p.endereco_entrega, p.data_pedido
+        FROM pedidos p
+        JOIN usuarios u ON p.usuario_id = u.id
+        ORDER BY p.id
+    """,
+    "clientes": """
+        SELECT id, nome, email, telefone, data_cadastro
+        FROM usuarios
+        WHERE tipo = 'cliente'
+        ORDER BY id
+    """,
+}
+
+TAMANHO_BLOCO = 64 * 1024
+
+def _valor_exportacao(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep=" ")
+    return valor
+
+def _compactar(blocos, compactar):
+    if not compactar:
+        yield from blocos
+        return
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    for bloco in blocos:
+        dados = gz.compress(bloco)
+        if dados:
+            yield dados
+    yield gz.flush()
+
+def _blocos_csv(cursor):
+    colunas = [d[0] for d in cursor.description]
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(colunas)
+    for linha in cursor:
+        writer.writerow([_valor_exportacao(v) for v in linha.values()])
+        if buffer.tell() >= TAMANHO_BLOCO:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def _blocos_ndjson(cursor):
+    colunas = [d[0] for d in cursor.description]
+    partes, tamanho = [], 0
+    for linha in cursor:
+        registro = json.dumps(
+            dict(zip(colunas, (_valor_exportacao(v) for v in linha.values()))),
+            ensure_ascii=False, separators=(",", ":")
+        ) + "\n"
+        partes.append(registro)
+        tamanho += len(registro)
+        if tamanho >= TAMANHO_BLOCO:
+            yield "".join(partes).encode("utf-8")
+            partes, tamanho = [], 0
+    if partes:
+        yield "".join(partes).encode("utf-8")
+
+def exportar_csv(cursor, compactar=True):
+    """Gera o CSV (gzip por padrão) em blocos a partir de um cursor"""
+    return _compactar(_blocos_csv(cursor), compactar)
+
+def exportar_ndjson(cursor, compactar=False):
+    """Gera JSON delimitado por linha (um objeto por registro) a partir de um cursor"""
+    return _compactar(_blocos_ndjson(cursor), compactar)
 
 # -----------------------
 # PDF: Produtos, Pedidos, Clientes (com espaçamento maior entre título e "Emitido em")
+# As linhas chegam direto do cursor e viram tabelas do tamanho de uma página só
+# quando o build chega nelas: nem as linhas nem as Tables ficam todas em memória.
 # -----------------------
-def gerar_pdf_produtos(produtos, salvar_arquivo=False):
-    buffer = BytesIO()
-    filename = f"relatorio_produtos_{agora_brasil().strftime('%Y%m%d_%H%M%S')}.pdf"
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=36, rightMargin=36, topMargin=48, bottomMargin=48)
-
-    # Header title + emission (com espaçamento aumentado)
-    titulo = Paragraph("RELATÓRIO DE PRODUTOS - VIVANTS", TITLE_STYLE)
-    # Espaçamento maior solicitado entre o título e a linha "Emitido em"
-    emitido = Paragraph(f"Emitido em: {agora_brasil().strftime('%d/%m/%Y %H:%M')}", META_STYLE)
-
-    data = [["ID", "Nome", "Categoria", "Preço", "Estoque", "Destaque"]]
-    for p in produtos:
-        data.append([
-            str(p.get("id", "")),
-            p.get("nome", ""),
-            p.get("categoria_nome", ""),
-            f"R$ {p.get('preco', 0):.2f}",
-            str(p.get("estoque", "")),
-            "Sim" if p.get("destaque") else "Não"
-        ])
-
-    col_widths = calcular_col_widths(data, page_width=A4[0], left_margin=doc.leftMargin, right_margin=doc.rightMargin)
-    tabela = criar_tabela_estilizada(data, col_widths)
-
-    elements = [
-        titulo,
-        Spacer(1, 12),            # mantém espaçamento padrão abaixo do título
-        emitido,
-        Spacer(1, 18),            # >>> AUMENTEI esse Spacer para ampliar o espaço pedido
-        tabela,
-        Spacer(1, 12),
-        Paragraph(f"Total de produtos: {len(produtos)}", NORMAL_STYLE)
-    ]
-
-    # build com header/footer
-    doc.build(elements, onFirstPage=lambda c, d: (_cabecalho(c, d, titulo), _rodape(c, d)),
-              onLaterPages=lambda c, d: (_cabecalho(c, d, titulo), _rodape(c, d)))
+LINHAS_POR_TABELA = 40
 
+class _FlowablesSobDemanda(list):
+    """
+    Lista de flowables abastecida aos poucos por um gerador.
+    doc.build consome a lista pela frente (len, [0], del [0]); a cada acesso o
+    buffer é completado com no máximo BUFFER itens.
+    """
+    BUFFER = 3
+
+    def __init__(self, gerador):
+        super().__init__()
+        self._gerador = gerador
+
+    def _abastecer(self):
+        while self._gerador is not None and list.__len__(self) < self.BUFFER:
+            try:
+                self.append(next(self._gerador))
+            except StopIteration:
+                self._gerador = None
+
+    def __len__(self):
+        self._abastecer()
+        return list.__len__(self)
+
+    def __getitem__(self, indice):
+        self._abastecer()
+        return list.__getitem__(self, indice)
+
+def _tabelas_em_blocos(cabecalho, linhas, col_widths):
+    vazia = True
+    while True:
+        bloco = list(islice(linhas, LINHAS_POR_TABELA))
+        if not bloco:
+            break
+        vazia = False
+        yield criar_tabela_estilizada([cabecalho] + bloco, col_widths)
+    if vazia:
+        yield criar_tabela_estilizada([cabecalho], col_widths)
+
+def _gerar_pdf(prefixo, titulo_texto, cabecalho, linhas, resumo, chave, salvar_arquivo):
+    """
+    Monta o PDF a partir de um iterável de linhas. `resumo` é chamado só depois
+    da última tabela, quando os totais acumulados pelas linhas estão completos.
+    """
+    filename = f"{prefixo}_{agora_brasil().strftime('%Y%m%d_%H%M%S')}.pdf"
     if salvar_arquivo:
         filepath = os.path.join(RELATORIOS_DIR, filename)
-        with open(filepath, "wb") as f:
-            f.write(buffer.getvalue())
-        return filename, filepath
-
-    buffer.seek(0)
-    return buffer
+        destino = filepath
+    else:
+        destino = SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    doc = SimpleDocTemplate(destino, pagesize=A4, leftMargin=36, rightMargin=36, topMargin=48, bottomMargin=48)
 
-def gerar_pdf_pedidos(pedidos, salvar_arquivo=False):
-    buffer = BytesIO()
-    filename = f"relatorio_pedidos_{agora_brasil().strftime('%Y%m%d_%H%M%S')}.pdf"
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=36, rightMargin=36, topMargin=48, bottomMargin=48)
-
-    titulo = Paragraph("RELATÓRIO DE PEDIDOS - VIVANTS", TITLE_STYLE)
+    titulo = Paragraph(titulo_texto, TITLE_STYLE)
     emitido = Paragraph(f"Emitido em: {agora_brasil().strftime('%d/%m/%Y %H:%M')}", META_STYLE)
 
-    data = [["ID", "Cliente", "Total", "Status", "Data"]]
-    for ped in pedidos:
-        data.append([
-            f"#{ped.get('id', '')}",
-            ped.get("cliente_nome", ""),
-            f"R$ {ped.get('total', 0):.2f}",
-            ped.get("status", "").upper(),
-            ped.get("data_pedido", "")
-        ])
-
-    col_widths = calcular_col_widths(data, page_width=A4[0], left_margin=doc.leftMargin, right_margin=doc.rightMargin)
-    tabela = criar_tabela_estilizada(data, col_widths)
-
-    faturamento = sum(p.get("total", 0) for p in pedidos)
-
-    elements = [
-        titulo,
-        Spacer(1, 12),
-        emitido,
-        Spacer(1, 18),            # espaço aumentado entre título e emitido em
-        tabela,
-        Spacer(1, 12),
-        Paragraph(f"Total de pedidos: {len(pedidos)}", NORMAL_STYLE),
-        Paragraph(f"Faturamento total: R$ {faturamento:.2f}", NORMAL_STYLE)
-    ]
-
-    doc.build(elements, onFirstPage=lambda c, d: (_cabecalho(c, d, titulo), _rodape(c, d)),
+    # Sem o total de linhas de antemão, a amostra das larguras são as primeiras linhas
+    linhas = iter(linhas)
+    amostra = list(islice(linhas, AMOSTRA_LARGURAS))
+    col_widths = calcular_col_widths([cabecalho] + amostra, page_width=A4[0], left_margin=doc.leftMargin,
+                                     right_margin=doc.rightMargin, chave=chave)
+
+    def elementos():
+        yield titulo
+        yield Spacer(1, 12)       # mantém espaçamento padrão abaixo do título
+        yield emitido
+        yield Spacer(1, 18)       # espaço aumentado entre título e emitido em
+        yield from _tabelas_em_blocos(cabecalho, chain(amostra, linhas), col_widths)
+        yield Spacer(1, 12)
+        for texto in resumo():
+            yield Paragraph(texto, NORMAL_STYLE)
+
+    # build com header/footer; as páginas são gravadas direto no destino
+    doc.build(_FlowablesSobDemanda(elementos()),
+              onFirstPage=lambda c, d: (_cabecalho(c, d, titulo), _rodape(c, d)),
               onLaterPages=lambda c, d: (_cabecalho(c, d, titulo), _rodape(c, d)))
 
     if salvar_arquivo:
-        filepath = os.path.join(RELATORIOS_DIR, filename)
-        with open(filepath, "wb") as f:
-            f.write(buffer.getvalue())
         return filename, filepath
 
-    buffer.seek(0)
-    return buffer
-
-def gerar_pdf_clientes(clientes, salvar_arquivo=False):
-    buffer = BytesIO()
-    filename = f"relatorio_clientes_{agora_brasil().strftime('%Y%m%d_%H%M%S')}.pdf"
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=36, rightMargin=36, topMargin=48, bottomMargin=48)
+    destino.seek(0)
+    return destino
 
-    titulo = Paragraph("RELATÓRIO DE CLIENTES - VIVANTS", TITLE_STYLE)
-    emitido = Paragraph(f"Emitido em: {agora_brasil().strftime('%d/%m/%Y %H:%M')}", META_STYLE)
-
-    data = [["ID", "Nome", "Email", "Telefone", "Cadastro"]]
-    for c in clientes:
-        data.append([
-            str(c.get("id", "")),
-            c.get("nome", ""),
-            c.get("email", ""),
-            c.get("telefone") or "Não informado",
-            c.get("data_cadastro", "")
-        ])
-
-    col_widths = calcular_col_widths(data, page_width=A4[0], left_margin=doc.leftMargin, right_margin=doc.rightMargin)
-    tabela = criar_tabela_estilizada(data, col_widths)
-
-    elements = [
-        titulo,
-        Spacer(1, 12),
-        emitido,
-        Spacer(1, 18),            # espaço aumentado entre título e emitido em
-        tabela,
-        Spacer(1, 12),
-        Paragraph(f"Total de clientes: {len(clientes)}", NORMAL_STYLE)
-    ]
+def gerar_pdf_produtos(produtos, salvar_arquivo=False):
+    totais = {"produtos": 0}
+
+    def linhas():
+        for p in produtos:
+            totais["produtos"] += 1
+            yield [
+                str(p.get("id", "")),
+                p.get("nome", ""),
+                p.get("categoria_nome", ""),
+                f"R$ {p.get('preco', 0):.2f}",
+                str(p.get("estoque", "")),
+                "Sim" if p.get("destaque") else "Não"
+            ]
+
+    return _gerar_pdf(
+        "relatorio_produtos", "RELATÓRIO DE PRODUTOS - VIVANTS",
+        ["ID", "Nome", "Categoria", "Preço", "Estoque", "Destaque"], linhas(),
+        lambda: [f"Total de produtos: {totais['produtos']}"], "produtos", salvar_arquivo
+    )
 
-    doc.build(elements, onFirstPage=lambda c, d: (_cabecalho(c, d, titulo), _rodape(c, d)),
-              onLaterPages=lambda c, d: (_cabecalho(c, d, titulo), _rodape(c, d)))
+def gerar_pdf_pedidos(pedidos, salvar_arquivo=False):
+    totais = {"pedidos": 0, "faturamento": 0}
+
+    def linhas():
+        for ped in pedidos:
+            totais["pedidos"] += 1
+            totais["faturamento"] += ped.get("total", 0)
+            yield [
+                f"#{ped.get('id', '')}",
+                ped.get("cliente_nome", ""),
+                f"R$ {ped.get('total', 0):.2f}",
+                ped.get("status", "").upper(),
+                ped.get("data_pedido", "")
+            ]
+
+    return _gerar_pdf(
+        "relatorio_pedidos", "RELATÓRIO DE PEDIDOS - VIVANTS",
+        ["ID", "Cliente", "Total", "Status", "Data"], linhas(),
+        lambda: [f"Total de pedidos: {totais['pedidos']}", f"Faturamento total: R$ {totais['faturamento']:.2f}"],
+        "pedidos", salvar_arquivo
+    )
 
-    if salvar_arquivo:
-        filepath = os.path.join(RELATORIOS_DIR, filename)
-        with open(filepath, "wb") as f:
-            f.write(buffer.getvalue())
-        return filename, filepath
+def gerar_pdf_clientes(clientes, salvar_arquivo=False):
+    totais = {"clientes": 0}
+
+    def linhas():
+        for c in clientes:
+            totais["clientes"] += 1
+            yield [
+                str(c.get("id", "")),
+                c.get("nome", ""),
+                c.get("email", ""),
+                c.get("telefone") or "Não informado",
+                c.get("data_cadastro", "")
+            ]
+
+    return _gerar_pdf(
+        "relatorio_clientes", "RELATÓRIO DE CLIENTES - VIVANTS",
+        ["ID", "Nome", "Email", "Telefone", "Cadastro"], linhas(),
+        lambda: [f"Total de clientes: {totais['clientes']}"], "clientes", salvar_arquivo
+    )
 
-    buffer.seek(0)
-    return buffer
+# -----------------------
+# Execução em processo separado (não bloqueia o worker web)
+# -----------------------
+RELATORIOS_PROCESSOS = int(os.environ.get("VIVANTS_RELATORIOS_PROCESSOS", 2))
+
+GERADORES = {
+    ("produtos", "excel"): gerar_excel_produtos,
+    ("pedidos", "excel"): gerar_excel_pedidos,
+    ("clientes", "excel"): gerar_excel_clientes,
+    ("produtos", "pdf"): gerar_pdf_produtos,
+    ("pedidos", "pdf"): gerar_pdf_pedidos,
+    ("clientes", "pdf"): gerar_pdf_clientes,
+}
+
+_executor = None
+
+def executor_relatorios():
+    """ProcessPoolExecutor compartilhado (spawn: seguro mesmo com threads no processo pai)"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=RELATORIOS_PROCESSOS, mp_context=get_context("spawn"))
+    return _executor
 
 # -----------------------
 # Listar relatórios salvos
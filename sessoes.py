@@ -0,0 +1,298 @@
+import json
+import os
+import re
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+
+from database import get_pool, transacao_escrita
+
+# Backend da sessão: 'arquivo' (um arquivo por sessão, compartilhado pelos workers
+# da máquina), 'sqlite' (tabela sessoes, para vários servidores no mesmo banco) ou
+# 'cookie' (sessão assinada padrão do Flask). O padrão é 'arquivo': o carrinho de
+# visitante e os flashes mudam a sessão a cada clique, e no 'sqlite' cada mudança
+# seria uma transação na fila do único escritor do banco
+SESSOES_BACKEND = os.environ.get('VIVANTS_SESSOES', 'arquivo')
+SESSOES_DIR = os.environ.get(
+    'VIVANTS_SESSOES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'sessoes')
+)
+# A validade no servidor só é renovada depois desse intervalo (evita uma escrita por request)
+SESSAO_RENOVACAO = int(os.environ.get('VIVANTS_SESSAO_RENOVACAO', 3600))
+# Intervalo mínimo entre varreduras de sessões expiradas (feitas junto de uma gravação)
+SESSAO_VARREDURA = int(os.environ.get('VIVANTS_SESSAO_VARREDURA', 600))
+
+# secrets.token_urlsafe(32): 43 caracteres; qualquer outro valor de cookie é ignorado
+_ID_VALIDO = re.compile(r'[A-Za-z0-9_-]{43}')
+
+_serializador = TaggedJSONSerializer()
+
+
+def novo_id():
+    return secrets.token_urlsafe(32)
+
+
+class _Varredura:
+    """Dispara a limpeza de expiradas no máximo uma vez por SESSAO_VARREDURA por processo"""
+
+    def __init__(self):
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+
+    def devida(self):
+        with self._lock:
+            if time.monotonic() - self._ultima < SESSAO_VARREDURA:
+                return False
+            self._ultima = time.monotonic()
+            return True
+
+
+class SessoesSQLite:
+    """Sessões na tabela sessoes (migração 9)"""
+
+    def __init__(self):
+        self._varredura = _Varredura()
+        self._verificar_tabela()
+
+    def _verificar_tabela(self):
+        # Sem a tabela cada request falharia no carregar(): melhor não subir
+        db = get_pool().emprestar()
+        try:
+            existe = db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sessoes'"
+            ).fetchone()
+        finally:
+            db.close()
+        if not existe:
+            raise RuntimeError(
+                "Tabela 'sessoes' não existe: aplique as migrações (flask --app app migrar) "
+                "ou use VIVANTS_SESSOES=arquivo"
+            )
+
+    def carregar(self, sid):
+        db = get_pool().emprestar()
+        try:
+            row = db.execute(
+                'SELECT dados, expira FROM sessoes WHERE id = ? AND expira > ?', (sid, time.time())
+            ).fetchone()
+        finally:
+            db.close()
+        return (row['dados'], row['expira']) if row else None
+
+    def gravar(self, sid, dados, expira):
+        db = get_pool().emprestar()
+        try:
+            with transacao_escrita(db):
+                db.execute('''
+                    INSERT INTO sessoes (id, dados, expira) VALUES (?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET dados = excluded.dados, expira = excluded.expira
+                ''', (sid, dados, expira))
+                if self._varredura.devida():
+                    self._remover_expiradas(db)
+        finally:
+            db.close()
+
+    def remover(self, sid):
+        db = get_pool().emprestar()
+        try:
+            with transacao_escrita(db):
+                db.execute('DELETE FROM sessoes WHERE id = ?', (sid,))
+        finally:
+            db.close()
+
+    def _remover_expiradas(self, db):
+        return db.execute('DELETE FROM sessoes WHERE expira <= ?', (time.time(),)).rowcount
+
+    def varrer(self):
+        db = get_pool().emprestar()
+        try:
+            with transacao_escrita(db):
+                return self._remover_expiradas(db)
+        finally:
+            db.close()
+
+
+class SessoesArquivo:
+    """Um arquivo JSON por sessão em SESSOES_DIR (sem passar pelo escritor do SQLite)"""
+
+    def __init__(self, pasta=SESSOES_DIR):
+        self.pasta = pasta
+        self._varredura = _Varredura()
+
+    def _caminho(self, sid):
+        return os.path.join(self.pasta, sid[:2], sid)
+
+    def carregar(self, sid):
+        try:
+            with open(self._caminho(sid)) as f:
+                registro = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if registro['expira'] <= time.time():
+            self.remover(sid)
+            return None
+        return registro['dados'], registro['expira']
+
+    def gravar(self, sid, dados, expira):
+        caminho = self._caminho(sid)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f'{caminho}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporario, 'w') as f:
+            json.dump({'dados': dados, 'expira': expira}, f)
+        os.replace(temporario, caminho)
+        if self._varredura.devida():
+            self.varrer()
+
+    def remover(self, sid):
+        try:
+            os.remove(self._caminho(sid))
+        except FileNotFoundError:
+            pass
+
+    def varrer(self):
+        removidas = 0
+        agora = time.time()
+        for diretorio, _, arquivos in os.walk(self.pasta):
+            for arquivo in arquivos:
+                if not _ID_VALIDO.fullmatch(arquivo):
+                    continue
+                caminho = os.path.join(diretorio, arquivo)
+                try:
+                    with open(caminho) as f:
+                        expirada = json.load(f)['expira'] <= agora
+                    if expirada:
+                        os.remove(caminho)
+                        removidas += 1
+                except (OSError, ValueError, KeyError):
+                    pass
+        return removidas
+
+
+class SessaoServidor(SessionMixin):
+    """Sessão cujo conteúdo fica no servidor; o cookie leva só o id.
+
+    O armazenamento só é lido no primeiro acesso ao conteúdo: requests sem
+    cookie (visitantes anônimos) e views que não usam a sessão não tocam nele.
+    """
+
+    def __init__(self, armazenamento, sid=None):
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.expira = None
+        self.usuario_inicial = None
+        self._armazenamento = armazenamento
+        self._dados = None if sid else {}
+
+    @property
+    def carregada(self):
+        return self._dados is not None
+
+    @property
+    def dados(self):
+        self.accessed = True
+        if self._dados is None:
+            registro = self._armazenamento.carregar(self.sid)
+            if registro is None:
+                # Expirada ou desconhecida: começa vazia e ganha id novo se for gravada
+                self.sid, self.new, self._dados = None, True, {}
+            else:
+                texto, self.expira = registro
+                self._dados = _serializador.loads(texto)
+            self.usuario_inicial = self._dados.get('user_id')
+        return self._dados
+
+    def __getitem__(self, chave):
+        return self.dados[chave]
+
+    def __setitem__(self, chave, valor):
+        self.dados[chave] = valor
+        self.modified = True
+
+    def __delitem__(self, chave):
+        del self.dados[chave]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.dados)
+
+    def __len__(self):
+        return len(self.dados)
+
+    def __repr__(self):
+        return f'<SessaoServidor {self.sid!r} {self._dados!r}>'
+
+
+class InterfaceSessaoServidor(SessionInterface):
+    """SessionInterface do Flask com o conteúdo guardado em `armazenamento`"""
+
+    def __init__(self, armazenamento):
+        self.armazenamento = armazenamento
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid is not None and not _ID_VALIDO.fullmatch(sid):
+            sid = None
+        return SessaoServidor(self.armazenamento, sid)
+
+    def save_session(self, app, session, response):
+        nome = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        caminho = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.carregada:
+            return
+
+        if not session:
+            if session.sid:
+                self.armazenamento.remover(session.sid)
+                response.delete_cookie(nome, domain=dominio, path=caminho,
+                                       secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        # Login/logout troca o id (evita fixação de sessão)
+        if session.sid and session.get('user_id') != session.usuario_inicial:
+            self.armazenamento.remover(session.sid)
+            session.sid = None
+
+        agora = time.time()
+        vida = app.permanent_session_lifetime.total_seconds()
+        novo = session.sid is None
+        if novo:
+            session.sid = novo_id()
+        renovar = session.expira is not None and session.expira - agora < vida - SESSAO_RENOVACAO
+        if novo or session.modified or renovar:
+            self.armazenamento.gravar(session.sid, _serializador.dumps(dict(session)), agora + vida)
+
+        if novo or (renovar and session.permanent):
+            response.set_cookie(
+                nome, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=dominio,
+                path=caminho,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+
+BACKENDS = {
+    'sqlite': SessoesSQLite,
+    'arquivo': SessoesArquivo,
+}
+
+
+def init_app(app, backend=SESSOES_BACKEND):
+    """Troca a sessão em cookie assinado pela sessão no servidor ('cookie' mantém a padrão)"""
+    if backend == 'cookie':
+        return None
+    armazenamento = BACKENDS[backend]()
+    app.session_interface = InterfaceSessaoServidor(armazenamento)
+    return armazenamento
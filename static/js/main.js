@@ -29,6 +29,9 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Newsletter
     initNewsletter();
+
+    // Autocomplete da busca de produtos
+    initSearchAutocomplete();
 });
 
 // Slider Principal
@@ -126,6 +129,40 @@ function initNewsletter() {
     }
 }
 
+// Autocomplete da busca (preenche o datalist com sugestões do servidor)
+function initSearchAutocomplete() {
+    const input = document.querySelector('input[data-autocomplete-url]');
+    if (!input || !input.list) return;
+
+    const datalist = input.list;
+    let timer = null;
+    let controller = null;
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        const termo = input.value.trim();
+        if (termo.length < 2) return;
+
+        timer = setTimeout(function() {
+            if (controller) controller.abort();
+            controller = new AbortController();
+
+            const url = input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(termo);
+            fetch(url, { signal: controller.signal })
+                .then(response => response.json())
+                .then(sugestoes => {
+                    datalist.innerHTML = '';
+                    sugestoes.forEach(sugestao => {
+                        const option = document.createElement('option');
+                        option.value = sugestao.nome;
+                        datalist.appendChild(option);
+                    });
+                })
+                .catch(() => {});
+        }, 150);
+    });
+}
+
 // Validação de Email
 function validateEmail(email) {
     const re = /^[^\s@]+@[^\s@]+\.[^\s@]+$/;
@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from cache import invalidar_catalogo
+from database import get_pool, transacao_escrita
+from relacionados import atualizar_relacionados
+from relatorios import CONSULTAS_RELATORIO, GERADORES, executor_relatorios
+
+logger = logging.getLogger(__name__)
+
+# Intervalo do pulso: enquanto roda, a tarefa renova data_atualizacao
+TAREFA_PULSO = float(os.environ.get('VIVANTS_TAREFA_PULSO', 30))
+
+# Tarefa sem atualização por mais que isso é considerada abandonada (ex.: o
+# servidor caiu no meio da geração) e deixa de receber pedidos novos
+TAREFA_TIMEOUT = float(os.environ.get('VIVANTS_TAREFA_TIMEOUT', 120))
+
+# Frequência (em linhas lidas) das atualizações de progresso no banco
+PROGRESSO_A_CADA = 500
+
+# Faixa do progresso ocupada pela leitura; o restante é a montagem do arquivo
+PROGRESSO_LEITURA = 90
+
+# Intervalo mínimo entre duas atualizações agendadas do índice de relacionados
+RELACIONADOS_INTERVALO = float(os.environ.get('VIVANTS_RELACIONADOS_INTERVALO', 300))
+
+class TarefaInvalida(ValueError):
+    """Tipo de relatório desconhecido"""
+
+
+def _chave(tipo, parametros):
+    return f"{tipo}:{json.dumps(parametros, sort_keys=True, separators=(',', ':'))}"
+
+
+def _processo():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _processo_vivo(processo, na_subida=False):
+    """False só quando o dono da tarefa é um processo desta máquina que não existe mais"""
+    host, _, pid = (processo or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        # Outra máquina (ou tarefa sem dono registrado): decide o pulso
+        return True
+    if int(pid) == os.getpid():
+        # Na subida, o pid atual só pode ter sido herdado de um processo morto
+        return not na_subida
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _expirar_abandonadas(db, na_subida=False):
+    """Marca como erro as tarefas ativas sem pulso recente ou cujo processo morreu
+
+    Só tarefas em execução têm pulso: as pendentes podem esperar na fila do
+    pool por mais que TAREFA_TIMEOUT e dependem só do processo dono.
+    """
+    expiradas = db.execute('''
+        UPDATE tarefas
+        SET status = 'erro', erro = 'Tarefa abandonada (sem progresso)', data_conclusao = datetime('now')
+        WHERE status = 'executando'
+          AND data_atualizacao < datetime('now', ?)
+    ''', (f'-{int(TAREFA_TIMEOUT)} seconds',)).rowcount
+    orfas = [
+        (row['id'],)
+        for row in db.execute("SELECT id, processo FROM tarefas WHERE status IN ('pendente', 'executando')")
+        if not _processo_vivo(row['processo'], na_subida)
+    ]
+    db.executemany('''
+        UPDATE tarefas
+        SET status = 'erro', erro = 'Processo da tarefa encerrado', data_conclusao = datetime('now')
+        WHERE id = ?
+    ''', orfas)
+    return expiradas + len(orfas)
+
+
+def init_app(app):
+    """Na subida do worker, encerra as tarefas deixadas por processos que caíram"""
+    db = get_pool().emprestar()
+    try:
+        with transacao_escrita(db):
+            encerradas = _expirar_abandonadas(db, na_subida=True)
+        if encerradas:
+            logger.warning('%s tarefa(s) abandonada(s) marcada(s) como erro', encerradas)
+    except sqlite3.OperationalError:
+        # Banco ainda sem a tabela (VIVANTS_MIGRAR=0 antes do `flask migrar`)
+        logger.exception('Não foi possível verificar as tarefas abandonadas')
+    finally:
+        db.close()
+
+
+def _atualizar(db, tarefa_id, finalizada=False, **campos):
+    atribuicoes = ', '.join(f'{campo} = ?' for campo in campos)
+    if finalizada:
+        atribuicoes += ", data_conclusao = datetime('now')"
+    with transacao_escrita(db):
+        db.execute(
+            f"UPDATE tarefas SET {atribuicoes}, data_atualizacao = datetime('now') WHERE id = ?",
+            (*campos.values(), tarefa_id)
+        )
+
+
+def enfileirar_relatorio(db, entidade, formato):
+    """Cria a tarefa do relatório e a envia ao pool de processos.
+
+    Se já existe uma tarefa idêntica pendente ou em execução, o pedido se junta
+    a ela. Retorna (tarefa_id, nova).
+    """
+    if (entidade, formato) not in GERADORES:
+        raise TarefaInvalida(f'Relatório desconhecido: {entidade}/{formato}')
+
+    return _enfileirar(db, 'relatorio', {'entidade': entidade, 'formato': formato}, executar_relatorio)
+
+
+def agendar_relacionados(db):
+    """Enfileira a atualização incremental do índice de produtos relacionados.
+
+    Chamada depois de criar, cancelar ou excluir pedidos. Só enfileira se há
+    pedidos novos ou invalidações e a última atualização tem mais de
+    RELACIONADOS_INTERVALO segundos; pedidos feitos dentro do intervalo
+    entram na atualização agendada pelo próximo pedido. Retorna o id da
+    tarefa ou None.
+    """
+    estado = db.execute('''
+        SELECT marca, invalidacoes, data_atualizacao > datetime('now', ?) AS recente
+        FROM indices_estado WHERE nome = 'relacionados'
+    ''', (f'-{int(RELACIONADOS_INTERVALO)} seconds',)).fetchone()
+    if estado is not None:
+        if estado['recente']:
+            return None
+        ultimo = db.execute('SELECT COALESCE(MAX(id), 0) FROM pedidos').fetchone()[0]
+        if ultimo <= estado['marca'] and not estado['invalidacoes']:
+            return None
+    return _enfileirar(db, 'relacionados', {}, executar_relacionados)[0]
+
+
+def _enfileirar(db, tipo, parametros, executar):
+    chave = _chave(tipo, parametros)
+    with transacao_escrita(db):
+        _expirar_abandonadas(db)
+        existente = db.execute(
+            "SELECT id FROM tarefas WHERE chave = ? AND status IN ('pendente', 'executando')", (chave,)
+        ).fetchone()
+        if existente:
+            return existente['id'], False
+        # Até ser reservada, a tarefa pertence a este processo (dono do pool)
+        tarefa_id = db.execute('''
+            INSERT INTO tarefas (tipo, parametros, chave, mensagem, processo)
+            VALUES (?, ?, ?, 'Na fila', ?)
+        ''', (tipo, json.dumps(parametros), chave, _processo())).lastrowid
+
+    try:
+        executor_relatorios().submit(executar, tarefa_id)
+    except Exception as e:
+        _atualizar(db, tarefa_id, status='erro', erro=f'Falha ao iniciar: {e}', finalizada=True)
+        raise
+    return tarefa_id, True
+
+
+def _acompanhar(linhas, db, tarefa_id, total):
+    """Repassa as linhas ao gerador gravando o progresso a cada PROGRESSO_A_CADA"""
+    lidas = 0
+    for linha in linhas:
+        yield linha
+        lidas += 1
+        if lidas % PROGRESSO_A_CADA == 0:
+            _atualizar(db, tarefa_id, progresso=min(PROGRESSO_LEITURA, lidas * PROGRESSO_LEITURA // max(total, 1)),
+                       mensagem=f'{lidas} de {total} linha(s) lida(s)')
+    _atualizar(db, tarefa_id, progresso=PROGRESSO_LEITURA, mensagem='Gerando arquivo')
+
+
+def _pulsar(tarefa_id, parar):
+    """Renova data_atualizacao a cada TAREFA_PULSO até `parar` ser sinalizado"""
+    db = get_pool().emprestar()
+    try:
+        while not parar.wait(TAREFA_PULSO):
+            with transacao_escrita(db):
+                db.execute(
+                    "UPDATE tarefas SET data_atualizacao = datetime('now') WHERE id = ? AND status = 'executando'",
+                    (tarefa_id,)
+                )
+    except Exception:
+        logger.exception('Pulso da tarefa %s interrompido', tarefa_id)
+    finally:
+        db.close()
+
+
+def _reservar(db, tarefa_id, mensagem):
+    """Reserva atômica: a tarefa só roda uma vez, mesmo se enviada em dobro"""
+    with transacao_escrita(db):
+        return db.execute('''
+            UPDATE tarefas
+            SET status = 'executando', mensagem = ?, processo = ?,
+                data_inicio = datetime('now'), data_atualizacao = datetime('now')
+            WHERE id = ? AND status = 'pendente'
+        ''', (mensagem, _processo(), tarefa_id)).rowcount > 0
+
+
+@contextmanager
+def _com_pulso(tarefa_id):
+    parar = threading.Event()
+    pulso = threading.Thread(target=_pulsar, args=(tarefa_id, parar), daemon=True)
+    pulso.start()
+    try:
+        yield
+    finally:
+        parar.set()
+        pulso.join()
+
+
+def executar_relatorio(tarefa_id):
+    """Executa a tarefa num processo do pool (lê o banco e grava em RELATORIOS_DIR)"""
+    pool = get_pool()
+    db = pool.emprestar()
+    # Conexão separada para o progresso: a de leitura fica com o cursor aberto
+    db_progresso = pool.emprestar()
+    try:
+        if not _reservar(db, tarefa_id, 'Lendo dados'):
+            return None
+
+        parametros = json.loads(db.execute('SELECT parametros FROM tarefas WHERE id = ?', (tarefa_id,)).fetchone()[0])
+        entidade, formato = parametros['entidade'], parametros['formato']
+        consulta = CONSULTAS_RELATORIO[entidade]
+        with _com_pulso(tarefa_id):
+            total = db.execute(f'SELECT COUNT(*) FROM ({consulta})').fetchone()[0]
+            linhas = _acompanhar(db.execute(consulta), db_progresso, tarefa_id, total)
+            filename, _ = GERADORES[(entidade, formato)](linhas, True)
+
+        _atualizar(db_progresso, tarefa_id, status='concluido', progresso=100, arquivo=filename,
+                   mensagem=f'{total} linha(s)', finalizada=True)
+        return filename
+    except Exception as e:
+        logger.exception('Erro na tarefa %s', tarefa_id)
+        _atualizar(db_progresso, tarefa_id, status='erro', erro=str(e), finalizada=True)
+        return None
+    finally:
+        db.close()
+        db_progresso.close()
+
+
+def executar_relacionados(tarefa_id):
+    """Atualiza o índice de relacionados num processo do pool"""
+    db = get_pool().emprestar()
+    try:
+        if not _reservar(db, tarefa_id, 'Atualizando índice'):
+            return None
+        with _com_pulso(tarefa_id):
+            marca, produtos = atualizar_relacionados(db)
+        if produtos:
+            invalidar_catalogo()
+        _atualizar(db, tarefa_id, status='concluido', progresso=100,
+                   mensagem=f'Pedidos até #{marca}: {produtos} produto(s)', finalizada=True)
+        return marca
+    except Exception as e:
+        logger.exception('Erro na tarefa %s', tarefa_id)
+        _atualizar(db, tarefa_id, status='erro', erro=str(e), finalizada=True)
+        return None
+    finally:
+        db.close()
+
+
+def _como_dict(row):
+    tarefa = dict(row.items())
+    tarefa['parametros'] = json.loads(tarefa['parametros'])
+    return tarefa
+
+
+def obter_tarefa(db, tarefa_id):
+    """Tarefa como dicionário (para a API de status), ou None"""
+    row = db.execute('SELECT * FROM tarefas WHERE id = ?', (tarefa_id,)).fetchone()
+    return _como_dict(row) if row is not None else None
+
+
+def listar_tarefas(db, limite=20, tipo='relatorio'):
+    return [_como_dict(row) for row in db.execute(
+        'SELECT * FROM tarefas WHERE tipo = ? ORDER BY id DESC LIMIT ?', (tipo, limite)
+    )]
@@ -0,0 +1,191 @@
+"""Benchmark da API de análise de vendas: GROUP BY por requisição contra o snapshot colunar.
+
+Gera N pedidos (250 mil por padrão, 4 itens cada: 1 milhão de linhas em
+itens_pedido) espalhados pelos últimos dois anos e mede a carga completa do
+analise.SnapshotVendas, uma atualização incremental pela marca d'água e o p50
+/ p99 de cada consulta da API (resumo, receita por dia/semana/mês, top
+produtos, mix de categorias), comparando com as consultas SQL equivalentes
+que uma implementação por GROUP BY rodaria a cada requisição. A meta é
+ficar abaixo de 100 ms por resposta.
+
+    python tests/benchmark_analise.py --pedidos 250000 --itens 4 --repeticoes 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from analise import SnapshotVendas  # noqa: E402
+
+META_MS = 100
+
+# Consultas por requisição equivalentes às da API (janela de 90 dias)
+_JANELA = "p.status != 'cancelado' AND p.data_pedido >= datetime('now', '-90 days')"
+CONSULTAS_SQL = {
+    'resumo': f'''
+        SELECT COUNT(*), SUM(total), COUNT(DISTINCT usuario_id) FROM pedidos p WHERE {_JANELA}
+    ''',
+    'receita/dia': f'''
+        SELECT date(p.data_pedido), SUM(p.total), COUNT(*) FROM pedidos p WHERE {_JANELA} GROUP BY 1
+    ''',
+    'receita/semana': f'''
+        SELECT date(p.data_pedido, 'weekday 0', '-6 days'), SUM(p.total), COUNT(*)
+        FROM pedidos p WHERE {_JANELA} GROUP BY 1
+    ''',
+    'receita/mes': f'''
+        SELECT strftime('%Y-%m-01', p.data_pedido), SUM(p.total), COUNT(*) FROM pedidos p WHERE {_JANELA} GROUP BY 1
+    ''',
+    'produtos': f'''
+        SELECT i.produto_id, SUM(i.quantidade), SUM(i.quantidade * i.preco_unitario) AS receita
+        FROM itens_pedido i JOIN pedidos p ON p.id = i.pedido_id
+        WHERE {_JANELA} GROUP BY i.produto_id ORDER BY receita DESC LIMIT 10
+    ''',
+    'categorias': f'''
+        SELECT COALESCE(pr.categoria_id, 0), SUM(i.quantidade), SUM(i.quantidade * i.preco_unitario) AS receita
+        FROM itens_pedido i JOIN pedidos p ON p.id = i.pedido_id LEFT JOIN produtos pr ON pr.id = i.produto_id
+        WHERE {_JANELA} GROUP BY 1 ORDER BY receita DESC
+    ''',
+}
+
+
+def preparar(caminho, pedidos, itens):
+    """Banco novo com `pedidos` pedidos de 1000 clientes, `itens` itens cada, sobre 2000 produtos"""
+    database.DATABASE = caminho
+    database._pool = database.PoolConexoes(caminho, tamanho=2)
+    database._pool_pid = os.getpid()
+    database.init_db()
+    db = database.get_db()
+    try:
+        with database.transacao_escrita(db):
+            db.executemany(
+                "INSERT INTO usuarios (nome, email, senha, tipo) VALUES (?, ?, 'x', 'cliente')",
+                [(f'Cliente {i}', f'cliente{i}@bench') for i in range(1000)]
+            )
+            db.execute('''
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 2000)
+                INSERT INTO produtos (nome, preco, categoria_id, estoque)
+                SELECT 'Produto ' || i, 5 + i % 200, 1 + i % 5, 1000 FROM n
+            ''')
+            _inserir_pedidos(db, pedidos, itens, minutos=2 * 365 * 24 * 60)
+    finally:
+        db.close()
+
+
+def _inserir_pedidos(db, pedidos, itens, minutos, deslocamento=0):
+    """`pedidos` pedidos espalhados pelos últimos `minutos`, com `itens` itens cada"""
+    primeiro = db.execute('SELECT COALESCE(MAX(id), 0) FROM pedidos').fetchone()[0]
+    db.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO pedidos (usuario_id, total, status, endereco_entrega, data_pedido)
+        SELECT (SELECT MIN(id) FROM usuarios WHERE email LIKE '%@bench') + (i * 7919) % 1000,
+               0, CASE WHEN i % 10 = 0 THEN 'cancelado' ELSE 'entregue' END, 'Rua do Benchmark, ' || i,
+               datetime('now', '-' || (? + (i * 104729) % ?) || ' minutes')
+        FROM n
+    ''', (pedidos, deslocamento, minutos))
+    db.execute('''
+        WITH RECURSIVE k(j) AS (SELECT 0 UNION ALL SELECT j + 1 FROM k WHERE j < ? - 1)
+        INSERT INTO itens_pedido (pedido_id, produto_id, quantidade, preco_unitario)
+        SELECT p.id, pr.id, 1 + (p.id + k.j) % 3, pr.preco
+        FROM pedidos p, k
+        JOIN produtos pr ON pr.id = (SELECT MIN(id) FROM produtos WHERE nome LIKE 'Produto %')
+                                    + (p.id * 31 + k.j * 997) % 2000
+        WHERE p.id > ?
+    ''', (itens, primeiro))
+    db.execute('''
+        UPDATE pedidos SET total = (SELECT SUM(quantidade * preco_unitario) FROM itens_pedido WHERE pedido_id = pedidos.id)
+        WHERE id > ?
+    ''', (primeiro,))
+
+
+def _percentil(amostras, p):
+    ordenadas = sorted(amostras)
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p / 100))]
+
+
+def _medir(consulta, repeticoes):
+    amostras = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        consulta()
+        amostras.append((time.perf_counter() - inicio) * 1000)
+    return _percentil(amostras, 50), _percentil(amostras, 99)
+
+
+def _imprimir(nome, p50, p99):
+    situacao = 'ok' if p99 < META_MS else 'ACIMA DA META'
+    print(f'  {nome:<16} p50 {p50:9.2f} ms  p99 {p99:9.2f} ms  {situacao}')
+
+
+def executar(modo, db, repeticoes):
+    if modo == 'antes':
+        print(f'[antes] GROUP BY por requisição ({repeticoes} repetições)')
+        for nome, sql in CONSULTAS_SQL.items():
+            _imprimir(nome, *_medir(lambda: db.execute(sql).fetchall(), repeticoes))
+        return
+
+    snapshot = SnapshotVendas()
+    inicio = time.perf_counter()
+    snapshot.atualizar(db, forcar=True)
+    carga = time.perf_counter() - inicio
+    stats = snapshot.estatisticas()
+    print(f'[depois] carga completa: {stats["pedidos"]} pedidos, {stats["itens"]} itens em {carga:.2f}s')
+
+    consultas = {
+        'resumo': lambda: snapshot.resumo(90),
+        'receita/dia': lambda: snapshot.receita_por_periodo('dia', 90),
+        'receita/semana': lambda: snapshot.receita_por_periodo('semana', 90),
+        'receita/mes': lambda: snapshot.receita_por_periodo('mes', 90),
+        'produtos': lambda: snapshot.top_produtos(10, 90),
+        'categorias': lambda: snapshot.mix_categorias(90),
+        'resumo (tudo)': lambda: snapshot.resumo(None),
+    }
+    for nome, consulta in consultas.items():
+        _imprimir(nome, *_medir(consulta, repeticoes))
+
+    # Pedidos novos depois da marca d'água: só eles são lidos
+    with database.transacao_escrita(db):
+        _inserir_pedidos(db, 1000, 4, minutos=1)
+    inicio = time.perf_counter()
+    _incremental(snapshot, db)
+    incremento = time.perf_counter() - inicio
+    stats = snapshot.estatisticas()
+    print(f'  incremental: +1000 pedidos em {incremento * 1000:.1f} ms'
+          f'  (incrementos {stats["incrementos"]}, cargas {stats["cargas"]}, resincronizações {stats["resincronizacoes"]})')
+
+
+def _incremental(snapshot, db):
+    # Sem esperar ANALISE_INTERVALO: força só a verificação, não a recarga
+    snapshot._verificado_em = 0.0
+    snapshot.atualizar(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, default=250000)
+    parser.add_argument('--itens', type=int, default=4, help='itens por pedido')
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--modo', choices=('antes', 'depois', 'ambos'), default='ambos')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, 'analise.db')
+        inicio = time.perf_counter()
+        preparar(caminho, args.pedidos, args.itens)
+        print(f'{args.pedidos} pedidos / {args.pedidos * args.itens} itens gerados'
+              f' em {time.perf_counter() - inicio:.2f}s')
+        db = database.get_db()
+        try:
+            modos = ('antes', 'depois') if args.modo == 'ambos' else (args.modo,)
+            for modo in modos:
+                executar(modo, db, args.repeticoes)
+        finally:
+            db.close()
+            database.get_pool().fechar_todas()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark da busca de produtos: LIKE '%termo%' contra o índice FTS5.
+
+Monta um catálogo sintético (100 mil produtos por padrão) e mede, para os
+mesmos termos, a consulta antiga da rota /produtos (LIKE em nome e descrição,
+ordenada por data_cadastro, todos os resultados), a busca FTS completa, a
+primeira página que a rota renderiza hoje (paginar_busca) e o autocomplete.
+Informa latências p50/p99 e quantos resultados cada lado achou — o LIKE não
+ignora acentos, o FTS sim.
+
+    python tests/benchmark_busca.py --produtos 100000 --buscas 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from busca import autocompletar, buscar_produtos, paginar_busca  # noqa: E402
+
+BUSCA_ANTIGA = '''
+    SELECT p.*, c.nome as categoria_nome
+    FROM produtos p
+    LEFT JOIN categorias c ON p.categoria_id = c.id
+    WHERE p.ativo = 1 AND (p.nome LIKE ? OR p.descricao LIKE ?)
+    ORDER BY p.data_cadastro DESC
+'''
+
+TIPOS = ['Shampoo', 'Condicionador', 'Máscara', 'Óleo', 'Sérum', 'Creme', 'Leave-in', 'Tônico',
+         'Esfoliante', 'Hidratante', 'Protetor', 'Gel', 'Loção', 'Spray', 'Sabonete']
+ATIVOS = ['Hidratação', 'Nutrição', 'Reconstrução', 'Argan', 'Coco', 'Queratina', 'Ácido Hialurônico',
+          'Vitamina C', 'Colágeno', 'Manteiga de Karité', 'Aloe Vera', 'Camomila', 'Própolis', 'Pantenol']
+PUBLICO = ['Cabelos Cacheados', 'Cabelos Lisos', 'Pele Oleosa', 'Pele Seca', 'Uso Diário', 'Pós-Sol',
+           'Antiqueda', 'Limpeza Profunda', 'Fios Danificados', 'Pele Sensível']
+TERMOS = ['hidratacao', 'hidratação', 'argan', 'shampoo', 'cachead', 'karite', 'vitamina c',
+          'oleo coco', 'pele sensivel', 'reconstrucao queratina', 'prop', 'antiqueda', 'xyzinexistente']
+
+
+def preparar(caminho, produtos):
+    """Banco novo com o catálogo sintético; o índice FTS5 é alimentado pelos triggers"""
+    database.DATABASE = caminho
+    database._pool = database.PoolConexoes(caminho, tamanho=2)
+    database._pool_pid = os.getpid()
+    database.init_db()
+    aleatorio = random.Random(42)
+    db = database.get_db()
+    try:
+        categorias = [row['id'] for row in db.execute('SELECT id FROM categorias')]
+        with database.transacao_escrita(db):
+            db.executemany(
+                '''INSERT INTO produtos (nome, descricao, preco, categoria_id, estoque, ativo, data_cadastro)
+                   VALUES (?, ?, ?, ?, ?, ?, datetime('now', ?))''',
+                (
+                    (f'{aleatorio.choice(TIPOS)} {aleatorio.choice(ATIVOS)} {i}',
+                     f'{aleatorio.choice(TIPOS)} com {aleatorio.choice(ATIVOS)} e '
+                     f'{aleatorio.choice(ATIVOS)} para {aleatorio.choice(PUBLICO)}.',
+                     round(aleatorio.uniform(10, 300), 2), aleatorio.choice(categorias),
+                     aleatorio.randint(0, 100), int(aleatorio.random() > 0.05),
+                     f'-{aleatorio.randint(0, 100000)} minutes')
+                    for i in range(produtos)
+                )
+            )
+        db.execute('ANALYZE')
+    finally:
+        db.close()
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def _medir(operacao, termos):
+    latencias, resultados = [], 0
+    for termo in termos:
+        inicio = time.perf_counter()
+        resultados += operacao(termo)
+        latencias.append(time.perf_counter() - inicio)
+    return latencias, resultados
+
+
+def executar(caminho, produtos, buscas):
+    inicio = time.perf_counter()
+    preparar(caminho, produtos)
+    print(f'{produtos} produtos inseridos e indexados em {time.perf_counter() - inicio:.2f}s')
+
+    termos = [TERMOS[i % len(TERMOS)] for i in range(buscas)]
+    db = database.get_db()
+    try:
+        lados = {
+            'LIKE': lambda t: len(db.execute(BUSCA_ANTIGA, (f'%{t}%', f'%{t}%')).fetchall()),
+            # Todos os resultados, como o LIKE devolvia, e só a página que a rota renderiza hoje
+            'FTS': lambda t: len(buscar_produtos(db, t)),
+            'FTS página': lambda t: len(paginar_busca(db, t)),
+            'autocomplete': lambda t: len(autocompletar(db, t)),
+        }
+        for nome, operacao in lados.items():
+            latencias, resultados = _medir(operacao, termos)
+            print(f'  {nome:<12} {len(latencias):>5} buscas  p50 {_percentil(latencias, 0.50) * 1000:8.2f} ms'
+                  f'  p99 {_percentil(latencias, 0.99) * 1000:8.2f} ms  resultados {resultados}')
+    finally:
+        db.close()
+        database.get_pool().fechar_todas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--produtos', type=int, default=100000)
+    parser.add_argument('--buscas', type=int, default=200, help='buscas medidas por lado')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        executar(os.path.join(pasta, 'busca.db'), args.produtos, args.buscas)
+
+
+if __name__ == '__main__':
+    main()
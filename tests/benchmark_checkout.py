@@ -0,0 +1,169 @@
+"""Teste de carga do checkout: muitos compradores disputando um produto de estoque limitado.
+
+Cada comprador (thread, opcionalmente em vários processos) repete o ciclo
+carrinho -> finalizar_compra com 1 a 3 unidades do produto disputado e uma de
+um produto com estoque de sobra. No fim confere que não houve venda acima do
+estoque (estoque final >= 0 e vendido + estoque final == estoque inicial) e
+informa pedidos/s, recusas por estoque e latências p50/p99 do checkout.
+
+    python tests/benchmark_checkout.py --processos 4 --compradores 8 --pedidos 50 --estoque 1000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from checkout import EstoqueInsuficiente, finalizar_compra  # noqa: E402
+
+
+def preparar(caminho, compradores, estoque):
+    """Banco novo com o produto disputado, um produto de sobra e os compradores"""
+    database.DATABASE = caminho
+    database._pool = database.PoolConexoes(caminho, tamanho=2)
+    database._pool_pid = os.getpid()
+    database.init_db()
+    db = database.get_db()
+    try:
+        with database.transacao_escrita(db):
+            disputado = db.execute(
+                "INSERT INTO produtos (nome, preco, categoria_id, estoque) VALUES ('Lote limitado', 50, 1, ?)",
+                (estoque,)
+            ).lastrowid
+            sobra = db.execute(
+                "INSERT INTO produtos (nome, preco, categoria_id, estoque) VALUES ('Brinde', 5, 1, 100000000)"
+            ).lastrowid
+            db.executemany(
+                "INSERT INTO usuarios (nome, email, senha, tipo) VALUES (?, ?, 'x', 'cliente')",
+                [(f'Comprador {i}', f'comprador{i}@bench') for i in range(compradores)]
+            )
+        usuarios = [row['id'] for row in db.execute("SELECT id FROM usuarios WHERE email LIKE '%@bench'")]
+    finally:
+        db.close()
+    database.get_pool().fechar_todas()
+    return disputado, sobra, usuarios
+
+
+def _comprar(usuario_id, disputado, sobra, quantidade):
+    db = database.get_db()
+    try:
+        with database.transacao_escrita(db):
+            db.execute('DELETE FROM carrinho WHERE usuario_id = ?', (usuario_id,))
+            db.executemany('INSERT INTO carrinho (usuario_id, produto_id, quantidade) VALUES (?, ?, ?)',
+                           [(usuario_id, disputado, quantidade), (usuario_id, sobra, 1)])
+        finalizar_compra(db, usuario_id, 'Rua do Benchmark, 1')
+    finally:
+        db.close()
+
+
+def _processo(caminho, usuarios, disputado, sobra, pedidos, fila):
+    """Um worker: uma thread por comprador, com pool do tamanho do número de threads"""
+    database.DATABASE = caminho
+    database._pool = database.PoolConexoes(caminho, tamanho=len(usuarios))
+    database._pool_pid = os.getpid()
+    resultado = {'vendidos': 0, 'pedidos': 0, 'recusados': 0, 'erros': [], 'latencias': []}
+    lock = threading.Lock()
+
+    def comprador(usuario_id):
+        aleatorio = random.Random(usuario_id)
+        for _ in range(pedidos):
+            quantidade = aleatorio.randint(1, 3)
+            inicio = time.perf_counter()
+            try:
+                _comprar(usuario_id, disputado, sobra, quantidade)
+            except EstoqueInsuficiente:
+                with lock:
+                    resultado['recusados'] += 1
+                continue
+            except Exception as e:
+                with lock:
+                    resultado['erros'].append(repr(e))
+                continue
+            with lock:
+                resultado['pedidos'] += 1
+                resultado['vendidos'] += quantidade
+                resultado['latencias'].append(time.perf_counter() - inicio)
+
+    threads = [threading.Thread(target=comprador, args=(u,)) for u in usuarios]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    database.get_pool().fechar_todas()
+    fila.put(resultado)
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def executar(caminho, processos, compradores, pedidos, estoque):
+    disputado, sobra, usuarios = preparar(caminho, processos * compradores, estoque)
+
+    contexto = multiprocessing.get_context('fork' if hasattr(os, 'fork') else 'spawn')
+    fila = contexto.Queue()
+    workers = [
+        contexto.Process(target=_processo, args=(
+            caminho, usuarios[i * compradores:(i + 1) * compradores], disputado, sobra, pedidos, fila))
+        for i in range(processos)
+    ]
+    inicio = time.perf_counter()
+    for w in workers:
+        w.start()
+    resultados = [fila.get() for _ in workers]
+    for w in workers:
+        w.join()
+    duracao = time.perf_counter() - inicio
+
+    total = {chave: sum(r[chave] for r in resultados) for chave in ('vendidos', 'pedidos', 'recusados')}
+    erros = [e for r in resultados for e in r['erros']]
+    latencias = [x for r in resultados for x in r['latencias']]
+
+    db = database.get_db()
+    try:
+        restante = db.execute('SELECT estoque FROM produtos WHERE id = ?', (disputado,)).fetchone()[0]
+        gravado = db.execute('SELECT COALESCE(SUM(quantidade), 0) FROM itens_pedido WHERE produto_id = ?',
+                             (disputado,)).fetchone()[0]
+    finally:
+        db.close()
+        database.get_pool().fechar_todas()
+
+    tentativas = total['pedidos'] + total['recusados'] + len(erros)
+    print(f'{processos} processo(s) x {compradores} compradores, {tentativas} checkouts em {duracao:.2f}s')
+    print(f'  pedidos: {total["pedidos"]} ({total["pedidos"] / duracao:.1f}/s)  recusados por estoque: '
+          f'{total["recusados"]}  erros: {len(erros)}  ({tentativas / duracao:.1f} checkouts/s)')
+    print(f'  checkout p50 {_percentil(latencias, 0.50) * 1000:.2f} ms  p99 {_percentil(latencias, 0.99) * 1000:.2f} ms')
+    print(f'  estoque inicial {estoque}, vendido {total["vendidos"]} (gravado {gravado}), restante {restante}')
+    for erro in erros[:5]:
+        print(f'  erro: {erro}')
+
+    sem_oversell = restante >= 0 and gravado == total['vendidos'] and gravado + restante == estoque
+    print('  OK: nenhuma venda acima do estoque' if sem_oversell else '  FALHA: estoque inconsistente')
+    return sem_oversell
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processos', type=int, default=4, help='workers (processos) concorrentes')
+    parser.add_argument('--compradores', type=int, default=8, help='threads compradoras por processo')
+    parser.add_argument('--pedidos', type=int, default=50, help='checkouts tentados por comprador')
+    parser.add_argument('--estoque', type=int, default=1000, help='estoque inicial do produto disputado')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        ok = executar(os.path.join(pasta, 'checkout.db'), args.processos, args.compradores,
+                      args.pedidos, args.estoque)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
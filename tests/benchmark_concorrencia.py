@@ -0,0 +1,187 @@
+"""Benchmark de concorrência: checkouts simultâneos junto com leituras do catálogo.
+
+Compara o acesso antigo ao banco (conexão nova por operação, journal padrão,
+transação adiada, sem fila) com o atual (pool, WAL + PRAGMAs e
+transacao_escrita) e informa erros de lock e latências p50/p99 de cada lado.
+
+    python tests/benchmark_concorrencia.py --compradores 16 --leitores 8 --pedidos 25 --leituras 100
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from checkout import finalizar_compra  # noqa: E402
+
+CATALOGO = 'SELECT id, nome, preco, estoque FROM produtos WHERE ativo = 1 ORDER BY destaque DESC, nome'
+
+
+def preparar(caminho, compradores, conexoes):
+    """Banco novo com estoque de sobra e um usuário por comprador.
+
+    O pool ganha uma conexão por thread, como um worker com POOL_SIZE
+    igual ao número de threads: a espera medida é a do banco, não a do pool.
+    """
+    database.DATABASE = caminho
+    database._pool = database.PoolConexoes(caminho, tamanho=conexoes)
+    database._pool_pid = os.getpid()
+    database.init_db()
+    db = database.get_db()
+    try:
+        with database.transacao_escrita(db):
+            db.execute('UPDATE produtos SET estoque = 1000000')
+            db.executemany(
+                "INSERT INTO usuarios (nome, email, senha, tipo) VALUES (?, ?, 'x', 'cliente')",
+                [(f'Comprador {i}', f'comprador{i}@bench') for i in range(compradores)]
+            )
+        usuarios = [row['id'] for row in db.execute("SELECT id FROM usuarios WHERE email LIKE '%@bench'")]
+        produtos = [row['id'] for row in db.execute('SELECT id FROM produtos')]
+    finally:
+        db.close()
+    database.get_pool().fechar_todas()
+    return usuarios, produtos
+
+
+def _checkout_antigo(caminho, usuario_id, produto_id):
+    # Como a rota fazia antes: conexão nova, leitura e escritas numa transação adiada
+    db = sqlite3.connect(caminho)
+    try:
+        db.execute('INSERT INTO carrinho (usuario_id, produto_id, quantidade) VALUES (?, ?, 1)',
+                   (usuario_id, produto_id))
+        db.commit()
+        itens = db.execute('''
+            SELECT c.produto_id, c.quantidade, p.preco FROM carrinho c
+            JOIN produtos p ON c.produto_id = p.id WHERE c.usuario_id = ?
+        ''', (usuario_id,)).fetchall()
+        total = sum(preco * quantidade for _, quantidade, preco in itens)
+        pedido_id = db.execute(
+            "INSERT INTO pedidos (usuario_id, total, status, data_pedido) VALUES (?, ?, 'pendente', datetime('now'))",
+            (usuario_id, total)
+        ).lastrowid
+        for produto, quantidade, preco in itens:
+            db.execute('INSERT INTO itens_pedido (pedido_id, produto_id, quantidade, preco_unitario) VALUES (?, ?, ?, ?)',
+                       (pedido_id, produto, quantidade, preco))
+            db.execute('UPDATE produtos SET estoque = estoque - ? WHERE id = ?', (quantidade, produto))
+        db.execute('DELETE FROM carrinho WHERE usuario_id = ?', (usuario_id,))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _leitura_antiga(caminho):
+    db = sqlite3.connect(caminho)
+    try:
+        db.execute(CATALOGO).fetchall()
+    finally:
+        db.close()
+
+
+def _checkout_atual(usuario_id, produto_id):
+    db = database.get_db()
+    try:
+        with database.transacao_escrita(db):
+            db.execute('INSERT INTO carrinho (usuario_id, produto_id, quantidade) VALUES (?, ?, 1)',
+                       (usuario_id, produto_id))
+        finalizar_compra(db, usuario_id, 'Rua do Benchmark, 1')
+    finally:
+        db.close()
+
+
+def _leitura_atual():
+    db = database.get_db()
+    try:
+        db.execute(CATALOGO).fetchall()
+    finally:
+        db.close()
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def executar(modo, caminho, compradores, leitores, pedidos, leituras):
+    usuarios, produtos = preparar(caminho, compradores, compradores + leitores)
+    if modo == 'antes':
+        conn = sqlite3.connect(caminho)
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.close()
+        checkout = lambda u, p: _checkout_antigo(caminho, u, p)  # noqa: E731
+        leitura = lambda: _leitura_antiga(caminho)  # noqa: E731
+    else:
+        checkout, leitura = _checkout_atual, _leitura_atual
+
+    latencias = {'checkout': [], 'leitura': []}
+    erros = {'lock': 0, 'outros': 0}
+    lock = threading.Lock()
+
+    def medir(tipo, operacao):
+        inicio = time.perf_counter()
+        try:
+            operacao()
+        except database.PoolEsgotado:
+            with lock:
+                erros['outros'] += 1
+            return
+        except sqlite3.OperationalError as e:
+            with lock:
+                erros['lock' if 'locked' in str(e) or 'busy' in str(e) else 'outros'] += 1
+            return
+        except Exception:
+            with lock:
+                erros['outros'] += 1
+            return
+        with lock:
+            latencias[tipo].append(time.perf_counter() - inicio)
+
+    def comprador(i):
+        for n in range(pedidos):
+            medir('checkout', lambda: checkout(usuarios[i], produtos[n % len(produtos)]))
+
+    def leitor():
+        for _ in range(leituras):
+            medir('leitura', leitura)
+
+    threads_leitura = [threading.Thread(target=leitor) for _ in range(leitores)]
+    threads_compra = [threading.Thread(target=comprador, args=(i,)) for i in range(compradores)]
+    inicio = time.perf_counter()
+    for t in threads_leitura + threads_compra:
+        t.start()
+    for t in threads_leitura + threads_compra:
+        t.join()
+    duracao = time.perf_counter() - inicio
+    database.get_pool().fechar_todas()
+
+    print(f'[{modo}] {duracao:.2f}s  erros de lock: {erros["lock"]}  outros erros: {erros["outros"]}')
+    for tipo, valores in latencias.items():
+        print(f'  {tipo:<9} {len(valores):>6} ok  p50 {_percentil(valores, 0.50) * 1000:7.2f} ms'
+              f'  p99 {_percentil(valores, 0.99) * 1000:7.2f} ms')
+    return erros, latencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--compradores', type=int, default=16)
+    parser.add_argument('--leitores', type=int, default=8)
+    parser.add_argument('--pedidos', type=int, default=25, help='pedidos por comprador')
+    parser.add_argument('--leituras', type=int, default=100, help='leituras do catálogo por leitor')
+    parser.add_argument('--modo', choices=('antes', 'depois', 'ambos'), default='ambos')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        modos = ('antes', 'depois') if args.modo == 'ambos' else (args.modo,)
+        for modo in modos:
+            executar(modo, os.path.join(pasta, f'{modo}.db'), args.compradores, args.leitores,
+                     args.pedidos, args.leituras)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Benchmark do relatório Excel de pedidos: pandas + openpyxl contra o writer em streaming.
+
+Gera N pedidos (500 mil por padrão) e grava o relatório de pedidos em disco
+pelos dois caminhos, cada um num processo novo para isolar a memória: o
+antigo (fetchall, lista de dicts, DataFrame e pd.ExcelWriter) e o atual
+(relatorios.escrever_excel consumindo o cursor em modo write-only). Informa o
+tempo, o pico de RSS do processo e o acréscimo de RSS sobre o processo já
+com os módulos importados.
+
+    python tests/benchmark_excel.py --pedidos 500000
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+CONSULTA = """
+    SELECT p.*, u.nome as cliente_nome, u.email as cliente_email
+    FROM pedidos p
+    JOIN usuarios u ON p.usuario_id = u.id
+    ORDER BY p.data_pedido DESC
+"""
+
+
+def preparar(caminho, pedidos):
+    """Banco novo com `pedidos` pedidos distribuídos entre 1000 clientes"""
+    database.DATABASE = caminho
+    database._pool = database.PoolConexoes(caminho, tamanho=2)
+    database._pool_pid = os.getpid()
+    database.init_db()
+    db = database.get_db()
+    try:
+        with database.transacao_escrita(db):
+            db.executemany(
+                "INSERT INTO usuarios (nome, email, senha, tipo) VALUES (?, ?, 'x', 'cliente')",
+                [(f'Cliente {i}', f'cliente{i}@bench') for i in range(1000)]
+            )
+            db.execute('''
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+                INSERT INTO pedidos (usuario_id, total, status, endereco_entrega, data_pedido)
+                SELECT (SELECT MIN(id) FROM usuarios WHERE email LIKE '%@bench') + i % 1000,
+                       10 + i % 490, 'entregue', 'Rua do Benchmark, ' || i, datetime('now', '-' || i || ' minutes')
+                FROM n
+            ''', (pedidos,))
+    finally:
+        db.close()
+    database.get_pool().fechar_todas()
+
+
+def _rss_mb():
+    """Pico de RSS do processo em MB.
+
+    No Linux vem de VmHWM: o ru_maxrss sobrevive ao exec e traria o pico do
+    processo pai que fez o spawn.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for linha in f:
+                if linha.startswith('VmHWM:'):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def _excel_antigo(db, destino):
+    # Como relatorios.gerar_excel_pedidos fazia antes: três cópias dos dados
+    import pandas as pd
+    pedidos = [dict(row.items()) for row in db.execute(CONSULTA).fetchall()]
+    data = []
+    for pedido in pedidos:
+        data.append({
+            "ID": pedido["id"],
+            "Cliente": pedido["cliente_nome"],
+            "Email": pedido.get("cliente_email", ""),
+            "Total": f"R$ {pedido['total']:.2f}",
+            "Status": pedido.get("status", "").upper(),
+            "Data Pedido": pedido.get("data_pedido", ""),
+            "Endereço": pedido.get("endereco_entrega", "")
+        })
+    df = pd.DataFrame(data)
+    with pd.ExcelWriter(destino, engine="openpyxl") as writer:
+        df.to_excel(writer, sheet_name="Pedidos", index=False)
+        ws = writer.sheets["Pedidos"]
+        for col, width in zip("ABCDEFG", [8, 25, 25, 12, 15, 15, 30]):
+            ws.column_dimensions[col].width = width
+
+
+def _excel_atual(db, destino):
+    from relatorios import COLUNAS_EXCEL_PEDIDOS, escrever_excel
+    escrever_excel(db.execute(CONSULTA), COLUNAS_EXCEL_PEDIDOS, "Pedidos", destino)
+
+
+def _medir(modo, caminho, destino, fila):
+    """Roda num processo novo: importa tudo, anota o RSS e só então gera o relatório"""
+    database.DATABASE = caminho
+    import pandas  # noqa: F401  (o caminho antigo importava pandas no módulo de relatórios)
+    import relatorios  # noqa: F401
+    db = database.get_db()
+    try:
+        base = _rss_mb()
+        inicio = time.perf_counter()
+        (_excel_antigo if modo == 'antes' else _excel_atual)(db, destino)
+        duracao = time.perf_counter() - inicio
+    finally:
+        db.close()
+    fila.put((duracao, _rss_mb(), base, os.path.getsize(destino)))
+
+
+def executar(modo, caminho, pasta):
+    contexto = multiprocessing.get_context('spawn')
+    fila = contexto.Queue()
+    destino = os.path.join(pasta, f'pedidos_{modo}.xlsx')
+    processo = contexto.Process(target=_medir, args=(modo, caminho, destino, fila))
+    processo.start()
+    duracao, pico, base, tamanho = fila.get()
+    processo.join()
+    print(f'[{modo}] {duracao:7.2f}s  pico de RSS {pico:8.1f} MB  (+{pico - base:.1f} MB)'
+          f'  arquivo {tamanho / (1024 * 1024):.1f} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, default=500000)
+    parser.add_argument('--modo', choices=('antes', 'depois', 'ambos'), default='ambos')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, 'excel.db')
+        inicio = time.perf_counter()
+        preparar(caminho, args.pedidos)
+        print(f'{args.pedidos} pedidos gerados em {time.perf_counter() - inicio:.2f}s')
+        modos = ('antes', 'depois') if args.modo == 'ambos' else (args.modo,)
+        for modo in modos:
+            executar(modo, caminho, pasta)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark do cálculo de larguras de colunas dos PDFs: versão antiga contra a amostrada.
+
+Monta uma tabela sintética de pedidos (100 mil linhas por padrão) e mede o
+calcular_col_widths antigo (transpõe todas as linhas, len(str()) de cada
+célula e ajuste da sobra com laços que recalculam sum()) contra o atual
+(stringWidth sobre uma amostra, percentil por coluna, distribuição em forma
+fechada), sem cache e com o cache por tipo de relatório. Imprime também as
+larguras de cada um para comparação.
+
+    python tests/benchmark_larguras.py --linhas 100000 --colunas 7 --repeticoes 5
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab.lib.pagesizes import A4  # noqa: E402
+
+import relatorios  # noqa: E402
+
+
+def calcular_col_widths_antigo(data_rows, page_width=A4[0], left_margin=36, right_margin=36, min_col=30, max_col=300):
+    # Como relatorios.calcular_col_widths era antes da amostragem
+    usable_width = page_width - left_margin - right_margin
+    cols = list(zip(*data_rows))
+    lengths = [max(len(str(cell)) for cell in col) for col in cols]
+    total = sum(lengths) or 1
+    widths = []
+    for l in lengths:  # noqa: E741
+        w = max(min_col, min(max_col, math.ceil((l / total) * usable_width)))
+        widths.append(w)
+    current = sum(widths)
+    if current != usable_width:
+        diff = usable_width - current
+        for i in range(len(widths)):
+            add = math.floor(diff * (widths[i] / current)) if current else 0
+            widths[i] += add
+        while sum(widths) < usable_width:
+            for i in range(len(widths)):
+                widths[i] += 1
+                if sum(widths) >= usable_width:
+                    break
+        while sum(widths) > usable_width:
+            for i in range(len(widths)):
+                if widths[i] > min_col:
+                    widths[i] -= 1
+                if sum(widths) <= usable_width:
+                    break
+    return widths
+
+
+def gerar_linhas(linhas, colunas):
+    """Cabeçalho + linhas no formato do relatório de pedidos, repetido até `colunas`"""
+    aleatorio = random.Random(3)
+    base = ["ID", "Cliente", "Total", "Status", "Data", "Itens", "Endereço"]
+    cabecalho = [base[i % len(base)] for i in range(colunas)]
+    valores = [
+        lambda i: i,
+        lambda i: f"Cliente {'Sobrenome ' * aleatorio.randint(0, 3)}{i}",
+        lambda i: f"R$ {aleatorio.uniform(10, 2000):.2f}",
+        lambda i: aleatorio.choice(["PENDENTE", "PROCESSANDO", "ENVIADO", "ENTREGUE", "CANCELADO"]),
+        lambda i: f"{aleatorio.randint(1, 28):02d}/{aleatorio.randint(1, 12):02d}/2024 10:00",
+        lambda i: aleatorio.randint(1, 12),
+        lambda i: f"Rua {'Longa ' * aleatorio.randint(0, 6)}{i}, Centro",
+    ]
+    return [cabecalho] + [[valores[c % len(valores)](i) for c in range(colunas)] for i in range(linhas)]
+
+
+def _medir(calcular, repeticoes):
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        larguras = calcular()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return larguras, melhor
+
+
+def executar(linhas, colunas, repeticoes):
+    dados = gerar_linhas(linhas, colunas)
+    relatorios._cache_larguras.clear()
+    relatorios.calcular_col_widths(dados, chave='benchmark')
+    caminhos = {
+        'antigo': lambda: calcular_col_widths_antigo(dados),
+        'amostrado': lambda: relatorios.calcular_col_widths(dados),
+        'amostrado (cache)': lambda: relatorios.calcular_col_widths(dados, chave='benchmark'),
+    }
+    print(f'{linhas} linhas x {colunas} colunas')
+    for nome, calcular in caminhos.items():
+        larguras, segundos = _medir(calcular, repeticoes)
+        print(f'  {nome:<18} {segundos * 1000:10.3f} ms  soma {sum(larguras):7.1f}'
+              f'  larguras {[round(w) for w in larguras]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=100000)
+    parser.add_argument('--colunas', type=int, default=7)
+    parser.add_argument('--repeticoes', type=int, default=5, help='execuções por versão (vale a melhor)')
+    args = parser.parse_args()
+    executar(args.linhas, args.colunas, args.repeticoes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Benchmark do relatório PDF de pedidos: tabela única contra tabelas em blocos.
+
+Gera N pedidos (20 mil por padrão) e monta o PDF de pedidos pelos dois
+caminhos, cada um num processo novo para isolar a memória: o antigo (fetchall,
+uma única Table com um BACKGROUND por linha, PDF montado num BytesIO) e o
+atual (relatorios.gerar_pdf_pedidos lendo o cursor, tabelas de
+LINHAS_POR_TABELA linhas com ROWBACKGROUNDS e páginas gravadas direto no
+arquivo). Informa linhas/s, pico de RSS e o acréscimo sobre o processo já com
+os módulos importados. Com --processo, o caminho atual roda também pelo
+executor_relatorios, como a fila de tarefas faz; aí a memória medida é a do
+processo que submete (o worker web), não a do executor.
+
+    python tests/benchmark_pdf.py --pedidos 20000
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from benchmark_larguras import calcular_col_widths_antigo  # noqa: E402
+
+
+def preparar(caminho, pedidos):
+    """Banco novo com `pedidos` pedidos distribuídos entre 1000 clientes"""
+    database.DATABASE = caminho
+    database._pool = database.PoolConexoes(caminho, tamanho=2)
+    database._pool_pid = os.getpid()
+    database.init_db()
+    db = database.get_db()
+    try:
+        with database.transacao_escrita(db):
+            db.executemany(
+                "INSERT INTO usuarios (nome, email, senha, tipo) VALUES (?, ?, 'x', 'cliente')",
+                [(f'Cliente {i}', f'cliente{i}@bench') for i in range(1000)]
+            )
+            db.execute('''
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+                INSERT INTO pedidos (usuario_id, total, status, endereco_entrega, data_pedido)
+                SELECT (SELECT MIN(id) FROM usuarios WHERE email LIKE '%@bench') + i % 1000,
+                       10 + i % 490, 'entregue', 'Rua do Benchmark, ' || i, datetime('now', '-' || i || ' minutes')
+                FROM n
+            ''', (pedidos,))
+    finally:
+        db.close()
+    database.get_pool().fechar_todas()
+
+
+def _rss_mb():
+    """Pico de RSS do processo em MB.
+
+    No Linux vem de VmHWM: o ru_maxrss sobrevive ao exec e traria o pico do
+    processo pai que fez o spawn.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for linha in f:
+                if linha.startswith('VmHWM:'):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def _pdf_antigo(pedidos, destino):
+    # Como relatorios.gerar_pdf_pedidos fazia antes: uma Table só, estilo por linha
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+    from relatorios import META_STYLE, NORMAL_STYLE, TITLE_STYLE, _cabecalho, _rodape
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=36, rightMargin=36, topMargin=48, bottomMargin=48)
+    titulo = Paragraph("RELATÓRIO DE PEDIDOS - VIVANTS", TITLE_STYLE)
+    emitido = Paragraph("Emitido em: benchmark", META_STYLE)
+
+    data = [["ID", "Cliente", "Total", "Status", "Data"]]
+    for ped in pedidos:
+        data.append([
+            f"#{ped.get('id', '')}",
+            ped.get("cliente_nome", ""),
+            f"R$ {ped.get('total', 0):.2f}",
+            ped.get("status", "").upper(),
+            ped.get("data_pedido", "")
+        ])
+    col_widths = calcular_col_widths_antigo(data, page_width=A4[0], left_margin=doc.leftMargin,
+                                            right_margin=doc.rightMargin)
+    tabela = Table(data, colWidths=col_widths, repeatRows=1)
+    style = TableStyle([
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 9),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("LINEBEFORE", (0, 0), (-1, -1), 0.25, colors.HexColor("#dddddd")),
+        ("LINEAFTER", (0, 0), (-1, -1), 0.25, colors.HexColor("#dddddd")),
+        ("INNERGRID", (0, 0), (-1, -1), 0.25, colors.HexColor("#dddddd")),
+        ("BOX", (0, 0), (-1, -1), 0.25, colors.HexColor("#dddddd")),
+        ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
+        ("TOPPADDING", (0, 0), (-1, 0), 8),
+    ])
+    style.add("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#6c757d"))
+    style.add("TEXTCOLOR", (0, 0), (-1, 0), colors.white)
+    for idx in range(1, len(data)):
+        style.add("BACKGROUND", (0, idx), (-1, idx), colors.whitesmoke if idx % 2 == 0 else colors.beige)
+    tabela.setStyle(style)
+
+    faturamento = sum(p.get("total", 0) for p in pedidos)
+    doc.build([
+        titulo, Spacer(1, 12), emitido, Spacer(1, 18), tabela, Spacer(1, 12),
+        Paragraph(f"Total de pedidos: {len(pedidos)}", NORMAL_STYLE),
+        Paragraph(f"Faturamento total: R$ {faturamento:.2f}", NORMAL_STYLE),
+    ], onFirstPage=lambda c, d: (_cabecalho(c, d, titulo), _rodape(c, d)),
+        onLaterPages=lambda c, d: (_cabecalho(c, d, titulo), _rodape(c, d)))
+    with open(destino, "wb") as f:
+        f.write(buffer.getvalue())
+
+
+def _pdf_atual(cursor, destino):
+    import shutil
+    from relatorios import gerar_pdf_pedidos
+    arquivo = gerar_pdf_pedidos(cursor)
+    with open(destino, "wb") as f:
+        shutil.copyfileobj(arquivo, f)
+
+
+def _gerar(modo, caminho, destino):
+    from relatorios import CONSULTAS_RELATORIO
+    database.DATABASE = caminho
+    db = database.get_db()
+    try:
+        cursor = db.execute(CONSULTAS_RELATORIO["pedidos"])
+        if modo == 'antes':
+            _pdf_antigo(cursor.fetchall(), destino)
+        else:
+            _pdf_atual(cursor, destino)
+    finally:
+        db.close()
+
+
+def _medir(modo, caminho, destino, fila):
+    """Roda num processo novo: importa tudo, anota o RSS e só então gera o relatório"""
+    import relatorios  # noqa: F401
+    base = _rss_mb()
+    inicio = time.perf_counter()
+    _gerar(modo, caminho, destino)
+    fila.put((time.perf_counter() - inicio, _rss_mb(), base, os.path.getsize(destino)))
+
+
+def _medir_no_executor(caminho, destino):
+    """Como a fila de tarefas: o PDF é montado num processo do executor; mede o processo web"""
+    import relatorios
+    base = _rss_mb()
+    inicio = time.perf_counter()
+    relatorios.executor_relatorios().submit(_gerar, 'depois', caminho, destino).result()
+    return time.perf_counter() - inicio, _rss_mb(), base, os.path.getsize(destino)
+
+
+def executar(modo, caminho, pasta, pedidos):
+    destino = os.path.join(pasta, f'pedidos_{modo}.pdf')
+    if modo == 'processo':
+        duracao, pico, base, tamanho = _medir_no_executor(caminho, destino)
+    else:
+        contexto = multiprocessing.get_context('spawn')
+        fila = contexto.Queue()
+        processo = contexto.Process(target=_medir, args=(modo, caminho, destino, fila))
+        processo.start()
+        duracao, pico, base, tamanho = fila.get()
+        processo.join()
+    print(f'[{modo}] {duracao:7.2f}s  {pedidos / duracao:8,.0f} linhas/s  pico de RSS {pico:7.1f} MB'
+          f'  (+{pico - base:.1f} MB)  arquivo {tamanho / (1024 * 1024):.1f} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, default=20000)
+    parser.add_argument('--modo', choices=('antes', 'depois', 'ambos'), default='ambos')
+    parser.add_argument('--processo', action='store_true',
+                        help='mede também o caminho atual rodando no executor_relatorios')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, 'pdf.db')
+        preparar(caminho, args.pedidos)
+        modos = ('antes', 'depois') if args.modo == 'ambos' else (args.modo,)
+        if args.processo:
+            modos += ('processo',)
+        for modo in modos:
+            executar(modo, caminho, pasta, args.pedidos)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Benchmark da purga de pedidos cancelados: laço por pedido contra lotes set-based.
+
+Gera um histórico com N pedidos cancelados (50 mil por padrão, 3 itens cada)
+mais pedidos ativos, e mede a limpeza antiga (um SELECT e um UPDATE por item e
+dois DELETEs por pedido, tudo numa transação) e a atual
+(manutencao.purgar_pedidos_cancelados, em lotes). Enquanto a purga roda, uma
+thread "loja" grava no carrinho sem parar: a maior espera dela mostra por
+quanto tempo o lock de escrita travou a loja. O número de lotes vem do
+callback de progresso da purga.
+
+    python tests/benchmark_purga.py --cancelados 50000 --lote 500
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from manutencao import purgar_pedidos_cancelados  # noqa: E402
+
+
+def preparar(caminho, cancelados, ativos):
+    """Banco novo com os pedidos cancelados e ativos (3 itens cada)"""
+    database.DATABASE = caminho
+    database._pool = database.PoolConexoes(caminho, tamanho=4)
+    database._pool_pid = os.getpid()
+    database.init_db()
+    aleatorio = random.Random(7)
+    db = database.get_db()
+    try:
+        produtos = [row['id'] for row in db.execute('SELECT id FROM produtos')]
+        with database.transacao_escrita(db):
+            usuario_id = db.execute(
+                "INSERT INTO usuarios (nome, email, senha, tipo) VALUES ('Cliente', 'cliente@bench', 'x', 'cliente')"
+            ).lastrowid
+            status = ['cancelado'] * cancelados + ['entregue'] * ativos
+            aleatorio.shuffle(status)
+            db.executemany(
+                "INSERT INTO pedidos (usuario_id, total, status, data_pedido) VALUES (?, 30, ?, datetime('now'))",
+                [(usuario_id, s) for s in status]
+            )
+            db.execute('''
+                INSERT INTO itens_pedido (pedido_id, produto_id, quantidade, preco_unitario)
+                SELECT p.id, (p.id + n.k) % ? + 1, 1 + (p.id + n.k) % 3, 10
+                FROM pedidos p, (SELECT 0 AS k UNION ALL SELECT 1 UNION ALL SELECT 2) n
+            ''', (len(produtos),))
+        estoque = db.execute('SELECT SUM(estoque) FROM produtos').fetchone()[0]
+        devolver = db.execute('''
+            SELECT SUM(i.quantidade) FROM itens_pedido i JOIN pedidos p ON p.id = i.pedido_id
+            WHERE p.status = 'cancelado'
+        ''').fetchone()[0]
+    finally:
+        db.close()
+    return usuario_id, produtos, estoque + devolver
+
+
+def _purga_antiga(caminho):
+    # Como a rota fazia antes: um laço por pedido numa única transação
+    db = sqlite3.connect(caminho, timeout=30)
+    db.row_factory = sqlite3.Row
+    try:
+        pedidos = db.execute("SELECT id FROM pedidos WHERE status = 'cancelado'").fetchall()
+        db.execute('BEGIN TRANSACTION')
+        contador = 0
+        for pedido in pedidos:
+            itens = db.execute('SELECT produto_id, quantidade FROM itens_pedido WHERE pedido_id = ?',
+                               (pedido['id'],)).fetchall()
+            for item in itens:
+                db.execute('UPDATE produtos SET estoque = estoque + ? WHERE id = ?',
+                           (item['quantidade'], item['produto_id']))
+            db.execute('DELETE FROM itens_pedido WHERE pedido_id = ?', (pedido['id'],))
+            db.execute('DELETE FROM pedidos WHERE id = ?', (pedido['id'],))
+            contador += 1
+        db.commit()
+        return contador
+    finally:
+        db.close()
+
+
+def _purga_atual(lote, lotes):
+    db = database.get_db()
+    try:
+        return purgar_pedidos_cancelados(db, lote=lote, progresso=lotes.append)
+    finally:
+        db.close()
+
+
+def executar(modo, caminho, cancelados, ativos, lote):
+    usuario_id, produtos, estoque_esperado = preparar(caminho, cancelados, ativos)
+    parar = threading.Event()
+    esperas, erros, lotes = [], [], []
+
+    def gravar_antigo(conn, produto_id):
+        with conn:
+            conn.execute('INSERT INTO carrinho (usuario_id, produto_id, quantidade) VALUES (?, ?, 1)',
+                         (usuario_id, produto_id))
+            conn.execute('DELETE FROM carrinho WHERE usuario_id = ?', (usuario_id,))
+
+    def gravar_atual(conn, produto_id):
+        with database.transacao_escrita(conn):
+            conn.execute('INSERT INTO carrinho (usuario_id, produto_id, quantidade) VALUES (?, ?, 1)',
+                         (usuario_id, produto_id))
+            conn.execute('DELETE FROM carrinho WHERE usuario_id = ?', (usuario_id,))
+
+    def loja():
+        # Escritas curtas da loja (adicionar ao carrinho) durante a purga, no
+        # mesmo processo: antes com conexão própria, hoje pelo pool e pela fila
+        conn = sqlite3.connect(caminho, timeout=60) if modo == 'antes' else database.get_db()
+        gravar = gravar_antigo if modo == 'antes' else gravar_atual
+        try:
+            i = 0
+            while not parar.is_set():
+                inicio = time.perf_counter()
+                try:
+                    gravar(conn, produtos[i % len(produtos)])
+                except sqlite3.OperationalError as e:
+                    erros.append(str(e))
+                esperas.append(time.perf_counter() - inicio)
+                i += 1
+                time.sleep(0.005)
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=loja)
+    thread.start()
+    inicio = time.perf_counter()
+    excluidos = _purga_antiga(caminho) if modo == 'antes' else _purga_atual(lote, lotes)
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    thread.join()
+
+    db = database.get_db()
+    try:
+        estoque = db.execute('SELECT SUM(estoque) FROM produtos').fetchone()[0]
+        restantes = db.execute("SELECT COUNT(*) FROM pedidos WHERE status = 'cancelado'").fetchone()[0]
+    finally:
+        db.close()
+        database.get_pool().fechar_todas()
+
+    print(f'[{modo}] {excluidos} pedidos excluídos em {duracao:.2f}s ({excluidos / duracao:,.0f} pedidos/s)'
+          f'  cancelados restantes: {restantes}  estoque devolvido: {"ok" if estoque == estoque_esperado else "ERRADO"}')
+    print(f'  loja: {len(esperas)} escritas, maior espera {max(esperas, default=0) * 1000:.1f} ms,'
+          f' erros de lock: {len(erros)}' + (f'  lotes: {len(lotes)}' if lotes else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cancelados', type=int, default=50000)
+    parser.add_argument('--ativos', type=int, default=50000, help='pedidos não cancelados (ficam)')
+    parser.add_argument('--lote', type=int, default=500, help='pedidos por lote da purga atual')
+    parser.add_argument('--modo', choices=('antes', 'depois', 'ambos'), default='ambos')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        modos = ('antes', 'depois') if args.modo == 'ambos' else (args.modo,)
+        for modo in modos:
+            executar(modo, os.path.join(pasta, f'{modo}.db'), args.cancelados, args.ativos, args.lote)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Micro-benchmark da materialização de linhas: row_to_dict antigo contra registro_factory.
+
+Monta uma listagem de pedidos no formato da página do admin (pedido + nome do
+cliente) e mede linhas/s de cada caminho sobre o mesmo SELECT: o antigo
+(sqlite3.Row, row_to_dict testando o nome de cada coluna e parse_datetime
+tentando formatos com strptime) e o atual (registro_factory, com as colunas
+de data decididas uma vez por cursor a partir dos tipos declarados).
+
+    python tests/benchmark_registros.py --linhas 5000 --repeticoes 20
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+LISTAGEM = '''
+    SELECT p.*, u.nome as usuario_nome, u.email as usuario_email, u.data_cadastro
+    FROM pedidos p JOIN usuarios u ON p.usuario_id = u.id
+    ORDER BY p.data_pedido DESC
+'''
+
+
+# Como app.py materializava as linhas antes do registro_factory
+def parse_datetime(date_string):
+    if date_string is None:
+        return None
+    if isinstance(date_string, datetime):
+        return date_string
+    try:
+        formats = [
+            '%Y-%m-%d %H:%M:%S',
+            '%Y-%m-%d %H:%M:%S.%f',
+            '%Y-%m-%d',
+            '%d/%m/%Y %H:%M:%S',
+            '%d/%m/%Y'
+        ]
+        for fmt in formats:
+            try:
+                return datetime.strptime(date_string, fmt)
+            except ValueError:
+                continue
+        return date_string
+    except Exception:
+        return date_string
+
+
+def row_to_dict(row):
+    if row is None:
+        return None
+    result = {}
+    for key in row.keys():
+        value = row[key]
+        if 'data' in key.lower() or 'cadastro' in key.lower() or 'pedido' in key.lower() or 'avaliacao' in key.lower():
+            result[key] = parse_datetime(value)
+        else:
+            result[key] = value
+    return result
+
+
+def preparar(caminho, linhas):
+    """Banco novo com `linhas` pedidos distribuídos entre 100 clientes"""
+    database.DATABASE = caminho
+    database._pool = database.PoolConexoes(caminho, tamanho=2)
+    database._pool_pid = os.getpid()
+    database.init_db()
+    db = database.get_db()
+    try:
+        with database.transacao_escrita(db):
+            db.executemany(
+                "INSERT INTO usuarios (nome, email, senha, tipo) VALUES (?, ?, 'x', 'cliente')",
+                [(f'Cliente {i}', f'cliente{i}@bench') for i in range(100)]
+            )
+            usuarios = [row['id'] for row in db.execute("SELECT id FROM usuarios WHERE email LIKE '%@bench'")]
+            db.executemany(
+                '''INSERT INTO pedidos (usuario_id, total, status, endereco_entrega, data_pedido)
+                   VALUES (?, ?, 'entregue', 'Rua do Benchmark, 1', datetime('now', ?))''',
+                [(usuarios[i % len(usuarios)], 10.0 + i % 500, f'-{i} minutes') for i in range(linhas)]
+            )
+    finally:
+        db.close()
+
+
+def _medir(consultar, repeticoes):
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        linhas = consultar()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return len(linhas), melhor
+
+
+def executar(caminho, linhas, repeticoes):
+    preparar(caminho, linhas)
+
+    antigo = sqlite3.connect(caminho)
+    antigo.row_factory = sqlite3.Row
+    db = database.get_db()
+    try:
+        cru = db.cursor()
+        cru.row_factory = None
+        caminhos = {
+            'tuplas (sem conversão)': lambda: cru.execute(LISTAGEM).fetchall(),
+            'row_to_dict (antigo)': lambda: [row_to_dict(row) for row in antigo.execute(LISTAGEM).fetchall()],
+            'registro_factory': lambda: db.execute(LISTAGEM).fetchall(),
+        }
+        for nome, consultar in caminhos.items():
+            total, segundos = _medir(consultar, repeticoes)
+            print(f'  {nome:<24} {total:>7} linhas  {segundos * 1000:8.2f} ms'
+                  f'  {total / segundos:12,.0f} linhas/s')
+    finally:
+        antigo.close()
+        db.close()
+        database.get_pool().fechar_todas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=5000)
+    parser.add_argument('--repeticoes', type=int, default=20, help='execuções por caminho (vale a melhor)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        executar(os.path.join(pasta, 'registros.db'), args.linhas, args.repeticoes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Benchmark do índice de produtos comprados juntos: construção completa e incremental.
+
+Gera N pedidos (250 mil por padrão, 4 itens cada: 1 milhão de linhas em
+itens_pedido) sobre 2000 produtos e mede relacionados.atualizar_relacionados
+com completo=True (matriz de coocorrência inteira e top-k de todos os
+produtos), uma atualização incremental depois de novos pedidos, a carga do
+mapa em memória e a consulta da página de produto (índice em memória contra
+o antigo `WHERE categoria_id = ? AND id != ? LIMIT 4`).
+
+    python tests/benchmark_relacionados.py --pedidos 250000 --itens 4 --novos 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+PRODUTOS = 2000
+
+RELACIONADOS_ANTIGO = '''
+    SELECT id, nome, preco, preco_promocional, imagem
+    FROM produtos
+    WHERE categoria_id = ? AND id != ? AND ativo = 1
+    LIMIT 4
+'''
+
+
+def preparar(caminho, pedidos, itens):
+    """Banco novo com 1000 clientes, PRODUTOS produtos e `pedidos` pedidos de `itens` itens"""
+    database.DATABASE = caminho
+    database._pool = database.PoolConexoes(caminho, tamanho=2)
+    database._pool_pid = os.getpid()
+    database.init_db()
+    db = database.get_db()
+    try:
+        with database.transacao_escrita(db):
+            db.executemany(
+                "INSERT INTO usuarios (nome, email, senha, tipo) VALUES (?, ?, 'x', 'cliente')",
+                [(f'Cliente {i}', f'cliente{i}@bench') for i in range(1000)]
+            )
+            db.execute('''
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+                INSERT INTO produtos (nome, preco, categoria_id, estoque)
+                SELECT 'Produto ' || i, 5 + i % 200, 1 + i % 5, 1000 FROM n
+            ''', (PRODUTOS,))
+            inserir_pedidos(db, pedidos, itens)
+    finally:
+        db.close()
+
+
+def inserir_pedidos(db, pedidos, itens):
+    """`pedidos` pedidos novos com `itens` itens cada.
+
+    Cada cesta parte de um produto "âncora" e leva até 50 vizinhos dele,
+    para a matriz ter pares frequentes em vez de ruído uniforme.
+    """
+    primeiro = db.execute('SELECT COALESCE(MAX(id), 0) FROM pedidos').fetchone()[0]
+    db.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO pedidos (usuario_id, total, status, endereco_entrega, data_pedido)
+        SELECT (SELECT MIN(id) FROM usuarios WHERE email LIKE '%@bench') + (i * 7919) % 1000,
+               10, 'entregue', 'Rua do Benchmark, ' || i, datetime('now', '-' || i || ' minutes')
+        FROM n
+    ''', (pedidos,))
+    db.execute('''
+        WITH RECURSIVE k(j) AS (SELECT 0 UNION ALL SELECT j + 1 FROM k WHERE j < ? - 1)
+        INSERT INTO itens_pedido (pedido_id, produto_id, quantidade, preco_unitario)
+        SELECT p.id, (SELECT MIN(id) FROM produtos WHERE nome LIKE 'Produto %')
+                     + ((p.id * 7919) % ? + CASE k.j WHEN 0 THEN 0
+                                              ELSE 1 + (p.id * 2654435761 + k.j * 40503) % 4294967291 % 50 END) % ?,
+               1, 10
+        FROM pedidos p, k
+        WHERE p.id > ?
+    ''', (itens, PRODUTOS, PRODUTOS, primeiro))
+
+
+def _percentil(amostras, p):
+    ordenadas = sorted(amostras)
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p / 100))]
+
+
+def _medir(consulta, repeticoes):
+    amostras = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        consulta()
+        amostras.append((time.perf_counter() - inicio) * 1000)
+    return _percentil(amostras, 50), _percentil(amostras, 99)
+
+
+def executar(db, novos, repeticoes):
+    import relacionados
+
+    linhas = db.execute('SELECT COUNT(*) FROM itens_pedido').fetchone()[0]
+    inicio = time.perf_counter()
+    relacionados.atualizar_relacionados(db, completo=True)
+    completo = time.perf_counter() - inicio
+    pares = db.execute('SELECT COUNT(*) FROM coocorrencias').fetchone()[0]
+    top = db.execute('SELECT COUNT(*) FROM produtos_relacionados').fetchone()[0]
+    print(f'[completo] {linhas} linhas em {completo:.2f}s ({linhas / completo:,.0f} linhas/s)'
+          f'  coocorrências {pares}  relacionados gravados {top}')
+
+    with database.transacao_escrita(db):
+        inserir_pedidos(db, novos, 4)
+    inicio = time.perf_counter()
+    _, afetados = relacionados.atualizar_relacionados(db)
+    print(f'[incremental] +{novos} pedidos em {(time.perf_counter() - inicio) * 1000:.0f} ms'
+          f'  produtos recalculados {afetados}')
+
+    indice = relacionados.IndiceRelacionados()
+    inicio = time.perf_counter()
+    indice.obter(db, 1)
+    print(f'[mapa] carga do índice em memória: {(time.perf_counter() - inicio) * 1000:.1f} ms')
+
+    produtos = [dict(row.items()) for row in db.execute(
+        "SELECT id, categoria_id FROM produtos WHERE nome LIKE 'Produto %' LIMIT ?", (repeticoes,)
+    )]
+    relacionados.indice_relacionados = indice
+    consultas = {
+        'antes (categoria)': lambda p: db.execute(RELACIONADOS_ANTIGO, (p['categoria_id'], p['id'])).fetchall(),
+        'depois (índice)': lambda p: relacionados.produtos_relacionados(db, p),
+    }
+    for nome, consulta in consultas.items():
+        iterador = iter(produtos * 2)
+        p50, p99 = _medir(lambda: consulta(next(iterador)), len(produtos))
+        print(f'  {nome:<18} p50 {p50:7.3f} ms  p99 {p99:7.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, default=250000)
+    parser.add_argument('--itens', type=int, default=4, help='itens por pedido')
+    parser.add_argument('--novos', type=int, default=1000, help='pedidos da atualização incremental')
+    parser.add_argument('--repeticoes', type=int, default=500, help='consultas da página de produto')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        # A versão compartilhada do índice fica no diretório de cache, lido no import
+        os.environ['VIVANTS_CACHE_DIR'] = pasta
+        caminho = os.path.join(pasta, 'relacionados.db')
+        inicio = time.perf_counter()
+        preparar(caminho, args.pedidos, args.itens)
+        print(f'{args.pedidos} pedidos / {args.pedidos * args.itens} itens gerados'
+              f' em {time.perf_counter() - inicio:.2f}s')
+        db = database.get_db()
+        try:
+            executar(db, args.novos, args.repeticoes)
+        finally:
+            db.close()
+            database.get_pool().fechar_todas()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Benchmark do custo da sessão por request: visitante anônimo contra usuário logado.
+
+Para cada backend (cookie assinado padrão do Flask, sessoes.SessoesSQLite e
+sessoes.SessoesArquivo) mede o trabalho da sessão em um request (open_session,
+a leitura ou escrita feita pela view e save_session, com o cookie devolvido
+reaproveitado no request seguinte) em quatro cenários: visitante anônimo sem
+cookie, usuário logado lendo a sessão, usuário logado gravando a sessão e
+visitante mexendo no carrinho guardado na sessão. Informa p50 e p99 e o
+tamanho do cookie enviado. O roteamento e a view em si ficam de fora: no
+test client eles custam ~200 µs e variam mais que a própria sessão.
+
+    python tests/benchmark_sessoes.py --requests 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from werkzeug.http import parse_cookie  # noqa: E402
+
+import database  # noqa: E402
+import sessoes  # noqa: E402
+
+# Sessão típica de um cliente logado
+SESSAO_LOGADO = {'user_id': 42, 'user_name': 'Cliente do Benchmark', 'user_type': 'cliente'}
+
+
+def preparar(caminho):
+    database.DATABASE = caminho
+    database._pool = database.PoolConexoes(caminho, tamanho=4)
+    database._pool_pid = os.getpid()
+    database.init_db()
+
+
+def criar_app(backend, pasta):
+    app = Flask(__name__)
+    app.secret_key = 'benchmark'
+    if backend == 'arquivo':
+        app.session_interface = sessoes.InterfaceSessaoServidor(sessoes.SessoesArquivo(os.path.join(pasta, 'sessoes')))
+    else:
+        sessoes.init_app(app, backend=backend)
+    return app
+
+
+def _ler_usuario(sessao):
+    # Como o base.html: olha se há usuário logado
+    sessao.get('user_id')
+
+
+def _gravar_visita(sessao):
+    sessao['ultima_visita'] = time.time()
+
+
+def _somar_ao_carrinho(sessao):
+    itens = dict(sessao.get('carrinho', {}))
+    itens['1'] = itens.get('1', 0) + 1
+    sessao['carrinho'] = itens
+
+
+def _request(app, cookie, acao):
+    """Um request com o cookie `cookie`; retorna (µs gastos na sessão, cookie resultante)"""
+    interface = app.session_interface
+    nome = app.config['SESSION_COOKIE_NAME']
+    cabecalhos = {'Cookie': f'{nome}={cookie}'} if cookie else {}
+    with app.test_request_context('/', headers=cabecalhos) as contexto:
+        resposta = app.response_class()
+        inicio = time.perf_counter()
+        sessao = interface.open_session(app, contexto.request)
+        acao(sessao)
+        interface.save_session(app, sessao, resposta)
+        gasto = (time.perf_counter() - inicio) * 1e6
+    for cabecalho in resposta.headers.getlist('Set-Cookie'):
+        cookie = parse_cookie(cabecalho).get(nome, cookie)
+    return gasto, cookie
+
+
+def _percentil(amostras, p):
+    ordenadas = sorted(amostras)
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p / 100))]
+
+
+def _medir(app, cookie, acao, requests):
+    amostras = []
+    for i in range(requests + 200):
+        gasto, cookie = _request(app, cookie, acao)
+        if i >= 200:  # aquecimento
+            amostras.append(gasto)
+    return _percentil(amostras, 50), _percentil(amostras, 99), len(cookie or '')
+
+
+def executar(backend, pasta, requests):
+    app = criar_app(backend, pasta)
+    _, logado = _request(app, None, lambda sessao: sessao.update(SESSAO_LOGADO))
+
+    resultados = [
+        ('anônimo', *_medir(app, None, _ler_usuario, requests)),
+        ('logado (leitura)', *_medir(app, logado, _ler_usuario, requests)),
+        ('logado (gravação)', *_medir(app, logado, _gravar_visita, requests)),
+        ('visitante carrinho', *_medir(app, None, _somar_ao_carrinho, requests)),
+    ]
+    print(f'[{backend}]')
+    for nome, p50, p99, cookie in resultados:
+        print(f'  {nome:<20} p50 {p50:8.1f} µs  p99 {p99:8.1f} µs  cookie {cookie:4d} bytes')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000, help='requests por cenário')
+    parser.add_argument('--backend', choices=('cookie', 'sqlite', 'arquivo', 'todos'), default='todos')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        preparar(os.path.join(pasta, 'sessoes.db'))
+        backends = ('cookie', 'sqlite', 'arquivo') if args.backend == 'todos' else (args.backend,)
+        try:
+            for backend in backends:
+                executar(backend, pasta, args.requests)
+        finally:
+            database.get_pool().fechar_todas()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# database.DATABASE e as pastas de cache são lidos no import: tudo aponta para
+# um diretório temporário antes de importar qualquer módulo da aplicação
+_PASTA = tempfile.mkdtemp(prefix='vivants-testes-')
+os.environ['VIVANTS_DB'] = os.path.join(_PASTA, 'vivants.db')
+os.environ['VIVANTS_CACHE_DIR'] = _PASTA
+os.environ['VIVANTS_SESSOES_DIR'] = os.path.join(_PASTA, 'sessoes')
+os.environ['VIVANTS_ATIVOS'] = '0'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Banco novo, criado e migrado, para cada teste; retorna o caminho"""
+    caminho = str(tmp_path / 'vivants.db')
+    monkeypatch.setattr(database, 'DATABASE', caminho)
+    monkeypatch.setattr(database, '_pool', None)
+    database.init_db()
+    yield caminho
+    database.get_pool().fechar_todas()
+
+
+@pytest.fixture
+def db(banco):
+    conn = database.get_db()
+    yield conn
+    conn.close()
@@ -0,0 +1,75 @@
+import pytest
+
+import analise
+from analise import SnapshotVendas
+from database import transacao_escrita
+
+
+@pytest.fixture
+def snapshot(db, monkeypatch):
+    monkeypatch.setattr(analise, 'ANALISE_INTERVALO', 0)
+    for dia in range(1, 4):
+        _pedido(db, f'2024-01-0{dia} 10:00:00', 100)
+    snapshot = SnapshotVendas()
+    snapshot.atualizar(db)
+    return snapshot
+
+
+def _pedido(db, data, total, usuario_id=1):
+    with transacao_escrita(db):
+        pedido_id = db.execute(
+            "INSERT INTO pedidos (usuario_id, total, status, data_pedido) VALUES (?, ?, 'pendente', ?)",
+            (usuario_id, total, data)
+        ).lastrowid
+        db.execute(
+            'INSERT INTO itens_pedido (pedido_id, produto_id, quantidade, preco_unitario) VALUES (?, 1, 1, ?)',
+            (pedido_id, total)
+        )
+    return pedido_id
+
+
+def _resumo(snapshot):
+    resumo = snapshot.resumo(dias=None)
+    return resumo['pedidos'], resumo['receita']
+
+
+def test_pedidos_novos_entram_pela_marca_dagua(db, snapshot):
+    novo = _pedido(db, '2024-02-01 09:00:00', 50, usuario_id=2)
+
+    snapshot.atualizar(db)
+
+    stats = snapshot.estatisticas()
+    assert (stats['cargas'], stats['incrementos'], stats['resincronizacoes']) == (1, 1, 0)
+    assert stats['marca'] == ['2024-02-01 09:00:00', novo]
+    assert _resumo(snapshot) == (4, 350.0)
+    assert snapshot.top_produtos(dias=None) == [(1, 4, 350.0)]
+
+
+def test_mudanca_abaixo_da_marca_resincroniza_sem_recarregar(db, snapshot):
+    primeiro = db.execute('SELECT MIN(id) FROM pedidos').fetchone()[0]
+    with transacao_escrita(db):
+        db.execute("UPDATE pedidos SET status = 'cancelado' WHERE id = ?", (primeiro,))
+        db.execute("UPDATE pedidos SET total = 120 WHERE id = ?", (primeiro + 1,))
+
+    snapshot.atualizar(db)
+
+    stats = snapshot.estatisticas()
+    assert (stats['cargas'], stats['incrementos'], stats['resincronizacoes']) == (1, 0, 1)
+    assert _resumo(snapshot) == (2, 220.0)
+    # Sem novas mudanças os totais conferem com vendas_status: nada a resincronizar
+    snapshot.atualizar(db)
+    assert snapshot.estatisticas()['resincronizacoes'] == 1
+
+
+def test_exclusao_de_pedido_recarrega_tudo(db, snapshot):
+    with transacao_escrita(db):
+        ultimo = db.execute('SELECT MAX(id) FROM pedidos').fetchone()[0]
+        db.execute('DELETE FROM itens_pedido WHERE pedido_id = ?', (ultimo,))
+        db.execute('DELETE FROM pedidos WHERE id = ?', (ultimo,))
+
+    snapshot.atualizar(db)
+
+    stats = snapshot.estatisticas()
+    assert (stats['cargas'], stats['resincronizacoes']) == (2, 1)
+    assert stats['pedidos'] == 2
+    assert _resumo(snapshot) == (2, 200.0)
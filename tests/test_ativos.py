@@ -0,0 +1,137 @@
+import gzip
+import os
+
+import pytest
+from flask import Flask, url_for
+
+import ativos
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg">' + '<rect width="1" height="1"/>' * 50 + '</svg>'
+CSS = '''
+.logo { background: url("../img/logo.svg"); }
+.fundo { background: url(/static/img/fundo.png?v=1); }
+.inline { background: url(data:image/png;base64,AAAA); }
+.externo { background: url('https://cdn.exemplo/x.png'); }
+.sumido { background: url(../img/nao-existe.png); }
+''' + '.regra { color: #333; }\n' * 20
+
+
+@pytest.fixture
+def estatico(tmp_path, monkeypatch):
+    """Pasta static/ com CSS, SVG, PNG e JS, e um app Flask ligado ao manifesto"""
+    monkeypatch.setattr(ativos, '_manifesto', {'arquivos': {}, 'comprimidos': {}})
+    monkeypatch.setenv('VIVANTS_ATIVOS', '1')
+    pasta = tmp_path / 'static'
+    arquivos = {
+        'css/style.css': CSS.encode(),
+        'img/logo.svg': SVG.encode(),
+        'img/fundo.png': b'\x89PNG\r\n\x1a\n' + bytes(range(256)),
+        'js/app.js': b'x',
+        'uploads/produtos/foto.jpg': b'enviado pelo admin',
+    }
+    for rel, dados in arquivos.items():
+        (pasta / rel).parent.mkdir(parents=True, exist_ok=True)
+        (pasta / rel).write_bytes(dados)
+
+    app = Flask(__name__, static_folder=str(pasta))
+    ativos.init_app(app)
+
+    @app.route('/')
+    def inicio():
+        return url_for('static', filename='css/style.css')
+
+    return app, str(pasta)
+
+
+def _ler(pasta, url):
+    return open(os.path.join(pasta, url[len('/static/'):]), 'rb').read()
+
+
+def test_manifesto_e_reescrita_do_css(estatico):
+    _, pasta = estatico
+    manifesto = ativos._manifesto
+    assert set(manifesto['arquivos']) == {'css/style.css', 'img/logo.svg', 'img/fundo.png', 'js/app.js'}
+    assert manifesto['arquivos']['img/logo.svg'].startswith('img/logo.')
+    for destino in manifesto['arquivos'].values():
+        assert os.path.exists(os.path.join(pasta, ativos.PASTA_BUILD, destino))
+
+    css = _ler(pasta, f"/static/build/{manifesto['arquivos']['css/style.css']}").decode()
+    assert f'url("/static/build/{manifesto["arquivos"]["img/logo.svg"]}")' in css
+    assert f'url(/static/build/{manifesto["arquivos"]["img/fundo.png"]})' in css
+    assert 'url(data:image/png;base64,AAAA)' in css
+    assert "url('https://cdn.exemplo/x.png')" in css
+    assert 'url(../img/nao-existe.png)' in css
+
+
+def test_css_muda_de_hash_quando_a_imagem_muda(estatico):
+    _, pasta = estatico
+    antes = dict(ativos._manifesto['arquivos'])
+    with open(os.path.join(pasta, 'img', 'logo.svg'), 'a') as f:
+        f.write('<!-- nova versão -->')
+
+    depois = ativos.carregar_ativos(pasta)['arquivos']
+    assert depois['img/logo.svg'] != antes['img/logo.svg']
+    assert depois['css/style.css'] != antes['css/style.css']
+    assert depois['js/app.js'] == antes['js/app.js']
+    # O build anterior continua lá até a limpeza explícita
+    assert os.path.exists(os.path.join(pasta, ativos.PASTA_BUILD, antes['img/logo.svg']))
+    assert ativos.limpar_builds_antigos(pasta) >= 2
+    assert not os.path.exists(os.path.join(pasta, ativos.PASTA_BUILD, antes['img/logo.svg']))
+
+
+def test_url_for_usa_o_nome_com_hash(estatico):
+    app, _ = estatico
+    cliente = app.test_client()
+    assert cliente.get('/').data.decode() == f"/static/build/{ativos._manifesto['arquivos']['css/style.css']}"
+
+    app.debug = True
+    assert cliente.get('/').data == b'/static/css/style.css'
+
+
+def test_versao_gzip_com_content_encoding_e_vary(estatico):
+    app, pasta = estatico
+    url = f"/static/build/{ativos._manifesto['arquivos']['img/logo.svg']}"
+    resposta = app.test_client().get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+
+    assert resposta.status_code == 200
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resposta.headers['Vary']
+    assert resposta.mimetype == 'image/svg+xml'
+    assert resposta.headers['Cache-Control'] == ativos.CACHE_IMUTAVEL
+    assert gzip.decompress(resposta.data) == SVG.encode()
+    resposta.close()
+
+
+def test_sem_gzip_serve_o_arquivo_original(estatico):
+    app, _ = estatico
+    url = f"/static/build/{ativos._manifesto['arquivos']['img/logo.svg']}"
+    resposta = app.test_client().get(url, headers={'Accept-Encoding': 'identity'})
+
+    assert 'Content-Encoding' not in resposta.headers
+    assert 'Accept-Encoding' in resposta.headers['Vary']
+    assert resposta.headers['Cache-Control'] == ativos.CACHE_IMUTAVEL
+    assert resposta.data == SVG.encode()
+    resposta.close()
+
+
+def test_arquivo_sem_versao_comprimida(estatico):
+    app, _ = estatico
+    # Comprimir 1 byte aumentaria o arquivo: não há .gz e nem Vary
+    url = f"/static/build/{ativos._manifesto['arquivos']['js/app.js']}"
+    resposta = app.test_client().get(url, headers={'Accept-Encoding': 'gzip'})
+
+    assert 'js/app' not in str(ativos._manifesto['comprimidos'])
+    assert 'Content-Encoding' not in resposta.headers
+    assert 'Vary' not in resposta.headers
+    assert resposta.headers['Cache-Control'] == ativos.CACHE_IMUTAVEL
+    resposta.close()
+
+
+def test_arquivo_sem_hash_nao_e_imutavel(estatico):
+    app, _ = estatico
+    resposta = app.test_client().get('/static/uploads/produtos/foto.jpg')
+
+    assert resposta.status_code == 200
+    assert resposta.data == b'enviado pelo admin'
+    assert resposta.headers.get('Cache-Control') != ativos.CACHE_IMUTAVEL
+    resposta.close()
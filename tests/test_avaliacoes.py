@@ -0,0 +1,94 @@
+import pytest
+
+from avaliacoes import AvaliacaoDuplicada, recalcular_resumos, registrar_avaliacao, resumo_produto
+from database import transacao_escrita
+
+
+@pytest.fixture
+def clientes(db):
+    with transacao_escrita(db):
+        return [
+            db.execute("INSERT INTO usuarios (nome, email, senha, tipo) VALUES (?, ?, 'x', 'cliente')",
+                       (f'Cliente {i}', f'cliente{i}@teste')).lastrowid
+            for i in range(4)
+        ]
+
+
+def _resumos(db):
+    return [tuple(row) for row in db.execute('SELECT * FROM avaliacoes_resumo ORDER BY produto_id')]
+
+
+def test_registro_atualiza_o_histograma(db, clientes):
+    for cliente, nota in zip(clientes, (5, 4, 5, 1)):
+        registrar_avaliacao(db, 1, cliente, nota, 'comentário')
+
+    resumo = resumo_produto(db, 1)
+    assert resumo['total'] == 4
+    assert resumo['media'] == 3.8
+    assert resumo['histograma'] == [(5, 2, 50), (4, 1, 25), (3, 0, 0), (2, 0, 0), (1, 1, 25)]
+
+
+def test_produto_sem_avaliacoes(db):
+    resumo = resumo_produto(db, 1)
+    assert resumo['total'] == 0
+    assert resumo['media'] is None
+    assert [quantidade for _, quantidade, _ in resumo['histograma']] == [0] * 5
+
+
+def test_avaliacao_duplicada_nao_altera_o_resumo(db, clientes):
+    registrar_avaliacao(db, 1, clientes[0], 5, 'ótimo')
+    antes = _resumos(db)
+
+    with pytest.raises(AvaliacaoDuplicada):
+        registrar_avaliacao(db, 1, clientes[0], 1, 'mudei de ideia')
+
+    assert _resumos(db) == antes
+    assert db.execute('SELECT COUNT(*) FROM avaliacoes WHERE produto_id = 1').fetchone()[0] == 1
+    assert not db.in_transaction
+
+
+def test_backfill_igual_ao_incremental(db, clientes):
+    for produto in (1, 2, 3):
+        for cliente, nota in zip(clientes, (produto, 5, 3, 2)):
+            registrar_avaliacao(db, produto, cliente, nota, None)
+    incremental = _resumos(db)
+
+    with transacao_escrita(db):
+        db.execute('UPDATE avaliacoes_resumo SET total = 0, soma = 0, nota_5 = 99')
+        db.execute('INSERT INTO avaliacoes_resumo (produto_id, total, soma) VALUES (4, 7, 7)')
+    assert recalcular_resumos(db) == 3
+    assert _resumos(db) == incremental
+
+
+def test_recalculo_so_dos_produtos_indicados(db, clientes):
+    registrar_avaliacao(db, 1, clientes[0], 4, None)
+    registrar_avaliacao(db, 2, clientes[0], 2, None)
+    with transacao_escrita(db):
+        db.execute('DELETE FROM avaliacoes WHERE produto_id = 1')
+        db.execute('UPDATE avaliacoes_resumo SET nota_1 = 42 WHERE produto_id = 2')
+
+    assert recalcular_resumos(db, [1]) == 0
+    assert recalcular_resumos(db, []) == 0
+    assert resumo_produto(db, 1)['total'] == 0
+    # O produto 2 não foi recalculado
+    assert db.execute('SELECT nota_1 FROM avaliacoes_resumo WHERE produto_id = 2').fetchone()[0] == 42
+
+
+def test_exclusao_de_cliente_recalcula_na_mesma_transacao(db, clientes):
+    from app import app
+    registrar_avaliacao(db, 1, clientes[0], 1, None)
+    registrar_avaliacao(db, 1, clientes[1], 5, None)
+    registrar_avaliacao(db, 2, clientes[0], 3, None)
+
+    admin = app.test_client()
+    with admin.session_transaction() as sessao:
+        sessao['user_id'] = 1
+        sessao['user_type'] = 'admin'
+    admin.post(f'/admin/cliente/{clientes[0]}/excluir')
+
+    assert db.execute('SELECT COUNT(*) FROM usuarios WHERE id = ?', (clientes[0],)).fetchone()[0] == 0
+    assert resumo_produto(db, 1)['total'] == 1
+    assert resumo_produto(db, 1)['media'] == 5
+    assert resumo_produto(db, 2)['total'] == 0
+    assert recalcular_resumos(db) == 1
+    assert resumo_produto(db, 1)['histograma'][0] == (5, 1, 100)
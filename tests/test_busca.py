@@ -0,0 +1,81 @@
+import pytest
+
+from busca import autocompletar, buscar_produtos, destacar, paginar_busca, preparar_consulta
+from database import transacao_escrita
+
+
+@pytest.fixture
+def produtos(db):
+    with transacao_escrita(db):
+        ids = {}
+        for chave, nome, descricao, ativo in [
+            ('nome', 'Sérum Vitamina C', 'Antioxidante para o rosto', 1),
+            ('descricao', 'Tônico Facial', 'Prepara a pele para o sérum', 1),
+            ('inativo', 'Sérum Noturno', 'Fora de linha', 0),
+        ]:
+            ids[chave] = db.execute(
+                'INSERT INTO produtos (nome, descricao, preco, categoria_id, estoque, ativo) '
+                'VALUES (?, ?, 10, 1, 5, ?)', (nome, descricao, ativo)
+            ).lastrowid
+    return ids
+
+
+def test_consulta_neutraliza_sintaxe_fts():
+    assert preparar_consulta('creme" OR NEAR(x') == '"creme"* "OR"* "NEAR"* "x"*'
+    assert preparar_consulta('  -- " () ') is None
+    assert preparar_consulta(None) is None
+
+
+def test_consulta_limita_termos():
+    assert preparar_consulta(' '.join(f't{i}' for i in range(20))).count('*') == 10
+
+
+@pytest.mark.parametrize('texto', ['"', 'NEAR(', 'creme AND', '*', 'a:b', "'; DROP TABLE produtos; --"])
+def test_entrada_maliciosa_nao_quebra_a_busca(db, texto):
+    buscar_produtos(db, texto)
+    autocompletar(db, texto)
+
+
+def test_nome_pesa_mais_que_descricao(db, produtos):
+    # Sem acento também encontra; o produto inativo fica de fora
+    resultado = [row['id'] for row in buscar_produtos(db, 'serum')]
+    assert resultado == [produtos['nome'], produtos['descricao']]
+
+
+def test_prefixo_e_destaque(db, produtos):
+    row = buscar_produtos(db, 'vitam')[0]
+    assert row['id'] == produtos['nome']
+    assert str(destacar(row['nome_destacado'])) == 'Sérum <mark>Vitamina</mark> C'
+
+
+def test_autocompletar_so_pelo_nome(db, produtos):
+    sugestoes = autocompletar(db, 'serum')
+    assert [s['id'] for s in sugestoes] == [produtos['nome']]
+    assert '<mark>Sérum</mark>' in sugestoes[0]['destaque']
+
+
+def test_busca_paginada_sem_teto(db):
+    with transacao_escrita(db):
+        db.executemany(
+            'INSERT INTO produtos (nome, descricao, preco, categoria_id, estoque) VALUES (?, ?, 10, 1, 5)',
+            [(f'Kit {i}', 'kit ' * (i % 3 + 1)) for i in range(7)]
+        )
+    esperado = [row['id'] for row in buscar_produtos(db, 'kit')]
+
+    vistos, cursor, paginas = [], None, []
+    while True:
+        pagina = paginar_busca(db, 'kit', cursor=cursor, por_pagina=3)
+        paginas.append(pagina)
+        vistos += [row['id'] for row in pagina]
+        if not pagina.proximo:
+            break
+        cursor = pagina.proximo
+    assert vistos == esperado and len(vistos) == 7
+
+    # Voltando a partir da última página chega à anterior
+    anterior = paginar_busca(db, 'kit', cursor=paginas[-1].anterior, direcao='ant', por_pagina=3)
+    assert [row['id'] for row in anterior] == [row['id'] for row in paginas[-2]]
+
+
+def test_destacar_escapa_html():
+    assert str(destacar('<b>\x02x\x03</b>')) == '&lt;b&gt;<mark>x</mark>&lt;/b&gt;'
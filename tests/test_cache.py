@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import time
+
+from cache import CacheTTL, VersaoCompartilhada
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _worker(caminho):
+    # Cada worker do gunicorn tem seus próprios objetos; só o arquivo é compartilhado
+    return CacheTTL('catalogo', versao=VersaoCompartilhada(caminho, intervalo=0))
+
+
+def test_invalidacao_chega_aos_outros_workers(tmp_path):
+    caminho = str(tmp_path / '.versao_catalogo')
+    a, b = _worker(caminho), _worker(caminho)
+    a.set('categorias', ['antiga'])
+    b.set('categorias', ['antiga'])
+
+    b.invalidar()
+
+    assert a.get('categorias') == (False, None)
+    assert b.get('categorias') == (False, None)
+    a.set('categorias', ['nova'])
+    assert a.get('categorias') == (True, ['nova'])
+
+
+def test_invalidacao_por_outro_processo(tmp_path):
+    caminho = str(tmp_path / '.versao_catalogo')
+    cache = _worker(caminho)
+    cache.set('destaque', [1, 2])
+
+    subprocess.run([sys.executable, '-c', (
+        'import sys; sys.path.insert(0, sys.argv[1]); from cache import VersaoCompartilhada; '
+        'VersaoCompartilhada(sys.argv[2]).incrementar()'
+    ), RAIZ, caminho], check=True)
+
+    assert cache.get('destaque') == (False, None)
+
+
+def test_invalidacao_respeita_intervalo_de_verificacao(tmp_path):
+    caminho = str(tmp_path / '.versao_catalogo')
+    leitor = CacheTTL('catalogo', versao=VersaoCompartilhada(caminho, intervalo=60))
+    leitor.set('x', 1)
+    VersaoCompartilhada(caminho).incrementar()
+    # Dentro do intervalo o worker ainda não releu o arquivo
+    assert leitor.get('x') == (True, 1)
+
+
+def test_lru_ttl_e_contadores():
+    cache = CacheTTL('teste', max_itens=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 1)
+
+    cache.set('curto', 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get('curto') == (False, None)
+
+    stats = cache.estatisticas()
+    assert stats['evictions'] == 2
+    assert stats['hits'] == 2
+    assert stats['misses'] == 2
+    assert stats['expirados'] == 1
+
+
+def test_obter_carrega_uma_vez():
+    cache = CacheTTL('teste')
+    chamadas = []
+    for _ in range(3):
+        assert cache.obter('k', lambda: chamadas.append(1) or 'v') == 'v'
+    assert len(chamadas) == 1
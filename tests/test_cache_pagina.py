@@ -0,0 +1,128 @@
+import pytest
+from flask import Flask, flash, get_flashed_messages
+
+from cache import cache_paginas, invalidar_catalogo
+from database import get_db
+from decorators import PAGINA_S_MAXAGE, cache_pagina
+
+
+@pytest.fixture(autouse=True)
+def _paginas_vazias():
+    invalidar_catalogo()
+    yield
+    invalidar_catalogo()
+
+
+@pytest.fixture
+def contador():
+    """App mínima com uma view em cache que conta as execuções"""
+    app = Flask(__name__)
+    app.secret_key = 'teste'
+    chamadas = []
+
+    @app.route('/pagina', methods=['GET', 'POST'])
+    @cache_pagina
+    def pagina():
+        chamadas.append(1)
+        get_flashed_messages()  # como o layout base dos templates
+        return f'render {len(chamadas)}'
+
+    @app.route('/avisar')
+    def avisar():
+        flash('aviso')
+        return 'ok'
+
+    return app.test_client(), chamadas
+
+
+def test_get_anonimo_servido_do_cache(contador):
+    cliente, chamadas = contador
+    primeira = cliente.get('/pagina')
+    segunda = cliente.get('/pagina')
+
+    assert primeira.data == segunda.data == b'render 1'
+    assert len(chamadas) == 1
+    assert segunda.headers['ETag'] == primeira.headers['ETag']
+
+
+def test_cabecalhos_de_cache(contador):
+    cliente, _ = contador
+    resposta = cliente.get('/pagina')
+
+    assert 'Cookie' in resposta.headers['Vary']
+    assert resposta.cache_control.public
+    assert resposta.cache_control.max_age == 0
+    assert resposta.cache_control.s_maxage == PAGINA_S_MAXAGE
+    assert resposta.cache_control.must_revalidate
+    assert resposta.last_modified is not None
+
+
+def test_if_none_match_responde_304(contador):
+    cliente, chamadas = contador
+    etag = cliente.get('/pagina').headers['ETag']
+
+    resposta = cliente.get('/pagina', headers={'If-None-Match': etag})
+    assert resposta.status_code == 304
+    assert resposta.data == b''
+    assert len(chamadas) == 1
+
+    assert cliente.get('/pagina', headers={'If-None-Match': '"outra"'}).status_code == 200
+
+
+def test_post_passa_direto(contador):
+    cliente, chamadas = contador
+    cliente.get('/pagina')
+    resposta = cliente.post('/pagina')
+
+    assert resposta.data == b'render 2'
+    assert 'ETag' not in resposta.headers
+
+
+def test_usuario_logado_passa_direto(contador):
+    cliente, chamadas = contador
+    cliente.get('/pagina')
+    with cliente.session_transaction() as sessao:
+        sessao['user_id'] = 1
+
+    assert cliente.get('/pagina').data == b'render 2'
+    assert cliente.get('/pagina').data == b'render 3'
+    assert cache_paginas.estatisticas()['itens'] == 1
+
+
+def test_flash_pendente_passa_direto(contador):
+    cliente, chamadas = contador
+    cliente.get('/avisar')
+
+    # A mensagem pendente é consumida pela view, que não entra no cache
+    assert cliente.get('/pagina').data == b'render 1'
+    assert cache_paginas.estatisticas()['itens'] == 0
+    assert cliente.get('/pagina').data == b'render 2'
+    assert cliente.get('/pagina').data == b'render 2'
+
+
+def test_edicao_do_admin_invalida_a_pagina(banco):
+    from app import app
+    visitante, admin = app.test_client(), app.test_client()
+    with admin.session_transaction() as sessao:
+        sessao['user_id'] = 1
+        sessao['user_type'] = 'admin'
+
+    antes = visitante.get('/produto/1')
+    assert visitante.get('/produto/1', headers={'If-None-Match': antes.headers['ETag']}).status_code == 304
+
+    db = get_db()
+    try:
+        produto = db.execute('SELECT * FROM produtos WHERE id = 1').fetchone()
+    finally:
+        db.close()
+    admin.post('/admin/produtos', data={
+        'action': 'editar', 'produto_id': 1, 'nome': 'Nome Editado Pelo Admin',
+        'descricao': produto['descricao'], 'preco': produto['preco'], 'categoria_id': produto['categoria_id'],
+        'estoque': produto['estoque'], 'ativo': '1',
+    })
+
+    depois = visitante.get('/produto/1', headers={'If-None-Match': antes.headers['ETag']})
+    assert depois.status_code == 200
+    assert depois.headers['ETag'] != antes.headers['ETag']
+    assert 'Nome Editado Pelo Admin' in depois.get_data(as_text=True)
+    assert 'Nome Editado Pelo Admin' not in antes.get_data(as_text=True)
@@ -0,0 +1,127 @@
+import sqlite3
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import database
+from carrinho import CHAVE_SESSAO, adicionar_item, mesclar_carrinho
+from database import transacao_escrita
+
+
+@pytest.fixture
+def loja(db):
+    """Um cliente com senha conhecida e três produtos (um inativo)"""
+    with transacao_escrita(db):
+        cliente = db.execute(
+            "INSERT INTO usuarios (nome, email, senha, tipo) VALUES ('Cliente', 'cliente@teste', ?, 'cliente')",
+            (generate_password_hash('segredo'),)
+        ).lastrowid
+        produtos = [
+            db.execute('INSERT INTO produtos (nome, preco, estoque, ativo) VALUES (?, 10, ?, ?)',
+                       (nome, estoque, ativo)).lastrowid
+            for nome, estoque, ativo in (('Camiseta', 5, 1), ('Boné', 3, 1), ('Inativo', 10, 0))
+        ]
+    return cliente, produtos
+
+
+def _carrinho(db, usuario_id):
+    return dict(db.execute('SELECT produto_id, quantidade FROM carrinho WHERE usuario_id = ?', (usuario_id,)))
+
+
+def test_upsert_soma_e_respeita_o_estoque(db, loja):
+    cliente, (a, _, inativo) = loja
+    assert adicionar_item(db, cliente, a, 2)
+    assert adicionar_item(db, cliente, a, 3)
+    assert _carrinho(db, cliente) == {a: 5}
+
+    # rowcount 0: passaria do estoque, produto inativo ou inexistente
+    assert not adicionar_item(db, cliente, a, 1)
+    assert not adicionar_item(db, cliente, inativo, 1)
+    assert not adicionar_item(db, cliente, 9999, 1)
+    assert _carrinho(db, cliente) == {a: 5}
+    assert not db.in_transaction
+
+
+def test_unique_impede_linhas_repetidas(db, loja):
+    cliente, (a, _, _) = loja
+    adicionar_item(db, cliente, a, 1)
+    with pytest.raises(sqlite3.IntegrityError):
+        with transacao_escrita(db):
+            db.execute('INSERT INTO carrinho (usuario_id, produto_id, quantidade) VALUES (?, ?, 1)', (cliente, a))
+
+
+def test_mesclar_soma_ao_carrinho_existente_limitado_ao_estoque(db, loja):
+    cliente, (a, b, inativo) = loja
+    adicionar_item(db, cliente, a, 4)
+    sessao = {CHAVE_SESSAO: {str(a): 3, str(b): 2, str(inativo): 1}}
+
+    assert mesclar_carrinho(db, sessao, cliente) == 3
+    assert _carrinho(db, cliente) == {a: 5, b: 2}
+    assert CHAVE_SESSAO not in sessao
+    assert mesclar_carrinho(db, sessao, cliente) == 0
+
+
+def test_visitante_adiciona_sem_escrever_no_banco(db, loja):
+    from app import app
+    _, (a, b, _) = loja
+    visitante = app.test_client()
+    # data_version muda quando outra conexão confirma uma escrita no banco
+    versao = db.execute('PRAGMA data_version').fetchone()[0]
+
+    visitante.post(f'/adicionar-carrinho/{a}', data={'quantidade': 2})
+    visitante.post(f'/adicionar-carrinho/{a}', data={'quantidade': 2})
+    visitante.post(f'/adicionar-carrinho/{a}', data={'quantidade': 2})  # passaria de 5
+    visitante.post(f'/adicionar-carrinho/{b}', data={'quantidade': 4})  # estoque 3
+
+    with visitante.session_transaction() as sessao:
+        assert sessao[CHAVE_SESSAO] == {str(a): 4}
+    assert db.execute('SELECT COUNT(*) FROM carrinho').fetchone()[0] == 0
+    assert db.execute('SELECT COUNT(*) FROM sessoes').fetchone()[0] == 0
+    assert db.execute('PRAGMA data_version').fetchone()[0] == versao
+
+    pagina = visitante.get('/carrinho')
+    assert pagina.status_code == 200
+    assert 'Camiseta' in pagina.get_data(as_text=True)
+
+
+def test_carrinho_de_visitante_mesclado_no_login(db, loja):
+    from app import app
+    cliente, (a, b, _) = loja
+    adicionar_item(db, cliente, b, 2)
+    visitante = app.test_client()
+    visitante.post(f'/adicionar-carrinho/{a}', data={'quantidade': 3})
+    visitante.post(f'/adicionar-carrinho/{b}', data={'quantidade': 3})
+
+    resposta = visitante.post('/login', data={'email': 'cliente@teste', 'senha': 'segredo'})
+
+    assert resposta.headers['Location'].endswith('/carrinho')
+    assert _carrinho(db, cliente) == {a: 3, b: 3}
+    with visitante.session_transaction() as sessao:
+        assert sessao['user_id'] == cliente
+        assert CHAVE_SESSAO not in sessao
+
+
+def test_migracao_10_junta_linhas_repetidas(db, loja):
+    cliente, (a, b, _) = loja
+    passo = next(passo for versao, _, passo in database.MIGRACOES if versao == 10)
+    with transacao_escrita(db):
+        # Como um banco anterior à migração: índice comum e linhas repetidas
+        db.execute('DROP INDEX idx_carrinho_usuario_produto_unico')
+        db.execute('CREATE INDEX idx_carrinho_usuario_produto ON carrinho(usuario_id, produto_id)')
+        db.executemany('INSERT INTO carrinho (usuario_id, produto_id, quantidade) VALUES (?, ?, ?)',
+                       [(cliente, a, 1), (cliente, b, 2), (cliente, a, 2), (cliente, a, 1)])
+        primeiro_a = db.execute('SELECT MIN(id) FROM carrinho WHERE produto_id = ?', (a,)).fetchone()[0]
+
+    with transacao_escrita(db):
+        for comando in database._comandos(passo):
+            db.execute(comando)
+
+    linhas = db.execute('SELECT id, produto_id, quantidade FROM carrinho ORDER BY produto_id').fetchall()
+    assert [tuple(linha) for linha in linhas] == [
+        (primeiro_a, a, 4),
+        (linhas[1]['id'], b, 2),
+    ]
+    indices = {row['name'] for row in db.execute("SELECT name FROM sqlite_master WHERE tbl_name = 'carrinho'")}
+    assert 'idx_carrinho_usuario_produto' not in indices
+    assert adicionar_item(db, cliente, a, 1)
+    assert _carrinho(db, cliente) == {a: 5, b: 2}
@@ -0,0 +1,96 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import database
+from checkout import CarrinhoVazio, EstoqueInsuficiente, finalizar_compra
+from database import transacao_escrita
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ESTOQUE = 5
+
+
+@pytest.fixture
+def disputa(db):
+    """Um produto com ESTOQUE unidades e 4x mais compradores com 1 unidade no carrinho"""
+    with transacao_escrita(db):
+        produto_id = db.execute(
+            "INSERT INTO produtos (nome, preco, categoria_id, estoque) VALUES ('Último lote', 10, 1, ?)",
+            (ESTOQUE,)
+        ).lastrowid
+        usuarios = []
+        for i in range(ESTOQUE * 4):
+            usuario_id = db.execute(
+                "INSERT INTO usuarios (nome, email, senha) VALUES (?, ?, 'x')", (f'C{i}', f'c{i}@teste')
+            ).lastrowid
+            db.execute('INSERT INTO carrinho (usuario_id, produto_id, quantidade) VALUES (?, ?, 1)',
+                       (usuario_id, produto_id))
+            usuarios.append(usuario_id)
+    return produto_id, usuarios
+
+
+def _resultado(db, produto_id):
+    estoque = db.execute('SELECT estoque FROM produtos WHERE id = ?', (produto_id,)).fetchone()[0]
+    pedidos = db.execute('SELECT COUNT(*) FROM itens_pedido WHERE produto_id = ?', (produto_id,)).fetchone()[0]
+    return estoque, pedidos
+
+
+def test_threads_disputando_as_ultimas_unidades(db, disputa):
+    produto_id, usuarios = disputa
+    vendidos, recusados, erros = [], [], []
+    largada = threading.Barrier(len(usuarios), timeout=30)
+
+    def comprar(usuario_id):
+        largada.wait()
+        conn = database.get_db()
+        try:
+            vendidos.append(finalizar_compra(conn, usuario_id, 'Rua A, 1'))
+        except EstoqueInsuficiente:
+            recusados.append(usuario_id)
+        except Exception as e:
+            erros.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=comprar, args=(u,)) for u in usuarios]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert erros == []
+    assert len(vendidos) == ESTOQUE
+    assert len(recusados) == len(usuarios) - ESTOQUE
+    assert _resultado(db, produto_id) == (0, ESTOQUE)
+
+
+def test_processos_disputando_as_ultimas_unidades(db, disputa, banco):
+    # Processos separados não compartilham a fila de escrita: só o BEGIN IMMEDIATE os ordena
+    produto_id, usuarios = disputa
+    script = (
+        'import sys; sys.path.insert(0, sys.argv[1]); import database; '
+        'database.DATABASE = sys.argv[2]; '
+        'from checkout import finalizar_compra, EstoqueInsuficiente; '
+        'db = database.get_db()\n'
+        'for usuario in sys.argv[3:]:\n'
+        '    try: finalizar_compra(db, int(usuario), "Rua B, 2")\n'
+        '    except EstoqueInsuficiente: pass\n'
+    )
+    processos = [
+        subprocess.Popen([sys.executable, '-c', script, RAIZ, banco] + [str(u) for u in usuarios[i::4]])
+        for i in range(4)
+    ]
+    assert [p.wait() for p in processos] == [0, 0, 0, 0]
+
+    assert _resultado(db, produto_id) == (0, ESTOQUE)
+    assert db.execute('SELECT COUNT(*) FROM carrinho WHERE produto_id = ?', (produto_id,)).fetchone()[0] \
+        == len(usuarios) - ESTOQUE
+
+
+def test_carrinho_vazio(db):
+    with pytest.raises(CarrinhoVazio):
+        finalizar_compra(db, 999, 'Rua C, 3')
+    assert not db.in_transaction
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+import database
+from database import TransacaoPendente, transacao_escrita
+
+
+def test_transacao_pendente_nao_e_confirmada(db):
+    db.execute("INSERT INTO categorias (nome) VALUES ('Pendente')")
+    assert db.in_transaction
+
+    with pytest.raises(TransacaoPendente):
+        with transacao_escrita(db):
+            pass
+
+    db.rollback()
+    assert db.execute("SELECT COUNT(*) FROM categorias WHERE nome = 'Pendente'").fetchone()[0] == 0
+
+
+def test_rollback_quando_o_bloco_falha(db):
+    with pytest.raises(RuntimeError):
+        with transacao_escrita(db):
+            db.execute("INSERT INTO categorias (nome) VALUES ('Descartada')")
+            raise RuntimeError
+
+    assert not db.in_transaction
+    assert db.execute("SELECT COUNT(*) FROM categorias WHERE nome = 'Descartada'").fetchone()[0] == 0
+
+
+def test_escritores_concorrentes_sem_erro_de_lock(banco):
+    threads, por_thread = 8, 25
+    erros = []
+
+    def escritor(n):
+        conn = database.get_db()
+        try:
+            for i in range(por_thread):
+                with transacao_escrita(conn):
+                    conn.execute('INSERT INTO categorias (nome) VALUES (?)', (f'T{n}-{i}',))
+                    conn.execute('UPDATE produtos SET estoque = estoque + 1 WHERE id = 1')
+                # Leituras no meio das escritas não seguram o escritor seguinte
+                conn.execute('SELECT COUNT(*) FROM produtos').fetchone()
+        except Exception as e:
+            erros.append(e)
+        finally:
+            conn.close()
+
+    estoque_inicial = _estoque(1)
+    workers = [threading.Thread(target=escritor, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    assert erros == []
+    assert _estoque(1) == estoque_inicial + threads * por_thread
+
+
+def _estoque(produto_id):
+    conn = database.get_db()
+    try:
+        return conn.execute('SELECT estoque FROM produtos WHERE id = ?', (produto_id,)).fetchone()[0]
+    finally:
+        conn.close()
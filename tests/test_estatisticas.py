@@ -0,0 +1,126 @@
+import pytest
+
+from checkout import finalizar_compra
+from database import transacao_escrita
+from estatisticas import reconstruir_estatisticas, resumo_dashboard, verificar_estatisticas
+from manutencao import purgar_pedidos_cancelados, purgar_produtos_inativos
+
+
+@pytest.fixture
+def loja(db):
+    """Um cliente e três produtos em categorias diferentes (um sem categoria)"""
+    with transacao_escrita(db):
+        cliente = db.execute(
+            "INSERT INTO usuarios (nome, email, senha, tipo) VALUES ('Cliente', 'cliente@teste', 'x', 'cliente')"
+        ).lastrowid
+        produtos = [
+            db.execute('INSERT INTO produtos (nome, preco, categoria_id, estoque) VALUES (?, ?, ?, 100)',
+                       (nome, preco, categoria)).lastrowid
+            for nome, preco, categoria in (('A', 10, 1), ('B', 25.5, 2), ('C', 7, None))
+        ]
+    assert verificar_estatisticas(db) == []
+    return cliente, produtos
+
+
+def _comprar(db, cliente, itens):
+    with transacao_escrita(db):
+        db.executemany('INSERT INTO carrinho (usuario_id, produto_id, quantidade) VALUES (?, ?, ?)',
+                       [(cliente, produto, quantidade) for produto, quantidade in itens])
+    return finalizar_compra(db, cliente, 'Rua A, 1')
+
+
+def _executar(db, sql, params=()):
+    with transacao_escrita(db):
+        db.execute(sql, params)
+    assert verificar_estatisticas(db) == []
+
+
+def test_checkout_e_mudancas_de_status(db, loja):
+    cliente, (a, b, c) = loja
+    pedido = _comprar(db, cliente, [(a, 2), (b, 1), (c, 3)])
+    assert verificar_estatisticas(db) == []
+
+    for status in ('processando', 'enviado', 'cancelado', 'pendente', 'entregue', 'cancelado', 'entregue'):
+        _executar(db, 'UPDATE pedidos SET status = ? WHERE id = ?', (status, pedido))
+
+    resumo = resumo_dashboard(db)
+    assert resumo['total_pedidos'] == 1
+    assert resumo['faturamento_total'] == pytest.approx(2 * 10 + 25.5 + 3 * 7)
+
+
+def test_status_nulo_conta_como_pendente(db, loja):
+    cliente, (a, b, _) = loja
+    pedido = _comprar(db, cliente, [(a, 1), (b, 2)])
+
+    # 'pendente' -> NULL e volta não mudam nada; NULL -> outro status move as vendas
+    for status in (None, 'pendente', None, 'cancelado', None, 'entregue'):
+        _executar(db, 'UPDATE pedidos SET status = ? WHERE id = ?', (status, pedido))
+
+
+def test_total_e_data_alterados(db, loja):
+    cliente, (a, _, _) = loja
+    pedido = _comprar(db, cliente, [(a, 1)])
+    _executar(db, 'UPDATE pedidos SET total = 99.9 WHERE id = ?', (pedido,))
+    _executar(db, "UPDATE pedidos SET data_pedido = '2020-01-01 10:00:00' WHERE id = ?", (pedido,))
+
+
+def test_purga_de_pedidos_cancelados(db, loja):
+    cliente, (a, b, c) = loja
+    pedidos = [_comprar(db, cliente, [(a, 1), (b, i + 1), (c, 2)]) for i in range(5)]
+    with transacao_escrita(db):
+        db.executemany("UPDATE pedidos SET status = 'cancelado' WHERE id = ?", [(p,) for p in pedidos[:3]])
+    assert verificar_estatisticas(db) == []
+
+    assert purgar_pedidos_cancelados(db, lote=2) == 3
+    assert verificar_estatisticas(db) == []
+    assert resumo_dashboard(db)['total_pedidos'] == 2
+
+
+def test_purga_de_produtos_inativos(db, loja):
+    cliente, (a, b, _) = loja
+    _comprar(db, cliente, [(a, 1)])
+    for ativo in (None, 1, 0):
+        _executar(db, 'UPDATE produtos SET ativo = ? WHERE id IN (?, ?)', (ativo, a, b))
+
+    # Só o produto sem pedidos sai
+    assert purgar_produtos_inativos(db, lote=1) == 1
+    assert verificar_estatisticas(db) == []
+    total = db.execute('SELECT COUNT(*) FROM produtos WHERE ativo = 1').fetchone()[0]
+    assert resumo_dashboard(db)['total_produtos'] == total
+
+
+def test_produto_excluido_e_troca_de_categoria(db, loja):
+    cliente, (a, b, c) = loja
+    _comprar(db, cliente, [(a, 2), (b, 1), (c, 1)])
+    _comprar(db, cliente, [(a, 1), (b, 3)])
+
+    for categoria in (2, None, 1, 0, None, 3):
+        _executar(db, 'UPDATE produtos SET categoria_id = ? WHERE id = ?', (categoria, b))
+    # As vendas do produto excluído ficam em "Sem categoria"
+    _executar(db, 'DELETE FROM produtos WHERE id = ?', (a,))
+    _executar(db, 'DELETE FROM produtos WHERE id = ?', (c,))
+
+
+def test_tipo_de_usuario(db, loja):
+    cliente, _ = loja
+    for tipo in ('admin', 'cliente', None, 'cliente'):
+        _executar(db, 'UPDATE usuarios SET tipo = ? WHERE id = ?', (tipo, cliente))
+    _executar(db, 'DELETE FROM usuarios WHERE id = ?', (cliente,))
+
+
+def test_reconstruir_corrige_tabelas_corrompidas(db, loja):
+    cliente, (a, b, _) = loja
+    _comprar(db, cliente, [(a, 1), (b, 2)])
+    esperado = resumo_dashboard(db)
+
+    with transacao_escrita(db):
+        db.execute("UPDATE estatisticas SET valor = valor + 7 WHERE chave = 'clientes'")
+        db.execute('UPDATE vendas_status SET total = total + 100')
+        db.execute('DELETE FROM vendas_dia')
+        db.execute("INSERT INTO vendas_categoria (categoria_id, status, itens, receita) VALUES (42, 'entregue', 3, 30)")
+    tabelas = {divergencia[0] for divergencia in verificar_estatisticas(db)}
+    assert tabelas == {'estatisticas', 'vendas_status', 'vendas_dia', 'vendas_categoria'}
+
+    reconstruir_estatisticas(db)
+    assert verificar_estatisticas(db) == []
+    assert resumo_dashboard(db) == esperado
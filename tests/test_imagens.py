@@ -0,0 +1,151 @@
+import io
+import json
+import os
+import time
+
+import pytest
+from PIL import Image
+
+import imagens
+from cache import CacheTTL
+from database import transacao_escrita
+from imagens import caminho_manifesto, caminho_variante, processar_imagem, variantes_imagem
+
+
+@pytest.fixture
+def raiz(tmp_path, monkeypatch):
+    monkeypatch.setattr(imagens, 'BASE_DIR', str(tmp_path))
+    monkeypatch.setattr(imagens, '_manifestos', CacheTTL('manifestos', max_itens=2))
+    return tmp_path
+
+
+def _png(largura, altura, modo='RGB', cor=(200, 30, 30), exif_orientacao=None):
+    imagem = Image.new(modo, (largura, altura), cor)
+    buffer = io.BytesIO()
+    if exif_orientacao:
+        exif = Image.Exif()
+        exif[0x0112] = exif_orientacao
+        imagem.convert('RGB').save(buffer, 'JPEG', exif=exif)
+    else:
+        imagem.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _armazenar(dados, extensao='png'):
+    url, nova = imagens.armazenar_imagem(dados, extensao, 'static/uploads/produtos')
+    assert nova
+    return url, imagens._caminho_local(url)
+
+
+def test_variantes_em_todas_as_larguras_e_formatos(raiz):
+    url, caminho = _armazenar(_png(1200, 600))
+
+    manifesto = processar_imagem(caminho)
+
+    assert manifesto['larguras'] == {'detail': [800, 400], 'card': [400, 200], 'thumb': [160, 80]}
+    for nome, (largura, altura) in manifesto['larguras'].items():
+        for extensao, formato in (('webp', 'WEBP'), ('jpg', 'JPEG')):
+            with Image.open(caminho_variante(caminho, nome, extensao)) as variante:
+                assert (variante.format, variante.size) == (formato, (largura, altura))
+    with open(caminho_manifesto(caminho)) as f:
+        assert json.load(f) == manifesto
+
+    variantes = variantes_imagem(url)
+    assert variantes.dimensoes('card') == [400, 200]
+    assert variantes.srcset('webp') == ', '.join(
+        f'{caminho_variante(url, nome, "webp")} {largura}w'
+        for nome, largura in (('thumb', 160), ('card', 400), ('detail', 800))
+    )
+
+
+def test_imagem_pequena_nao_e_ampliada(raiz):
+    url, caminho = _armazenar(_png(300, 100))
+
+    assert processar_imagem(caminho)['larguras'] == {'detail': [300, 100], 'card': [300, 100], 'thumb': [160, 53]}
+    # Larguras repetidas entram uma única vez no srcset
+    assert variantes_imagem(url).srcset().count('300w') == 1
+
+
+def test_orientacao_exif_e_transparencia(raiz):
+    _, girada = _armazenar(_png(600, 200, exif_orientacao=6), extensao='jpg')
+    # Orientação 6: rotação de 90°, a largura vira altura
+    assert processar_imagem(girada)['larguras']['card'] == [200, 600]
+    with Image.open(caminho_variante(girada, 'card', 'jpg')) as variante:
+        assert 0x0112 not in variante.getexif()
+
+    _, transparente = _armazenar(_png(100, 100, modo='RGBA', cor=(0, 0, 0, 0)))
+    processar_imagem(transparente)
+    with Image.open(caminho_variante(transparente, 'thumb', 'jpg')) as variante:
+        # Sem canal alfa no JPEG: o fundo transparente vira branco
+        assert variante.mode == 'RGB'
+        assert all(canal > 245 for canal in variante.getpixel((50, 50)))
+
+
+def test_sem_manifesto_ainda_nao_ha_variantes(raiz):
+    url, _ = _armazenar(_png(500, 500))
+    assert variantes_imagem(url) is None
+    assert imagens._manifestos.get(url) == (False, None)
+
+
+def test_manifestos_em_memoria_sao_limitados(raiz):
+    urls = []
+    for cor in range(3):
+        url, caminho = _armazenar(_png(200, 100, cor=(cor, 0, 0)))
+        processar_imagem(caminho)
+        assert variantes_imagem(url) is not None
+        urls.append(url)
+
+    assert imagens._manifestos.estatisticas()['itens'] == 2
+    assert imagens._manifestos.get(urls[0]) == (False, None)
+    # Fora da memória, o manifesto é relido do disco
+    assert variantes_imagem(urls[0]).dimensoes('thumb') == [160, 80]
+
+
+def _produto(db, imagem):
+    with transacao_escrita(db):
+        return db.execute(
+            "INSERT INTO produtos (nome, preco, categoria_id, imagem) VALUES ('Foto', 10, 1, ?)", (imagem,)
+        ).lastrowid
+
+
+def _envelhecer(caminho):
+    antigo = time.time() - imagens.CARENCIA_REMOCAO - 60
+    os.utime(caminho, (antigo, antigo))
+
+
+def test_liberar_remove_arquivos_depois_do_commit(db, raiz, monkeypatch):
+    url, caminho = _armazenar(_png(200, 100))
+    processar_imagem(caminho)
+    _envelhecer(caminho)
+    produto_id = _produto(db, url)
+    assert not imagens.liberar_imagem(db, url)
+
+    with transacao_escrita(db):
+        db.execute('UPDATE produtos SET imagem = NULL WHERE id = ?', (produto_id,))
+    em_transacao = []
+    removendo = imagens.remover_imagem
+    monkeypatch.setattr(imagens, 'remover_imagem', lambda u: (em_transacao.append(db.in_transaction), removendo(u)))
+
+    assert imagens.liberar_imagem(db, url)
+    assert em_transacao == [False]
+    assert not any(os.path.exists(arquivo) for arquivo in imagens.arquivos_imagem(url))
+
+
+def test_limpeza_de_orfas_em_lotes(db, raiz, monkeypatch):
+    monkeypatch.setattr(imagens, 'LOTE_LIMPEZA', 2)
+    urls = []
+    for cor in range(5):
+        url, caminho = _armazenar(_png(20, 20, cor=(0, cor, 0)))
+        _envelhecer(caminho)
+        urls.append(url)
+    _produto(db, urls[0])
+    # Reaproveitado por um upload recente: fica até a carência passar
+    os.utime(imagens._caminho_local(urls[1]))
+    transacoes = []
+    abrir = imagens.transacao_escrita
+    monkeypatch.setattr(imagens, 'transacao_escrita', lambda conn: transacoes.append(1) or abrir(conn))
+
+    assert imagens.limpar_orfas(db, 'static/uploads/produtos') == 3
+
+    assert len(transacoes) == 3
+    assert [os.path.exists(imagens._caminho_local(u)) for u in urls] == [True, True, False, False, False]
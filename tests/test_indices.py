@@ -0,0 +1,182 @@
+import ast
+import os
+
+import pytest
+
+import database
+from checkout import _ler_carrinho
+from paginacao import paginar
+
+# Consultas quentes e o índice que cada uma deve usar
+CONSULTAS = [
+    ('SELECT * FROM produtos WHERE ativo = 1 AND destaque = 1 LIMIT 6', (),
+     'idx_produtos_ativo_destaque'),
+    ('SELECT * FROM itens_pedido WHERE pedido_id = ?', (1,),
+     'idx_itens_pedido_pedido'),
+    ('SELECT COUNT(*) FROM pedidos WHERE usuario_id = ?', (1,),
+     'idx_pedidos_usuario_data'),
+    ("SELECT id FROM pedidos WHERE status = 'cancelado'", (),
+     'idx_pedidos_status'),
+    ('SELECT * FROM categorias WHERE ativo = 1', (),
+     'idx_categorias_ativo'),
+    ('SELECT 1 FROM produtos WHERE imagem = ? LIMIT 1', ('/static/uploads/x.jpg',),
+     'idx_produtos_imagem'),
+    ('DELETE FROM sessoes WHERE expira <= ?', (0,),
+     'idx_sessoes_expira'),
+]
+
+# Listagens paginadas: (select, ordem, where, índice)
+PAGINADAS = [
+    ('SELECT p.*, c.nome as categoria_nome FROM produtos p LEFT JOIN categorias c ON p.categoria_id = c.id',
+     ('p.data_cadastro', 'p.id'), ['p.ativo = 1', 'p.categoria_id = 1'],
+     'idx_produtos_categoria_ativo_cadastro'),
+    ('SELECT * FROM pedidos', ('data_pedido', 'id'), ['usuario_id = 1'],
+     'idx_pedidos_usuario_data'),
+    ('SELECT a.*, u.nome as usuario_nome FROM avaliacoes a JOIN usuarios u ON a.usuario_id = u.id',
+     ('a.data_avaliacao', 'a.id'), ['a.produto_id = 1'],
+     'idx_avaliacoes_produto_data'),
+    ('SELECT u.* FROM usuarios u', ('u.data_cadastro', 'u.id'), ["u.tipo = 'cliente'"],
+     'idx_usuarios_tipo_cadastro'),
+]
+
+
+@pytest.fixture(autouse=True)
+def _colunas_data_em_cache(db):
+    # A leitura do schema feita no primeiro layout não deve aparecer no trace
+    database.colunas_data(db)
+
+
+def _plano(db, sql, params=()):
+    return [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def _assert_usa_indice(plano, indice):
+    assert any(f'INDEX {indice} ' in passo for passo in plano), plano
+    assert not any(passo.startswith('SCAN ') for passo in plano), plano
+    assert not any('TEMP B-TREE' in passo for passo in plano), plano
+
+
+@pytest.mark.parametrize('sql, params, indice', CONSULTAS, ids=[c[2] for c in CONSULTAS])
+def test_consulta_usa_indice(db, sql, params, indice):
+    _assert_usa_indice(_plano(db, sql, params), indice)
+
+
+@pytest.mark.parametrize('select, ordem, where, indice', PAGINADAS, ids=[p[3] for p in PAGINADAS])
+def test_paginacao_usa_indice(db, select, ordem, where, indice):
+    executadas = []
+    db.set_trace_callback(executadas.append)
+    try:
+        paginar(db, select, ordem=ordem, chaves=('data', 'id'), where=where)
+    finally:
+        db.set_trace_callback(None)
+    _assert_usa_indice(_plano(db, executadas[-1]), indice)
+
+
+# Trechos de SQL de app.py que só viram consulta em tempo de execução
+# (concatenados com filtros): as formas que chegam ao banco
+COMPLETAR = {
+    'SELECT COUNT(*) FROM produtos p WHERE ': [
+        'SELECT COUNT(*) FROM produtos p WHERE p.ativo = 1',
+        'SELECT COUNT(*) FROM produtos p WHERE p.ativo = 1 AND p.categoria_id = ?',
+    ],
+}
+# Filtros de chamadas do paginar montados em variáveis, pelo nome da variável
+WHERE_DINAMICOS = {'where': ['p.ativo = 1', 'p.categoria_id = 1']}
+
+
+def _nome_chamada(no):
+    funcao = no.func
+    return funcao.attr if isinstance(funcao, ast.Attribute) else getattr(funcao, 'id', None)
+
+
+def _consultas_do_app():
+    """Todas as consultas SELECT escritas em app.py: (linha, sql completo, chamada do paginar ou None)"""
+    import app
+    arvore = ast.parse(open(os.path.join(os.path.dirname(database.__file__), 'app.py')).read())
+    bases_paginar = {}
+    for no in ast.walk(arvore):
+        if isinstance(no, ast.Call) and _nome_chamada(no) == 'paginar':
+            bases_paginar[id(no.args[1])] = no
+
+    consultas = []
+    for no in ast.walk(arvore):
+        if isinstance(no, ast.JoinedStr):
+            inicio = no.values[0]
+            if not (isinstance(inicio, ast.Constant) and inicio.value.lstrip().upper().startswith('SELECT')):
+                continue
+            sql = eval(compile(ast.Expression(no), 'app.py', 'eval'), vars(app))
+        elif isinstance(no, ast.Constant) and isinstance(no.value, str):
+            sql = no.value
+        else:
+            continue
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        if id(no) in bases_paginar:
+            consultas.append((no.lineno, sql, bases_paginar[id(no)]))
+        elif sql.lstrip() in COMPLETAR:
+            consultas.extend((no.lineno, completo, None) for completo in COMPLETAR[sql.lstrip()])
+        else:
+            consultas.append((no.lineno, sql, None))
+    # Partes de uma f-string também aparecem como constantes soltas: ficam só as completas
+    return [(linha, sql, chamada) for linha, sql, chamada in consultas if chamada or _completa(sql)]
+
+
+def _completa(sql):
+    return not sql.rstrip().upper().endswith(('WHERE', ',', 'FROM'))
+
+
+def _argumento(chamada, nome):
+    for kw in chamada.keywords:
+        if kw.arg == nome:
+            if isinstance(kw.value, ast.Name):
+                return WHERE_DINAMICOS[kw.value.id]
+            return ast.literal_eval(kw.value)
+    return None
+
+
+def test_todas_as_consultas_do_app_usam_indice(db):
+    """Cada SELECT de app.py (inclusive as bases do paginar e as f-strings) sem
+    varredura completa de tabela nem ordenação em árvore temporária. Varrer um
+    índice em ordem (ORDER BY ... LIMIT, COUNT(*) coberto) é permitido."""
+    consultas = _consultas_do_app()
+    assert len(consultas) > 40
+    for linha, sql, chamada in consultas:
+        if chamada is not None:
+            executadas = []
+            db.set_trace_callback(executadas.append)
+            try:
+                where = _argumento(chamada, 'where') or []
+                paginar(db, sql, ordem=_argumento(chamada, 'ordem'), chaves=('a', 'b'),
+                        where=where, params=[1] * sum(w.count('?') for w in where))
+            finally:
+                db.set_trace_callback(None)
+            sql = executadas[-1]
+        plano = _plano(db, sql, (1,) * sql.count('?'))
+        assert not any(p.startswith('SCAN ') and ' USING ' not in p for p in plano), (linha, plano)
+        assert not any('TEMP B-TREE' in p for p in plano), (linha, plano)
+
+
+def test_carrinho_usa_indice_unico(db):
+    executadas = []
+    db.set_trace_callback(executadas.append)
+    try:
+        _ler_carrinho(db, 1)
+    finally:
+        db.set_trace_callback(None)
+    _assert_usa_indice(_plano(db, executadas[-1]), 'idx_carrinho_usuario_produto_unico')
+
+
+def test_preparar_banco_cria_e_migra(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'novo.db'))
+    monkeypatch.setattr(database, '_pool', None)
+
+    database.preparar_banco()
+    database.preparar_banco()
+
+    conn = database.get_db()
+    try:
+        assert database.versao_schema(conn) == database.MIGRACOES[-1][0]
+        assert conn.execute("SELECT COUNT(*) FROM usuarios WHERE tipo = 'admin'").fetchone()[0] == 1
+    finally:
+        conn.close()
+        database.get_pool().fechar_todas()
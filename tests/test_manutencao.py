@@ -0,0 +1,65 @@
+import pytest
+
+from database import transacao_escrita
+from manutencao import purgar_pedidos_cancelados, purgar_produtos_inativos
+
+
+def _pedidos(db, status_por_pedido, produto_id=1, quantidade=2):
+    with transacao_escrita(db):
+        for status in status_por_pedido:
+            pedido_id = db.execute(
+                "INSERT INTO pedidos (usuario_id, total, status) VALUES (1, 10, ?)", (status,)
+            ).lastrowid
+            db.execute(
+                'INSERT INTO itens_pedido (pedido_id, produto_id, quantidade, preco_unitario) VALUES (?, ?, ?, 5)',
+                (pedido_id, produto_id, quantidade)
+            )
+
+
+def _estoque(db, produto_id=1):
+    return db.execute('SELECT estoque FROM produtos WHERE id = ?', (produto_id,)).fetchone()[0]
+
+
+@pytest.mark.parametrize('cancelados, lote, esperado', [
+    (7, 3, [3, 6, 7]),
+    (6, 3, [3, 6]),
+    (2, 500, [2]),
+    (0, 3, []),
+])
+def test_purga_de_cancelados_em_lotes(db, cancelados, lote, esperado):
+    _pedidos(db, ['cancelado'] * cancelados + ['entregue'] * 2)
+    estoque = _estoque(db)
+    progresso = []
+
+    total = purgar_pedidos_cancelados(db, lote=lote, progresso=progresso.append)
+
+    assert progresso == esperado
+    assert total == cancelados
+    assert _estoque(db) == estoque + 2 * cancelados
+    assert db.execute("SELECT COUNT(*) FROM pedidos WHERE status = 'cancelado'").fetchone()[0] == 0
+    assert db.execute('SELECT COUNT(*) FROM pedidos').fetchone()[0] == 2
+    assert db.execute('SELECT COUNT(*) FROM itens_pedido').fetchone()[0] == 2
+    # O lock de escrita é liberado entre os lotes
+    assert not db.in_transaction
+
+
+def test_purga_de_produtos_inativos_em_lotes(db):
+    with transacao_escrita(db):
+        inativos = [
+            db.execute(
+                "INSERT INTO produtos (nome, preco, categoria_id, ativo) VALUES (?, 10, 1, 0)", (f'Inativo {i}',)
+            ).lastrowid
+            for i in range(5)
+        ]
+        db.execute('INSERT INTO carrinho (usuario_id, produto_id, quantidade) VALUES (1, ?, 1)', (inativos[0],))
+    # Um inativo com pedido fica
+    _pedidos(db, ['entregue'], produto_id=inativos[-1])
+    progresso = []
+
+    total = purgar_produtos_inativos(db, lote=2, progresso=progresso.append)
+
+    assert total == 4
+    assert progresso == [2, 4]
+    restantes = [row['id'] for row in db.execute('SELECT id FROM produtos WHERE ativo = 0')]
+    assert restantes == [inativos[-1]]
+    assert db.execute('SELECT COUNT(*) FROM carrinho WHERE produto_id = ?', (inativos[0],)).fetchone()[0] == 0
@@ -0,0 +1,47 @@
+import base64
+import json
+
+import pytest
+
+import paginacao
+from paginacao import codificar_cursor, contar, decodificar_cursor, invalidar_contagens, paginar
+
+
+def _cursor(valor):
+    return base64.urlsafe_b64encode(json.dumps(valor).encode()).decode()
+
+
+def test_cursor_ida_e_volta():
+    cursor = codificar_cursor(['2024-01-02 10:00:00', 7])
+    assert decodificar_cursor(cursor, 2) == ['2024-01-02 10:00:00', 7]
+
+
+@pytest.mark.parametrize('valor', [
+    {'a': 1}, 'texto', [[1], 2], [{'a': 1}, 2], [True, 2], ['2024-01-01'], ['a', 1, 2],
+])
+def test_cursor_forjado_e_rejeitado(valor):
+    assert decodificar_cursor(_cursor(valor), 2) is None
+
+
+def test_cursor_invalido_volta_para_a_primeira_pagina(db):
+    primeira = paginar(db, 'SELECT * FROM produtos', ordem=('data_cadastro', 'id'),
+                       chaves=('data_cadastro', 'id'), por_pagina=2)
+    forjada = paginar(db, 'SELECT * FROM produtos', ordem=('data_cadastro', 'id'),
+                      chaves=('data_cadastro', 'id'), cursor=_cursor([[1], {'x': 2}]), por_pagina=2)
+    assert [row['id'] for row in forjada] == [row['id'] for row in primeira]
+
+
+def test_rota_com_cursor_forjado_responde(banco):
+    from app import app
+    resposta = app.test_client().get('/produtos?cursor=' + _cursor([[1], {'x': 2}]))
+    assert resposta.status_code == 200
+
+
+def test_contagens_limitadas(db, monkeypatch):
+    monkeypatch.setattr(paginacao, '_contagens', paginacao.CacheTTL('contagens', max_itens=3, ttl=60))
+    for usuario in range(10):
+        contar(db, f'pedidos:usuario:{usuario}', 'SELECT COUNT(*) FROM pedidos WHERE usuario_id = ?', (usuario,))
+    assert paginacao._contagens.estatisticas()['itens'] == 3
+
+    invalidar_contagens('pedidos:')
+    assert paginacao._contagens.estatisticas()['itens'] == 0
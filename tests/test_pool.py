@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from database import ConexaoPool, PoolConexoes, PoolEsgotado
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = PoolConexoes(str(tmp_path / 'pool.db'), tamanho=2, timeout=0.2)
+    yield pool
+    pool.fechar_todas()
+
+
+def test_close_devolve_ao_pool_e_reaproveita(pool):
+    conn = pool.emprestar()
+    bruta = conn._conn
+    conn.close()
+
+    assert conn.devolvida
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+    outra = pool.emprestar()
+    assert outra._conn is bruta
+    stats = pool.estatisticas()
+    assert (stats['criadas'], stats['emprestimos'], stats['em_uso'], stats['livres']) == (1, 2, 1, 0)
+
+
+def test_conexao_do_request_so_volta_no_devolver(pool):
+    conn = ConexaoPool(pool, pool.emprestar()._conn, do_request=True)
+    conn.close()
+    assert not conn.devolvida
+    conn.devolver()
+    assert conn.devolvida
+
+
+def test_transacao_esquecida_e_desfeita_na_devolucao(pool):
+    conn = pool.emprestar()
+    conn.execute('CREATE TABLE t (x)')
+    conn.commit()
+    conn.execute('INSERT INTO t VALUES (1)')
+    conn.close()
+
+    conn = pool.emprestar()
+    assert not conn.in_transaction
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+
+def test_pool_esgotado_apos_o_timeout(pool):
+    emprestadas = [pool.emprestar(), pool.emprestar()]
+    inicio = time.monotonic()
+    with pytest.raises(PoolEsgotado):
+        pool.emprestar()
+    assert time.monotonic() - inicio >= pool.timeout
+    assert pool.estatisticas()['timeouts'] == 1
+
+    # Uma devolução durante a espera acorda quem aguarda
+    threading.Timer(0.05, emprestadas[0].close).start()
+    pool.timeout = 2
+    pool.emprestar()
+    stats = pool.estatisticas()
+    assert stats['esperas'] == 1
+    assert stats['espera_max'] >= 0.05
+    assert stats['espera_media'] == pytest.approx(stats['espera_total'] / stats['emprestimos'])
+
+
+def test_conexao_velha_e_reciclada(pool):
+    pool.recycle = 0.01
+    conn = pool.emprestar()
+    bruta = conn._conn
+    conn.close()
+    time.sleep(0.02)
+
+    assert pool.emprestar()._conn is not bruta
+    assert pool.estatisticas()['recicladas'] == 1
+
+
+def test_ping_descarta_conexao_quebrada(pool):
+    pool.ping_after = 0
+    conn = pool.emprestar()
+    bruta = conn._conn
+    conn.close()
+    # Conexão ociosa que deixou de funcionar (fechada por fora)
+    bruta.close()
+
+    nova = pool.emprestar()
+    assert nova._conn is not bruta
+    assert nova.execute('SELECT 1').fetchone()[0] == 1
+    stats = pool.estatisticas()
+    assert (stats['descartadas'], stats['criadas']) == (1, 2)
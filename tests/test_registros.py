@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+
+from database import Registro, colunas_data, converter_data
+
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('2024-03-05 14:30:00', datetime(2024, 3, 5, 14, 30)),
+    ('2024-03-05', datetime(2024, 3, 5)),
+    ('05/03/2024 14:30:00', datetime(2024, 3, 5, 14, 30)),
+    ('05/03/2024', datetime(2024, 3, 5)),
+    ('não é data', 'não é data'),
+    (None, None),
+    (42, 42),
+])
+def test_converter_data(texto, esperado):
+    assert converter_data(texto) == esperado
+
+
+def test_so_colunas_de_data_sao_convertidas(db):
+    row = db.execute(
+        "SELECT '2024-01-02 03:04:05' as data_pedido, '2024-01-02' as descricao, 7 as id"
+    ).fetchone()
+    assert row['data_pedido'] == datetime(2024, 1, 2, 3, 4, 5)
+    assert row['descricao'] == '2024-01-02'
+    assert row[2] == 7
+
+
+def test_colunas_de_data_vem_do_tipo_declarado(db):
+    assert {'data_pedido', 'data_cadastro', 'data_avaliacao', 'aplicada_em'} <= colunas_data(db)
+    # vendas_dia.dia é TEXT: continua texto mesmo parecendo data
+    assert 'dia' not in colunas_data(db)
+    row = db.execute("SELECT '2024-01-02' as dia, '2024-01-02' as data_qualquer").fetchone()
+    assert row['dia'] == '2024-01-02'
+    assert row['data_qualquer'] == '2024-01-02'
+
+    versao = db.execute('SELECT versao, aplicada_em FROM schema_version LIMIT 1').fetchone()
+    assert isinstance(versao['aplicada_em'], datetime)
+
+
+def test_registro_com_interface_de_dicionario(db):
+    rows = db.execute('SELECT id, nome, data_cadastro FROM produtos ORDER BY id LIMIT 2').fetchall()
+    primeiro = rows[0]
+
+    assert isinstance(primeiro, Registro)
+    assert list(primeiro.keys()) == ['id', 'nome', 'data_cadastro']
+    assert dict(primeiro.items())['id'] == primeiro['id'] == primeiro[0]
+    assert 'nome' in primeiro and 'preco' not in primeiro
+    assert primeiro.get('preco', 'padrao') == 'padrao'
+    assert isinstance(primeiro['data_cadastro'], datetime)
+    # As linhas do mesmo cursor compartilham o layout (calculado uma vez)
+    assert rows[0]._layout is rows[1]._layout
+
+
+def test_registro_alteravel_por_nome(db):
+    row = db.execute('SELECT 1 as id, 2 as total').fetchone()
+    row['total'] = 5
+    assert row.values() == [1, 5]
+    with pytest.raises(KeyError):
+        row['inexistente']
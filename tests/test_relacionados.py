@@ -0,0 +1,105 @@
+import pytest
+
+import tarefas
+from database import transacao_escrita
+from relacionados import atualizar_relacionados
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    enviadas = []
+
+    class Executor:
+        def submit(self, executar, tarefa_id):
+            enviadas.append((executar, tarefa_id))
+
+    monkeypatch.setattr(tarefas, 'executor_relatorios', Executor)
+    return enviadas
+
+
+def _produtos(db, quantidade=3):
+    with transacao_escrita(db):
+        return [
+            db.execute("INSERT INTO produtos (nome, preco, categoria_id) VALUES (?, 10, 1)", (f'P{i}',)).lastrowid
+            for i in range(quantidade)
+        ]
+
+
+def _pedido(db, produtos):
+    with transacao_escrita(db):
+        pedido_id = db.execute("INSERT INTO pedidos (usuario_id, total, status) VALUES (1, 10, 'pendente')").lastrowid
+        db.executemany(
+            'INSERT INTO itens_pedido (pedido_id, produto_id, quantidade, preco_unitario) VALUES (?, ?, 1, 10)',
+            [(pedido_id, p) for p in produtos]
+        )
+    return pedido_id
+
+
+def _relacionados(db, produto_id):
+    return [row[0] for row in db.execute(
+        'SELECT relacionado_id FROM produtos_relacionados WHERE produto_id = ? ORDER BY pontuacao DESC', (produto_id,)
+    )]
+
+
+def _invalidacoes(db):
+    return db.execute("SELECT invalidacoes FROM indices_estado WHERE nome = 'relacionados'").fetchone()[0]
+
+
+@pytest.mark.parametrize('remover', ['cancelar', 'excluir'])
+def test_pedido_ja_indexado_removido_refaz_o_indice(db, remover):
+    a, b, c = _produtos(db)
+    _pedido(db, [a, b])
+    removido = _pedido(db, [a, c])
+    atualizar_relacionados(db)
+    assert sorted(_relacionados(db, a)) == [b, c]
+
+    with transacao_escrita(db):
+        if remover == 'cancelar':
+            db.execute("UPDATE pedidos SET status = 'cancelado' WHERE id = ?", (removido,))
+        else:
+            db.execute('DELETE FROM itens_pedido WHERE pedido_id = ?', (removido,))
+            db.execute('DELETE FROM pedidos WHERE id = ?', (removido,))
+    assert _invalidacoes(db) == 1
+
+    atualizar_relacionados(db)
+
+    assert _relacionados(db, a) == [b]
+    assert _relacionados(db, c) == []
+    assert _invalidacoes(db) == 0
+
+
+def test_pedido_ainda_nao_indexado_nao_invalida(db):
+    a, b, _ = _produtos(db)
+    _pedido(db, [a, b])
+    atualizar_relacionados(db)
+    novo = _pedido(db, [a, b])
+
+    with transacao_escrita(db):
+        db.execute("UPDATE pedidos SET status = 'cancelado' WHERE id = ?", (novo,))
+        db.execute("UPDATE pedidos SET status = 'enviado' WHERE id < ?", (novo,))
+
+    assert _invalidacoes(db) == 0
+
+
+def test_agendamento_coalescido_e_limitado_pelo_intervalo(db, executor, monkeypatch):
+    a, b, _ = _produtos(db)
+    _pedido(db, [a, b])
+
+    tarefa_id = tarefas.agendar_relacionados(db)
+    # Pedido repetido enquanto a tarefa está na fila se junta a ela
+    assert tarefas.agendar_relacionados(db) == tarefa_id
+    assert len(executor) == 1
+
+    executar, _ = executor[0]
+    executar(tarefa_id)
+    assert tarefas.obter_tarefa(db, tarefa_id)['status'] == 'concluido'
+    assert _relacionados(db, a) == [b]
+
+    # Índice em dia, ou atualizado há pouco: nada a agendar
+    assert tarefas.agendar_relacionados(db) is None
+    _pedido(db, [a, b])
+    assert tarefas.agendar_relacionados(db) is None
+    monkeypatch.setattr(tarefas, 'RELACIONADOS_INTERVALO', 0)
+    assert tarefas.agendar_relacionados(db) not in (None, tarefa_id)
+    # A lista de relatórios não mostra as tarefas do índice
+    assert tarefas.listar_tarefas(db) == []
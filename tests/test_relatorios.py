@@ -0,0 +1,154 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+from openpyxl import load_workbook
+from reportlab.platypus import Paragraph, Table
+
+from database import transacao_escrita
+import relatorios
+from relatorios import (
+    CONSULTAS_EXPORTACAO, CONSULTAS_RELATORIO, calcular_col_widths, exportar_csv, exportar_ndjson,
+    gerar_excel_clientes, gerar_excel_pedidos, gerar_excel_produtos, gerar_pdf_pedidos
+)
+
+PEDIDOS = 150
+
+
+@pytest.fixture
+def dados(db):
+    with transacao_escrita(db):
+        usuario_id = db.execute(
+            "INSERT INTO usuarios (nome, email, senha, telefone) VALUES ('Ana', 'ana@teste', 'x', NULL)"
+        ).lastrowid
+        db.executemany(
+            "INSERT INTO pedidos (usuario_id, total, status, endereco_entrega, data_pedido) "
+            "VALUES (?, ?, 'pendente', 'Rua, 1', datetime('now'))",
+            [(usuario_id, 10 + i) for i in range(PEDIDOS)]
+        )
+    return db
+
+
+def _contagem(db, entidade):
+    return db.execute(f'SELECT COUNT(*) FROM ({CONSULTAS_RELATORIO[entidade]})').fetchone()[0]
+
+
+@pytest.mark.parametrize('entidade, gerar', [
+    ('produtos', gerar_excel_produtos),
+    ('pedidos', gerar_excel_pedidos),
+    ('clientes', gerar_excel_clientes),
+])
+def test_excel_tem_uma_linha_por_registro(dados, entidade, gerar):
+    # O gerador recebe o cursor direto, sem materializar as linhas
+    arquivo = gerar(dados.execute(CONSULTAS_RELATORIO[entidade]))
+
+    planilha = load_workbook(arquivo, read_only=True).active
+    linhas = list(planilha.iter_rows(values_only=True))
+    assert len(linhas) == _contagem(dados, entidade) + 1
+    assert linhas[0][0] == 'ID'
+
+
+def test_excel_de_pedidos_formata_valores(dados):
+    arquivo = gerar_excel_pedidos(dados.execute(CONSULTAS_RELATORIO['pedidos']))
+    linhas = list(load_workbook(arquivo, read_only=True).active.iter_rows(values_only=True))
+    assert len(linhas) == PEDIDOS + 1
+    assert {linha[4] for linha in linhas[1:]} == {'PENDENTE'}
+    assert all(linha[3].startswith('R$ ') for linha in linhas[1:])
+
+
+@pytest.mark.parametrize('entidade', sorted(CONSULTAS_EXPORTACAO))
+def test_csv_gzip_tem_uma_linha_por_registro(dados, entidade, monkeypatch):
+    # Blocos pequenos: o CSV sai em vários pedaços, todos no mesmo fluxo gzip
+    monkeypatch.setattr(relatorios, 'TAMANHO_BLOCO', 256)
+    blocos = list(exportar_csv(dados.execute(CONSULTAS_EXPORTACAO[entidade])))
+
+    linhas = list(csv.reader(io.StringIO(gzip.decompress(b''.join(blocos)).decode('utf-8'))))
+    total = dados.execute(f'SELECT COUNT(*) FROM ({CONSULTAS_EXPORTACAO[entidade]})').fetchone()[0]
+    assert len(linhas) == total + 1
+    assert linhas[0][0] == 'id'
+    # Sem compactação cada bloco aparece na saída assim que fica cheio
+    if entidade == 'pedidos':
+        assert len(list(exportar_csv(dados.execute(CONSULTAS_EXPORTACAO[entidade]), compactar=False))) > 1
+
+
+@pytest.mark.parametrize('entidade', sorted(CONSULTAS_EXPORTACAO))
+def test_ndjson_tem_um_objeto_por_registro(dados, entidade, monkeypatch):
+    monkeypatch.setattr(relatorios, 'TAMANHO_BLOCO', 256)
+    texto = b''.join(exportar_ndjson(dados.execute(CONSULTAS_EXPORTACAO[entidade]))).decode('utf-8')
+
+    registros = [json.loads(linha) for linha in texto.splitlines()]
+    total = dados.execute(f'SELECT COUNT(*) FROM ({CONSULTAS_EXPORTACAO[entidade]})').fetchone()[0]
+    assert len(registros) == total
+    assert texto.endswith('\n')
+    assert all(isinstance(r['id'], int) for r in registros)
+
+
+LARGURA_UTIL = relatorios.A4[0] - 72
+
+
+def test_larguras_ocupam_a_largura_util_e_seguem_o_conteudo():
+    linhas = [('ID', 'Descrição', 'Qtd')] + [(i, 'Camiseta de algodão orgânico tamanho G', 3) for i in range(50)]
+    larguras = calcular_col_widths(linhas)
+
+    assert sum(larguras) == pytest.approx(LARGURA_UTIL)
+    assert larguras[1] > larguras[0] and larguras[1] > larguras[2]
+    assert min(larguras) >= 30
+    assert calcular_col_widths([]) == []
+
+
+def test_larguras_ignoram_celulas_excepcionalmente_longas():
+    comum = [('ID', 'Nome', 'Obs')] + [(i, 'Maria Silva', 'ok') for i in range(100)]
+    com_excecao = comum + [(999, 'Maria Silva', 'x' * 400)]
+    # Uma única observação enorme está acima do percentil e não alarga a coluna
+    assert calcular_col_widths(com_excecao) == pytest.approx(calcular_col_widths(comum))
+
+
+def test_colunas_estreitas_ficam_no_minimo():
+    linhas = [('a', 'b', 'c')] + [('x', 'y' * 200, 'z' * 200)] * 10
+    larguras = calcular_col_widths(linhas, min_col=40, max_col=2000)
+
+    assert larguras[0] == 40
+    assert sum(larguras) == pytest.approx(LARGURA_UTIL)
+
+
+def test_larguras_em_cache_por_tipo_de_relatorio(monkeypatch):
+    monkeypatch.setattr(relatorios, '_cache_larguras', {})
+    curtas = [('ID', 'Nome')] + [(1, 'Ana')] * 5
+    longas = [('ID', 'Nome')] + [(1, 'Ana Beatriz de Souza Albuquerque')] * 5
+
+    primeira = calcular_col_widths(curtas, chave='clientes')
+    # Mesma chave: reaproveita o cálculo anterior mesmo com outras linhas
+    assert calcular_col_widths(longas, chave='clientes') == primeira
+    assert calcular_col_widths(longas) != primeira
+
+    monkeypatch.setattr(relatorios, 'LARGURAS_TTL', 0)
+    relatorios._cache_larguras.clear()
+    calcular_col_widths(curtas, chave='clientes')
+    assert calcular_col_widths(longas, chave='clientes') != primeira
+
+
+def test_pdf_monta_as_tabelas_sob_demanda(dados, monkeypatch):
+    vistos = {'buffer': 0, 'tabelas': 0, 'textos': []}
+
+    class Registrando(relatorios._FlowablesSobDemanda):
+        def _abastecer(self):
+            super()._abastecer()
+            vistos['buffer'] = max(vistos['buffer'], list.__len__(self))
+
+        def append(self, flowable):
+            vistos['tabelas'] += isinstance(flowable, Table)
+            if isinstance(flowable, Paragraph):
+                vistos['textos'].append(flowable.getPlainText())
+            super().append(flowable)
+
+    monkeypatch.setattr(relatorios, '_FlowablesSobDemanda', Registrando)
+    arquivo = gerar_pdf_pedidos(dados.execute(CONSULTAS_RELATORIO['pedidos']))
+
+    assert arquivo.read(5) == b'%PDF-'
+    assert vistos['tabelas'] == -(-PEDIDOS // relatorios.LINHAS_POR_TABELA)
+    # O build nunca tem mais que alguns flowables montados ao mesmo tempo
+    assert vistos['buffer'] <= Registrando.BUFFER
+    faturamento = sum(10 + i for i in range(PEDIDOS))
+    assert vistos['textos'][-2:] == [f'Total de pedidos: {PEDIDOS}', f'Faturamento total: R$ {faturamento:.2f}']
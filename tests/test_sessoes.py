@@ -0,0 +1,27 @@
+import pytest
+from flask import Flask
+
+import database
+import sessoes
+
+
+def test_backend_sqlite_sem_tabela_falha_na_subida(tmp_path, monkeypatch):
+    # Banco existente mas ainda não migrado
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'vazio.db'))
+    monkeypatch.setattr(database, '_pool', None)
+    app = Flask(__name__)
+    try:
+        with pytest.raises(RuntimeError, match='sessoes'):
+            sessoes.init_app(app, backend='sqlite')
+        assert not isinstance(app.session_interface, sessoes.InterfaceSessaoServidor)
+    finally:
+        database.get_pool().fechar_todas()
+
+
+def test_backend_sqlite_com_banco_migrado(banco):
+    app = Flask(__name__)
+    armazenamento = sessoes.init_app(app, backend='sqlite')
+
+    armazenamento.gravar('s' * 43, '{"user_id": 1}', 2 ** 40)
+    assert armazenamento.carregar('s' * 43) == ('{"user_id": 1}', 2 ** 40)
+    assert isinstance(app.session_interface, sessoes.InterfaceSessaoServidor)
@@ -0,0 +1,93 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import relatorios
+import tarefas
+from database import transacao_escrita
+
+
+@pytest.fixture
+def pid_morto():
+    processo = subprocess.Popen([sys.executable, '-c', 'pass'])
+    processo.wait()
+    return processo.pid
+
+
+def _tarefa(db, processo, status='executando', atraso=0, formato='pdf'):
+    parametros = {'entidade': 'pedidos', 'formato': formato}
+    with transacao_escrita(db):
+        return db.execute('''
+            INSERT INTO tarefas (tipo, parametros, chave, status, processo, data_atualizacao)
+            VALUES ('relatorio', ?, ?, ?, ?, datetime('now', ?))
+        ''', (json.dumps(parametros), tarefas._chave('relatorio', parametros), status, processo,
+              f'-{atraso} seconds')).lastrowid
+
+
+def _status(db, tarefa_id):
+    return db.execute('SELECT status FROM tarefas WHERE id = ?', (tarefa_id,)).fetchone()[0]
+
+
+def test_pedido_repetido_nao_espera_tarefa_de_processo_morto(db, pid_morto, monkeypatch):
+    class Executor:
+        def submit(self, *args):
+            pass
+
+    monkeypatch.setattr(tarefas, 'executor_relatorios', Executor)
+    orfa = _tarefa(db, f'{socket.gethostname()}:{pid_morto}')
+
+    tarefa_id, nova = tarefas.enfileirar_relatorio(db, 'pedidos', 'pdf')
+
+    assert nova and tarefa_id != orfa
+    assert _status(db, orfa) == 'erro'
+    # Enquanto o dono está vivo, o pedido repetido se junta à tarefa
+    assert tarefas.enfileirar_relatorio(db, 'pedidos', 'pdf') == (tarefa_id, False)
+
+
+def test_subida_encerra_tarefas_orfas(db, pid_morto):
+    host = socket.gethostname()
+    herdada = _tarefa(db, f'{host}:{os.getpid()}', status='pendente', formato='a')
+    morta = _tarefa(db, f'{host}:{pid_morto}', formato='b')
+    viva = _tarefa(db, f'{host}:{os.getppid()}', formato='c')
+    remota = _tarefa(db, 'outra-maquina:1', formato='d')
+    sem_pulso = _tarefa(db, 'outra-maquina:2', atraso=tarefas.TAREFA_TIMEOUT + 60, formato='e')
+
+    tarefas.init_app(None)
+
+    assert [_status(db, t) for t in (herdada, morta, viva, remota, sem_pulso)] == \
+        ['erro', 'erro', 'executando', 'executando', 'erro']
+
+
+def test_tarefa_na_fila_alem_do_timeout_ainda_roda(db, tmp_path, monkeypatch):
+    # Na fila atrás de relatórios longos: sem pulso até ser reservada
+    monkeypatch.setattr(relatorios, 'RELATORIOS_DIR', str(tmp_path))
+    na_fila = _tarefa(db, tarefas._processo(), status='pendente', atraso=tarefas.TAREFA_TIMEOUT + 60,
+                      formato='excel')
+    travada = _tarefa(db, tarefas._processo(), atraso=tarefas.TAREFA_TIMEOUT + 60, formato='pdf')
+
+    with transacao_escrita(db):
+        assert tarefas._expirar_abandonadas(db) == 1
+    assert [_status(db, t) for t in (na_fila, travada)] == ['pendente', 'erro']
+
+    assert tarefas.executar_relatorio(na_fila) is not None
+    assert _status(db, na_fila) == 'concluido'
+
+
+def test_pulso_renova_a_tarefa(db, monkeypatch):
+    monkeypatch.setattr(tarefas, 'TAREFA_PULSO', 0.05)
+    tarefa_id = _tarefa(db, None, atraso=3600)
+    parar = threading.Event()
+    pulso = threading.Thread(target=tarefas._pulsar, args=(tarefa_id, parar))
+    pulso.start()
+    threading.Timer(0.3, parar.set).start()
+    pulso.join()
+
+    atraso = db.execute(
+        "SELECT strftime('%s', 'now') - strftime('%s', data_atualizacao) FROM tarefas WHERE id = ?", (tarefa_id,)
+    ).fetchone()[0]
+    assert atraso < 5